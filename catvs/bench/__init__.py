@@ -0,0 +1,7 @@
+"""Performance scenarios
+
+Scenario modules are named bench_*.py so that they are not picked up
+along with the conformance tests.  Run with eg.
+
+  DUT=... python -m unittest discover -p 'bench_*.py' catvs.bench
+"""
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os, socket
+from struct import pack
+from ..util import Msg, PVSet, ACF
+from .common import BenchClient, now, cstr
+
+_log = logging.getLogger(__name__)
+
+# ACCESS_RIGHTS bits
+READ = 1
+WRITE = 2
+
+class TestAccessRights(BenchClient, unittest.TestCase):
+    '''Cost of access security evaluation, with a large ACF.
+
+    Most PVs are placed in ASGs with many rules, where only the last
+    grants this client WRITE.  One in (nasg+1) PVs is left in DEFAULT
+    as a baseline.  Channels are created to each PV several times over.
+
+    Create latency is compared between DEFAULT and ASG channels.
+    Then the rights of every ASG channel are flipped, by changing the
+    'gate' PV used in the rules, or by changing our HOST_NAME.
+    Each flip is timed until the ACCESS_RIGHTS of the last channel arrives.
+
+    A DUT which does not implement access security (eg. PCAS) is skipped
+    when no rights change.
+    '''
+    nasg = 4
+    acf = ACF(nasg=nasg, nrule=100, ngroup=50, nmember=20,
+              users=[BenchClient.user.decode()], hosts=[BenchClient.host.decode()], gate='ival')
+    pvs = PVSet(500, pattern='acf:%d', fields=[{'ASG':A} for A in acf.asgs()]+[{}])
+    nchan = 2000
+    rounds = 5 # of each flip
+    timeout = 5.0
+
+    def openChans(self):
+        '''Create nchan channels, round robin over PVs, then one to the gate PV.
+        Sets self.rights, cid -> last ACCESS_RIGHTS, self.asg, the cids of ASG channels,
+        and self.gate, the sid of the gate channel.
+        Returns createChannels() result for the nchan channels.
+        '''
+        self.openCircuit()
+        names = self.pvs.names()
+        self.rights, self.asg = {}, set()
+        for i in range(self.nchan):
+            if (i%len(names))%(self.nasg+1)!=self.nasg:
+                self.asg.add(1+i)
+
+        def match(M):
+            if M.cmd==22:
+                self.rights[M.p1] = M.p2
+            elif M.cmd in (18, 26):
+                return M.p1
+            elif M.cmd==11:
+                raise RuntimeError("Error during channel create %s"%M)
+        names = [names[i%len(names)] for i in range(self.nchan)]+[self.acf.gate]
+        done = self.pipelineTCP([(1+i, Msg(cmd=18, p1=1+i, p2=13, body=cstr(name)))
+                                 for i, name in enumerate(names)], match)
+        for cid, (_T0, _T1, rep) in done.items():
+            self.assertCAEqual(rep, cmd=18, p1=cid)
+        self.gate = done.pop(len(names))[2].p2
+        return done
+
+    def awaitRights(self, expect, T0):
+        '''Receive until every ASG channel has 'expect' rights.
+        Returns a list of arrival times (from T0) of the changes.
+        '''
+        pending = set([C for C in self.asg if self.rights.get(C)!=expect])
+        arrive = []
+        while pending:
+            try:
+                rep = self.recvTCP()
+            except socket.timeout:
+                if not arrive:
+                    self.skipTest("DUT did not change access rights")
+                self.fail("%d of %d channels did not change to rights %d"%(
+                          len(pending), len(pending)+len(arrive), expect))
+            self.assertIsNotNone(rep)
+            if rep.cmd==22:
+                self.rights[rep.p1] = rep.p2
+                if rep.p2==expect and rep.p1 in pending:
+                    pending.remove(rep.p1)
+                    arrive.append(now()-T0)
+            elif rep.cmd==11:
+                self.fail("Error %s"%rep)
+            # ignore WRITE_NOTIFY and ECHO replies
+        return arrive
+
+    def test_create(self):
+        'Create latency of channels in DEFAULT and rule heavy ASGs'
+        T0 = now()
+        done = self.openChans()
+        T1 = now()
+        self.report('create_rate', value=len(done)/(T1-T0), unit='chan/s')
+
+        extra = {'nrule':self.acf.nrule, 'ngroup':self.acf.ngroup, 'nmember':self.acf.nmember}
+        for case, cids in (('DEFAULT', set(done)-self.asg), ('ASG', self.asg)):
+            self.report('create_latency', samples=[done[C][1]-done[C][0] for C in cids], unit='s',
+                        case=case, **extra)
+        for C in set(done)-self.asg:
+            self.assertEqual(self.rights.get(C), READ|WRITE)
+
+    def flip(self, name, revoke, grant):
+        '''Alternate revoke and grant of WRITE to all ASG channels,
+        by sending the revoke and grant messages.
+        '''
+        # access security INP links may connect after the channels were created
+        self.awaitRights(READ|WRITE, now())
+
+        times, lats, cpus = {}, {}, {}
+        for i in range(self.rounds):
+            for case, msg, expect in (('revoke', revoke, READ), ('grant', grant, READ|WRITE)):
+                cpu0, T0 = self.dutStats()['cpu'], now()
+                self.sendTCP(msg)
+                arrive = self.awaitRights(expect, T0)
+                cpus.setdefault(case, []).append(self.dutStats()['cpu']-cpu0)
+                times.setdefault(case, []).append(arrive[-1])
+                lats.setdefault(case, []).extend(arrive)
+
+        extra = {'trigger':name, 'nchan':len(self.asg), 'nrule':self.acf.nrule}
+        for case in ('revoke', 'grant'):
+            T = self.report('fanout_time', samples=times[case], unit='s', case=case, **extra)
+            self.report('fanout_rate', value=len(self.asg)/T['p50'], unit='chan/s', case=case, **extra)
+            self.report('fanout_latency', samples=lats[case], unit='s', case=case, **extra)
+            self.report('dut_cpu', value=sum(cpus[case])/len(cpus[case]), unit='s', case=case, **extra)
+
+    def test_rule_change(self):
+        'ACCESS_RIGHTS fan-out when a rule input changes'
+        self.openChans()
+        def put(val):
+            return [Msg(cmd=19, dtype=5, dcnt=1, p1=self.gate, p2=val, body=pack('!i', val))]
+        self.flip('gate', put(0), put(1))
+
+    def test_host_change(self):
+        'ACCESS_RIGHTS fan-out when the client HOST_NAME changes'
+        self.openChans()
+        self.flip('host', [Msg(cmd=21, body=cstr(b'nosuchhost'))], [Msg(cmd=21, body=cstr(self.host))])
+
+class TestAccessRightsFew(TestAccessRights):
+    'As TestAccessRights, with one rule per ASG as a baseline'
+    acf = ACF(nasg=TestAccessRights.nasg, nrule=1, ngroup=1, nmember=1,
+              users=[BenchClient.user.decode()], hosts=[BenchClient.host.decode()], gate='ival')
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os
+from struct import pack
+from ..util import Msg, PVSet
+from ..dbr import decode, dbrname, dbrclass
+from .common import BenchClient, now
+
+_log = logging.getLogger(__name__)
+
+class TestDBRThroughput(BenchClient, unittest.TestCase):
+    '''Get and monitor throughput for each class of DBR type.
+
+    Quantifies the server side cost of converting to STS, TIME, GR, and CTRL
+    compared with plain types.
+    '''
+    pvs = PVSet(2, pattern='dbr:%d', types=('DOUBLE',), nelm=(1, 1024))
+    bases = (5, 6) # LONG and DOUBLE
+    nget = 2000
+    nput = 1000
+    window = 64
+
+    def dtypes(self):
+        for cls in range(5):
+            for base in self.bases:
+                yield cls*7+base
+
+    def openChans(self):
+        self.openCircuit()
+        done = self.createChannels(self.pvs.names())
+        self.chans = [rep for _T0, _T1, rep in sorted(done.values(), key=lambda E:E[2].p1)]
+        for rep in self.chans:
+            self.assertCAEqual(rep, cmd=18, dtype=6)
+
+    def test_get(self):
+        'READ_NOTIFY rate for each DBR type'
+        self.openChans()
+        for C in self.chans:
+            for dtype in self.dtypes():
+                with self.subTest(dbr=dbrname(dtype), dcnt=C.dcnt):
+                    reqs = [(ioid, Msg(cmd=15, dtype=dtype, dcnt=C.dcnt, p1=C.p2, p2=ioid))
+                            for ioid in range(self.nget)]
+                    T0 = now()
+                    done = self.pipelineTCP(reqs, lambda M:M.p2 if M.cmd==15 else None,
+                                            window=self.window)
+                    T1 = now()
+
+                    nbytes = sum([rep.size for _T0, _T1, rep in done.values()])
+                    for _T0, _T1, rep in done.values():
+                        self.assertCAEqual(rep, p1=1)
+                    case = '%s[%d]'%(dbrname(dtype), C.dcnt)
+                    self.report('get_rate', value=len(done)/(T1-T0), unit='get/s', case=case,
+                                dbr=dbrname(dtype), dbrclass=dbrclass(dtype), dcnt=C.dcnt)
+                    self.report('get_bandwidth', value=nbytes/(T1-T0), unit='B/s', case=case,
+                                dbr=dbrname(dtype), dbrclass=dbrclass(dtype), dcnt=C.dcnt)
+
+    def test_monitor(self):
+        'Subscription update rate for each DBR type'
+        self.openChans()
+        for C in self.chans:
+            for dtype in self.dtypes():
+                with self.subTest(dbr=dbrname(dtype), dcnt=C.dcnt):
+                    self._monitor(C, dtype)
+
+    def _monitor(self, C, dtype):
+        ioid = 1000+dtype
+        self.sendTCP([
+            Msg(cmd=1, dtype=dtype, dcnt=C.dcnt, p1=C.p2, p2=ioid,
+                body=Msg._sub_body.pack(0.0, 0.0, 0.0, 1)), # DBE_VALUE
+        ])
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=1, p1=1, p2=ioid) # initial update
+
+        # a ramp of puts.  The server may coalesce updates.
+        # Sent in windows, each followed by an ECHO, so that neither
+        # side blocks sending while the other is not reading.
+        nupdate = nbytes = 0
+        last = False
+        def update(rep):
+            self.assertCAEqual(rep, cmd=1, p1=1, p2=ioid)
+            return rep.size, decode(dtype, 1, rep.body).value[0]==self.nput
+
+        T0 = now()
+        for i in range(1, self.nput+1, self.window):
+            self.sendTCP([
+                Msg(cmd=4, dtype=6, dcnt=C.dcnt, p1=C.p2, p2=j,
+                    body=pack('!%dd'%C.dcnt, *[float(j)]*C.dcnt))
+                for j in range(i, min(i+self.window, self.nput+1))
+            ]+[Msg(cmd=23)])
+            while True:
+                rep = self.recvTCP()
+                if rep.cmd==23:
+                    break
+                N, last = update(rep)
+                nupdate, nbytes = nupdate+1, nbytes+N
+        while not last:
+            N, last = update(self.recvTCP())
+            nupdate, nbytes = nupdate+1, nbytes+N
+        T1 = now()
+
+        self.sendTCP([
+            Msg(cmd=2, dtype=dtype, dcnt=C.dcnt, p1=C.p2, p2=ioid),
+        ])
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=1, p2=ioid, size=0)
+
+        case = '%s[%d]'%(dbrname(dtype), C.dcnt)
+        self.report('monitor_rate', value=nupdate/(T1-T0), unit='update/s', case=case,
+                    dbr=dbrname(dtype), dbrclass=dbrclass(dtype), dcnt=C.dcnt,
+                    coalesced=1.0-nupdate/float(self.nput))
+        self.report('monitor_bandwidth', value=nbytes/(T1-T0), unit='B/s', case=case,
+                    dbr=dbrname(dtype), dbrclass=dbrclass(dtype), dcnt=C.dcnt)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
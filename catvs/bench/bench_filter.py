@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os
+from struct import pack
+from ..util import Msg, PVSet
+from ..dbr import decode
+from .common import BenchClient, now
+
+_log = logging.getLogger(__name__)
+
+# DBE_* event mask bits
+DBE_VALUE = 1
+DBE_LOG = 2
+DBE_ALARM = 4
+DBE_PROPERTY = 8
+
+_maskname = {
+    DBE_VALUE:'VALUE',
+    DBE_LOG:'LOG',
+    DBE_ALARM:'ALARM',
+    DBE_PROPERTY:'PROPERTY',
+}
+
+def maskname(mask):
+    'eg. 5 -> "VALUE|ALARM"'
+    return '|'.join([N for B, N in sorted(_maskname.items()) if mask&B]) or 'NONE'
+
+class TestMonitorFilter(BenchClient, unittest.TestCase):
+    '''Subscription event masks against records with deadbands.
+
+    A DOUBLE is ramped through MDEL, ADEL, and a HIHI alarm limit,
+    with subscriptions using each event mask.  The second PV has no
+    deadband or alarm limit as a baseline.
+
+    Each put is followed by an ECHO round trip, so the ramp rate is
+    limited by the server.  Updates are counted, and the latency of each
+    is measured from the put of the value it carries.  A server which
+    filters events before they are queued delivers fewer updates, sooner.
+    Fails unless the number of updates is that which a record would post.
+    '''
+    step = 0.5
+    nput = 200 # ramp from step to nput*step
+    mdel, adel, hihi = 1.0, 5.0, 50.0
+    pvs = PVSet(2, pattern='filter:%d', types=('DOUBLE',), fields=[
+        {'MDEL':mdel, 'ADEL':adel, 'HIHI':hihi, 'HHSV':'MAJOR'},
+        {},
+    ])
+    masks = (
+        DBE_VALUE,
+        DBE_LOG,
+        DBE_ALARM,
+        DBE_PROPERTY,
+        DBE_VALUE|DBE_ALARM,
+        DBE_VALUE|DBE_LOG|DBE_ALARM,
+    )
+
+    def expected(self, mask, filtered=True):
+        'Number of updates from a ramp which a record would post'
+        if not filtered:
+            return self.nput if mask&(DBE_VALUE|DBE_LOG) else 0
+        N, mlst, alst = 0, 0.0, 0.0
+        for i in range(1, self.nput+1):
+            V, post = i*self.step, 0
+            if abs(V-mlst)>self.mdel:
+                post, mlst = post|DBE_VALUE, V
+            if abs(V-alst)>self.adel:
+                post, alst = post|DBE_LOG, V
+            if V>=self.hihi and (V-self.step)<self.hihi:
+                post |= DBE_ALARM
+            if post&mask:
+                N += 1
+        return N
+
+    def openChans(self):
+        self.openCircuit()
+        done = self.createChannels(self.pvs.names())
+        self.chans = [rep for _T0, _T1, rep in sorted(done.values(), key=lambda E:E[2].p1)]
+        for rep in self.chans:
+            self.assertCAEqual(rep, cmd=18, dtype=6, dcnt=1)
+
+    def test_ramp(self):
+        'Update count and latency of each event mask'
+        self.openChans()
+        for C, filtered in zip(self.chans, (True, False)):
+            for mask in self.masks:
+                with self.subTest(mask=maskname(mask), filtered=filtered):
+                    self._ramp(C, mask, filtered)
+
+    def _ramp(self, C, mask, filtered):
+        # reset below the alarm limit, and beyond the deadbands from the ramp
+        self.sendTCP([
+            Msg(cmd=19, dtype=6, dcnt=1, p1=C.p2, p2=0, body=pack('!d', 0.0)),
+        ])
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=19, p1=1, p2=0)
+
+        ioid = 100+mask
+        self.sendTCP([
+            Msg(cmd=1, dtype=13, dcnt=1, p1=C.p2, p2=ioid, # DBR_STS_DOUBLE
+                body=Msg._sub_body.pack(0.0, 0.0, 0.0, mask)),
+        ])
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=1, p1=1, p2=ioid) # initial update
+
+        sent, latency, alarms = {}, [], [0]
+        def update(rep):
+            self.assertCAEqual(rep, cmd=1, p1=1, p2=ioid)
+            val = decode(13, 1, rep.body)
+            latency.append(now()-sent[val.value[0]])
+            alarms[0] += val.severity!=0
+
+        T0 = now()
+        for i in range(1, self.nput+1):
+            V = i*self.step
+            sent[V] = now()
+            self.sendTCP([
+                Msg(cmd=4, dtype=6, dcnt=1, p1=C.p2, p2=i, body=pack('!d', V)),
+                Msg(cmd=23),
+            ])
+            while True:
+                rep = self.recvTCP()
+                if rep.cmd==23:
+                    break
+                update(rep)
+        T1 = now()
+
+        self.sendTCP([
+            Msg(cmd=2, dtype=13, dcnt=1, p1=C.p2, p2=ioid),
+        ])
+        while True:
+            rep = self.recvTCP()
+            if rep.cmd==1 and rep.size==0:
+                break # cancel confirmed
+            update(rep)
+
+        # the reset put completes before subscribing, so its alarm transition is not seen
+        N, expect = len(latency), self.expected(mask, filtered)
+        self.assertEqual(N, expect, "%s updates, a record would post %d"%(N, expect))
+
+        extra = {'mask':maskname(mask), 'filtered':filtered,
+                 'case':maskname(mask)+('' if filtered else ' unfiltered')}
+        self.report('updates', value=N, unit='update', expected=expect, alarms=alarms[0], **extra)
+        self.report('reduction', value=1.0-N/float(self.nput), unit='ratio', **extra)
+        self.report('ramp_rate', value=self.nput/(T1-T0), unit='put/s', **extra)
+        if latency:
+            self.report('update_latency', samples=latency, unit='s', **extra)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os
+from struct import pack
+from ..util import Msg, MsgParser, TestMixinClient
+from .common import BenchReport, MockPeer, now
+
+_log = logging.getLogger(__name__)
+
+def _read_notify(N):
+    'Replies to READ_NOTIFY of a LONG scalar'
+    return [Msg(cmd=15, dtype=5, dcnt=1, p1=1, p2=i, body=pack('!i', i)) for i in range(N)]
+
+def _monitor(N, dcnt):
+    'Subscription updates of a DOUBLE array'
+    body = pack('!%dd'%dcnt, *range(dcnt))
+    return [Msg(cmd=1, dtype=6, dcnt=dcnt, p1=1, p2=42, body=body) for i in range(N)]
+
+def _extended(N, dcnt):
+    'Subscription updates of a DOUBLE array large enough to need the extended header'
+    body = pack('!%dd'%dcnt, *range(dcnt))
+    H = Msg._head.pack(1, 0xffff, 6, 0, 1, 42)+Msg._head_ext.pack(len(body), dcnt)
+    return [H+body]*N
+
+# MsgParser.next(), MsgParser.view(), MsgParser.tally()
+_modes = ('next', 'view', 'tally')
+
+class TestHarness(BenchReport, TestMixinClient, unittest.TestCase):
+    '''Throughput of the harness send and receive paths, and the parser.
+
+    Uses MockPeer, which streams canned messages at whatever rate
+    the harness can consume, so no DUT is needed.  'minrate' is a floor
+    (msg/s) for each case to catch gross regressions in the hot loops.
+
+    Receiving is compared with full decoding (Msg), lazy decoding
+    (MsgView), and only counting.
+    '''
+    dut = 'mock'
+    minrate = 10000
+
+    def stream(self, case, blob, nmsg, repeat, mode='next'):
+        '''Receive blob (of nmsg messages) repeat times through recvTCP(),
+        with mode 'next' (Msg), 'view' (MsgView), or 'tally' (countTCP)
+        '''
+        P = MockPeer(blob, repeat, sockprof=self.sockprof)
+        self.addCleanup(P.close)
+        self.sess = P.client
+        self.rx = MsgParser()
+        self.lazy = mode=='view'
+
+        N, T0 = 0, now()
+        if mode=='tally':
+            N = self.countTCP({}, nmsg*repeat)
+        else:
+            while self.recvTCP() is not None:
+                N += 1
+        T1 = now()
+        self.sess = None
+
+        self.assertEqual(N, nmsg*repeat)
+        if mode!='next':
+            case = '%s %s'%(case, mode)
+        R = self.report('recv_rate', value=N/(T1-T0), unit='msg/s', case=case)
+        self.report('recv_bandwidth', value=len(blob)*repeat/(T1-T0), unit='B/s', case=case)
+        self.assertGreater(R['value'], self.minrate)
+
+    def test_recv_read_notify(self):
+        'Small replies'
+        msg = _read_notify(1000)
+        for mode in _modes:
+            with self.subTest(mode=mode):
+                self.stream('read_notify', b''.join([M.pack() for M in msg]), len(msg), 200, mode)
+
+    def test_recv_monitor_array(self):
+        'Array updates'
+        msg = _monitor(100, 1024)
+        for mode in _modes:
+            with self.subTest(mode=mode):
+                self.stream('monitor[1024]', b''.join([M.pack() for M in msg]), len(msg), 50, mode)
+
+    def test_recv_extended(self):
+        'Large array updates w/ extended header'
+        msg = _extended(4, 100000)
+        self.minrate = 100 # these are 800KB each
+        for mode in _modes:
+            with self.subTest(mode=mode):
+                self.stream('extended[100000]', b''.join(msg), len(msg), 25, mode)
+
+    def test_parser(self):
+        'MsgParser alone, fed in chunks of different sizes'
+        blob = b''.join([M.pack() for M in _read_notify(1000)])*100
+        for size in (1024, 16384, 65536):
+            chunks = [blob[i:i+size] for i in range(0, len(blob), size)]
+            for mode in _modes:
+                with self.subTest(chunk=size, mode=mode):
+                    P = MsgParser()
+                    N, T0 = 0, now()
+                    if mode=='tally':
+                        counts = {}
+                        for B in chunks:
+                            P.feed(B)
+                            N += P.tally(counts)
+                    else:
+                        parse = P.view if mode=='view' else P.next
+                        for B in chunks:
+                            P.feed(B)
+                            while parse() is not None:
+                                N += 1
+                    T1 = now()
+                    self.assertEqual(N, 100000)
+                    case = 'chunk=%d'%size + ('' if mode=='next' else ' '+mode)
+                    R = self.report('parse_rate', value=N/(T1-T0), unit='msg/s', case=case)
+                    self.report('parse_bandwidth', value=len(blob)/(T1-T0), unit='B/s', case=case)
+                    self.assertGreater(R['value'], self.minrate)
+
+    def test_send(self):
+        'Build and send batches of requests'
+        P = MockPeer(b'', sockprof=self.sockprof)
+        self.addCleanup(P.close)
+        self.sess = P.client
+
+        nbatch, batch = 1000, 100
+        T0 = now()
+        for i in range(nbatch):
+            self.sendTCP([Msg(cmd=15, dtype=5, dcnt=1, p1=42, p2=j) for j in range(batch)])
+        T1 = now()
+        self.sess = None
+
+        N = nbatch*batch
+        R = self.report('send_rate', value=N/(T1-T0), unit='msg/s', case='read_notify')
+        self.report('send_bandwidth', value=N*Msg._head.size/(T1-T0), unit='B/s', case='read_notify')
+        self.assertGreater(R['value'], self.minrate)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
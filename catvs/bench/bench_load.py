@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os, socket, threading, time
+from struct import pack
+from ..util import Msg, MsgParser, PVSet
+from .common import BenchClient, Circuit, now, cstr
+
+_log = logging.getLogger(__name__)
+
+class PutLoad(object):
+    '''Flood of WRITE_NOTIFY on one circuit, keeping 'window' outstanding.
+
+    With nsub>0, also subscribes to the PV being written, so each put
+    results in nsub updates.  'count' is the number of puts completed
+    and updates received.
+    '''
+    def __init__(self, test, name, window=16, nsub=0):
+        self.name, self.window, self.nsub = name, window, nsub
+        self.count = self.errors = 0
+        self.running = True
+        self.sid = None
+        self.C = Circuit(test.testport, self.handle, user=test.user, host=test.host,
+                         timeout=test.timeout, sockprof=test.sockprof)
+
+    def start(self):
+        self.C.send([Msg(cmd=18, p1=1, p2=13, body=cstr(self.name))])
+
+    def stop(self):
+        self.running = False
+        self.C.close()
+
+    def put(self, N):
+        self.C.send([Msg(cmd=19, dtype=5, dcnt=1, p1=self.sid, p2=i, body=pack('!i', i))
+                     for i in range(N)])
+
+    def handle(self, circ, M):
+        if M is None or not self.running:
+            return
+        elif M.cmd==18:
+            self.sid = M.p2
+            self.C.send([Msg(cmd=1, dtype=5, dcnt=1, p1=self.sid, p2=100+i,
+                             body=Msg._sub_body.pack(0.0, 0.0, 0.0, 1))
+                         for i in range(self.nsub)])
+            self.put(self.window)
+        elif M.cmd==19:
+            self.count += 1
+            self.put(1)
+        elif M.cmd==1:
+            self.count += 1
+        elif M.cmd in (11, 26):
+            self.errors += 1
+            _log.error("Load error %s", M)
+
+class SearchLoad(object):
+    '''Flood of UDP searches for existing names, in batches of 'batch'.
+
+    'count' is the number of replies received.  Lost replies are
+    abandoned after 'wait' seconds.
+    '''
+    def __init__(self, test, names, batch=16, wait=0.05):
+        self.port, self.names, self.batch, self.wait = test.testport, names, batch, wait
+        self.count = self.errors = 0
+        self.running = True
+        self.S = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        test.sockprof.applyUDP(self.S)
+        self.S.bind(('127.0.0.1', 0))
+        self.S.settimeout(self.wait)
+        self.dgram = test.sockprof.dgram
+        self.T = threading.Thread(target=self.run)
+        self.T.daemon = True
+
+    def start(self):
+        self.T.start()
+
+    def stop(self):
+        self.running = False
+        self.T.join()
+        self.S.close()
+
+    def run(self):
+        N, i = len(self.names), 0
+        while self.running:
+            msg = [Msg(cmd=0, dcnt=13)]
+            for j in range(self.batch):
+                msg.append(Msg(cmd=6, dtype=5, dcnt=13, p1=i, p2=i, body=cstr(self.names[i%N])))
+                i += 1
+            self.S.sendto(b''.join([M.pack() for M in msg]), ('127.0.0.1', self.port))
+
+            pending = self.batch
+            while pending and self.running:
+                try:
+                    pkt, _src = self.S.recvfrom(self.dgram)
+                except socket.timeout:
+                    break # abandon the rest
+                P = MsgParser()
+                P.feed(pkt)
+                nrep = len([M for M in P if M.cmd==6])
+                self.count += nrep
+                pending -= nrep
+
+class TestLatencyUnderLoad(BenchClient, unittest.TestCase):
+    '''Probe latency while background load ramps up.
+
+    For each level, 'nload' load generators (circuits, or UDP sockets)
+    run while a probe circuit issues an ECHO and a READ_NOTIFY every
+    'interval' seconds.  Reports probe latency percentiles, and load
+    throughput, at each level.  Together a latency vs. throughput curve.
+    '''
+    pvs = PVSet(8, pattern='load:%d')
+    levels = (0, 1, 2, 4, 8)
+    nprobe = 200
+    interval = 0.005
+    warmup = 0.2 # seconds of load before probing
+    timeout = 5.0
+
+    def openProbe(self):
+        self.openCircuit()
+        done = self.createChannels(['ival'])
+        _T0, _T1, rep = done[1]
+        self.assertCAEqual(rep, cmd=18)
+        self.sid = rep.p2
+
+    def probe(self):
+        'Returns (ECHO round trip times, READ_NOTIFY round trip times)'
+        echo, read = [], []
+        T = now()
+        for i in range(self.nprobe):
+            T0 = now()
+            self.sendTCP([Msg(cmd=23)])
+            rep = self.recvTCP()
+            T1 = now()
+            self.assertCAEqual(rep, cmd=23)
+            self.sendTCP([Msg(cmd=15, dtype=5, dcnt=1, p1=self.sid, p2=i)])
+            rep = self.recvTCP()
+            T2 = now()
+            self.assertCAEqual(rep, cmd=15, p1=1, p2=i)
+            echo.append(T1-T0)
+            read.append(T2-T1)
+
+            T += self.interval
+            delay = T-now()
+            if delay>0:
+                time.sleep(delay)
+        return echo, read
+
+    def ramp(self, kind, factory):
+        self.openProbe()
+        curve = []
+        for nload in self.levels:
+            loads = []
+            try:
+                for i in range(nload):
+                    loads.append(factory(i))
+                for L in loads:
+                    L.start()
+                time.sleep(self.warmup)
+
+                C0, T0 = sum([L.count for L in loads]), now()
+                echo, read = self.probe()
+                rate = (sum([L.count for L in loads])-C0)/(now()-T0)
+            finally:
+                for L in loads:
+                    L.stop()
+            errors = sum([L.errors for L in loads])
+
+            case = '%s x%d'%(kind, nload)
+            self.report('load_rate', value=rate, unit='op/s', case=case, load=kind, nload=nload)
+            E = self.report('probe_echo', samples=echo, unit='s', case=case, load=kind, nload=nload,
+                            load_rate=rate)
+            R = self.report('probe_read', samples=read, unit='s', case=case, load=kind, nload=nload,
+                            load_rate=rate)
+            curve.append((nload, rate, E['p50'], E['p99'], R['p50'], R['p99']))
+            self.assertEqual(errors, 0)
+
+        _log.info("%s load vs. probe latency (ms)\n%s", kind, '\n'.join(
+                  ['  %2d %10.1f op/s  echo p50 %7.3f p99 %7.3f  read p50 %7.3f p99 %7.3f'%(
+                   N, rate, 1e3*EA, 1e3*EB, 1e3*RA, 1e3*RB) for N, rate, EA, EB, RA, RB in curve]))
+
+    def test_put(self):
+        'WRITE_NOTIFY flood'
+        names = self.pvs.names()
+        self.ramp('put', lambda i:PutLoad(self, names[i%len(names)]))
+
+    def test_monitor(self):
+        'Subscription update flood'
+        names = self.pvs.names()
+        self.ramp('monitor', lambda i:PutLoad(self, names[i%len(names)], window=4, nsub=10))
+
+    def test_search(self):
+        'UDP search flood'
+        names = self.pvs.names()
+        self.ramp('search', lambda i:SearchLoad(self, names))
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os, select, struct
+from ..util import Msg, PVSet
+from .common import BenchClient, now
+
+_log = logging.getLogger(__name__)
+
+class TestPutPipeline(BenchClient, unittest.TestCase):
+    '''Stream of puts at increasing rates, WRITE vs. WRITE_NOTIFY.
+
+    For each rate, puts of a DOUBLE scalar or array are sent for 'duration'
+    seconds.  WRITE is fire-and-forget, and ends with an ECHO to wait for the
+    server to catch up.  WRITE_NOTIFY keeps at most 'window' puts outstanding.
+    A rate of 0 is as fast as possible.
+
+    Backpressure is time spent blocked in send() (WRITE), or with the window
+    full (WRITE_NOTIFY).  The saturation rate is the lowest rate not sustained
+    (within 10%), or which had errors.  It is only reported if some rate
+    was not sustained, which is also reported as 'saturated' (0 or 1).
+    With 'verify', the last value written (the number of puts) is read back
+    with READ_NOTIFY.
+    '''
+    pvs = PVSet(2, pattern='put:%d', types=('DOUBLE',), nelm=(1, 1024))
+    rates = (1000, 5000, 20000, 0)
+    duration = 0.5 # seconds at each rate
+    window = 64 # WRITE_NOTIFY outstanding
+    batch = 64 # max. puts per send()
+    verify = True
+    timeout = 5.0
+
+    def openChans(self):
+        self.openCircuit()
+        done = self.createChannels(self.pvs.names())
+        self.chans = [rep for _T0, _T1, rep in sorted(done.values(), key=lambda E:E[2].p1)]
+        for rep, (_name, _T, N) in zip(self.chans, self.pvs.entries()):
+            self.assertCAEqual(rep, cmd=18, dtype=6, dcnt=N)
+
+    def stream(self, C, cmd, rate):
+        '''Put to channel C for 'duration' seconds.
+        Returns a dict of results.  The value of each put is its ioid,
+        so the last value written is 'nput'.
+        '''
+        tail = b'\0'*8*(C.dcnt-1) # array elements after the first are zero
+        T0, ioid = now(), 0
+        Tend = T0+self.duration
+        pending, latency = {}, []
+        errors = blocked = full = 0
+        closed = False
+
+        def handle(rep):
+            if rep.cmd==19 and rep.p2 in pending:
+                latency.append(now()-pending.pop(rep.p2))
+                return rep.p1!=1 # ECA_NORMAL
+            elif rep.cmd in (1, 22, 23):
+                return False
+            _log.error("Put error %s", rep)
+            return True
+
+        while not closed:
+            T = now()
+            if T>=Tend:
+                break
+            N = self.batch if rate==0 else min(self.batch, int((T-T0)*rate)+1-ioid)
+            if cmd==19:
+                if N>0 and len(pending)>=self.window:
+                    full += 1
+                N = min(N, self.window-len(pending))
+            if N>0:
+                msg = []
+                for i in range(N):
+                    ioid += 1
+                    if cmd==19:
+                        pending[ioid] = T
+                    msg.append(Msg(cmd=cmd, dtype=6, dcnt=C.dcnt, p1=C.p2, p2=ioid,
+                                   body=struct.pack('!d', ioid)+tail))
+                S = now()
+                self.sendTCP(msg)
+                blocked += now()-S
+
+            # wait until the next put is due, or a reply arrives
+            wait = 0.0 if rate==0 else max(0.0, T0+(ioid+1)/float(rate)-now())
+            if not select.select([self.sess], [], [], wait)[0] and not len(self.rx):
+                continue
+            while True:
+                rep = self.recvTCP()
+                if rep is None:
+                    closed = True
+                    break
+                errors += handle(rep)
+                if not len(self.rx):
+                    break
+
+        # drain.  WRITE_NOTIFY may complete after the ECHO
+        if not closed:
+            self.sendTCP([Msg(cmd=23)])
+            echoed = False
+            while pending or not echoed:
+                rep = self.recvTCP()
+                if rep is None:
+                    closed = True
+                    break
+                elif rep.cmd==23:
+                    echoed = True
+                else:
+                    errors += handle(rep)
+        T1 = now()
+
+        return {'nput':ioid, 'time':T1-T0, 'rate':ioid/(T1-T0), 'latency':latency, 'errors':errors,
+                'blocked':blocked/(T1-T0), 'full':full, 'closed':closed}
+
+    def readBack(self, C, last):
+        self.sendTCP([Msg(cmd=15, dtype=6, dcnt=C.dcnt, p1=C.p2, p2=0)])
+        while True:
+            rep = self.recvTCP()
+            self.assertIsNotNone(rep)
+            if rep.cmd==15:
+                break
+        self.assertCAEqual(rep, cmd=15, dtype=6, dcnt=C.dcnt, p1=1, p2=0)
+        self.assertEqual(struct.unpack('!d', rep.body[:8])[0], float(last))
+
+    def ramp(self, cmd):
+        self.openChans()
+        mode = {4:'WRITE', 19:'WRITE_NOTIFY'}[cmd]
+        for C in self.chans:
+            kind = 'scalar' if C.dcnt==1 else 'array[%d]'%C.dcnt
+            saturation = None
+            for rate in self.rates:
+                R = self.stream(C, cmd, rate)
+                case = '%s %s rate=%s'%(mode, kind, rate or 'max')
+                extra = {'mode':mode, 'pv':kind, 'target':rate}
+                self.report('put_rate', value=R['rate'], unit='put/s', case=case, **extra)
+                self.report('backpressure', value=R['blocked'], unit='ratio', case=case,
+                            window_full=R['full'], **extra)
+                self.report('errors', value=R['errors'], unit='', case=case, closed=R['closed'], **extra)
+                if R['latency']:
+                    self.report('put_latency', samples=R['latency'], unit='s', case=case, **extra)
+
+                self.assertFalse(R['closed'], "Server closed circuit at %s"%case)
+                if saturation is None and (R['errors'] or (rate and R['rate']<0.9*rate)):
+                    saturation = rate
+                if self.verify:
+                    self.readBack(C, R['nput'])
+
+            case = '%s %s'%(mode, kind)
+            self.report('saturated', value=int(saturation is not None), unit='', case=case, mode=mode, pv=kind)
+            if saturation is not None: # lowest rate not sustained
+                self.report('saturation_rate', value=saturation, unit='put/s', case=case, mode=mode, pv=kind)
+
+    def test_write(self):
+        'Fire-and-forget WRITE'
+        self.ramp(4)
+
+    def test_write_notify(self):
+        'WRITE_NOTIFY with a window of outstanding puts'
+        self.ramp(19)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os, socket, selectors, threading, time
+from ..util import Msg, MsgParser, TestMixinUDP, DUTProcess, procStats
+from .common import BenchReport, now
+
+_log = logging.getLogger(__name__)
+
+class Clients(object):
+    '''UDP sockets registered with the repeater, as libca does.
+
+    A thread receives from all of them, recording the arrival time
+    of each beacon by beacon ID.
+    '''
+    def __init__(self, test, N):
+        self.socks, self.arrive, self.register = [], [], []
+        self.running = True
+        try:
+            for i in range(N):
+                S = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.socks.append(S)
+                test.sockprof.applyUDP(S)
+                S.bind(('127.0.0.1', 0))
+                S.settimeout(test.timeout)
+                self.arrive.append([])
+                self.register.append(self._register(S, test))
+        except:
+            self.close()
+            raise
+        self.dgram = test.sockprof.dgram
+        self.T = threading.Thread(target=self._run)
+        self.T.daemon = True
+        self.T.start()
+
+    def _register(self, S, test):
+        'Returns time until REPEATER_CONFIRM'
+        T0 = now()
+        S.sendto(Msg(cmd=24, p2=0x7f000001).pack(), ('127.0.0.1', test.testport))
+        while True:
+            pkt, _src = S.recvfrom(test.sockprof.dgram)
+            P = MsgParser()
+            P.feed(pkt)
+            # the repeater sends VERSION to other clients on each registration
+            if [M for M in P if M.cmd==17]:
+                return now()-T0
+
+    def _run(self):
+        sel = selectors.DefaultSelector()
+        for i, S in enumerate(self.socks):
+            S.setblocking(False)
+            sel.register(S, selectors.EVENT_READ, self.arrive[i])
+        while self.running:
+            for key, _mask in sel.select(0.1):
+                while True:
+                    try:
+                        pkt = key.fileobj.recv(self.dgram)
+                    except BlockingIOError:
+                        break
+                    T = now()
+                    P = MsgParser()
+                    P.feed(pkt)
+                    for M in P:
+                        if M.cmd==13:
+                            key.data.append((M.p1, T))
+        sel.close()
+
+    def close(self):
+        self.running = False
+        if getattr(self, 'T', None) is not None:
+            self.T.join()
+        for S in self.socks:
+            S.close()
+
+class TestRepeater(BenchReport, TestMixinUDP, unittest.TestCase):
+    '''Beacon fan-out through a CA repeater to many local clients.
+
+    The DUT is a repeater, eg. caRepeater from Base, run on a free port.
+    Clients are registered, then beacons are injected at each rate
+    for a while.  Reports registration latency, and at each rate the
+    fan-out latency, beacons dropped per client, and repeater CPU usage.
+
+    Configured through the environment
+
+      REPEATER          - Repeater command.  Skipped if not set
+      REPEATER_CLIENTS  - Number of clients
+      REPEATER_RATES    - Beacon rates (per second).  eg. "10,100,1000"
+      REPEATER_DURATION - Seconds of beacons at each rate
+    '''
+    dut = None
+    settle = 0.5 # seconds to wait for stragglers after the last beacon
+    maxdrop = 0.01 # fraction of beacons which may be dropped at the lowest rate
+
+    def setUp(self):
+        env = os.environ
+        self.dut = env.get('REPEATER')
+        if not self.dut:
+            self.skipTest("Set $REPEATER to a CA repeater executable")
+        self.nclient = int(env.get('REPEATER_CLIENTS', '200'))
+        self.rates = [float(R) for R in env.get('REPEATER_RATES', '10,100,1000').split(',')]
+        self.duration = float(env.get('REPEATER_DURATION', '2'))
+
+        S = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        S.bind(('127.0.0.1', 0))
+        self.testport = S.getsockname()[1]
+        S.close()
+
+        self.proc = DUTProcess(self.dut, self.testport, testname=self.id(),
+                               env={'EPICS_CA_REPEATER_PORT':str(self.testport)})
+        self.addCleanup(self.proc.stop)
+        super().setUp()
+
+    def waitRepeater(self, wait=2.0):
+        'Register until the repeater confirms'
+        S = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            S.bind(('127.0.0.1', 0))
+            S.settimeout(0.1)
+            T0 = time.time()
+            while time.time()-T0<wait:
+                S.sendto(Msg(cmd=24, p2=0x7f000001).pack(), ('127.0.0.1', self.testport))
+                try:
+                    pkt, _src = S.recvfrom(self.sockprof.dgram)
+                except (socket.timeout, ConnectionRefusedError):
+                    time.sleep(0.1)
+                    continue
+                P = MsgParser()
+                P.feed(pkt)
+                if [M for M in P if M.cmd==17]:
+                    return
+            self.fail("timeout waiting for repeater to start")
+        finally:
+            S.close()
+
+    def test_fanout(self):
+        'Beacons from one server to all clients'
+        self.waitRepeater()
+        C = Clients(self, self.nclient)
+        self.addCleanup(C.close)
+        self.report('register_latency', samples=C.register, unit='s', nclient=self.nclient)
+
+        bid = 0
+        for rate in self.rates:
+            sent = {}
+            nbeacon = int(rate*self.duration)
+            start = [len(A) for A in C.arrive] # arrivals before this round
+            base = sum(start)
+            cpu0, T0 = procStats(self.proc.pid())['cpu'], now()
+            for i in range(nbeacon):
+                due = T0+i/rate
+                delay = due-now()
+                if delay>0:
+                    time.sleep(delay)
+                sent[bid] = now()
+                # RSRV_IS_UP: minor version, server port, beacon ID, address
+                self.sendUDP([Msg(cmd=13, dtype=13, dcnt=self.testport, p1=bid, p2=0x7f000001)])
+                bid += 1
+            T1 = now()
+
+            # wait for stragglers
+            while now()-T1<self.settle and sum(map(len, C.arrive))-base<nbeacon*self.nclient:
+                time.sleep(0.01)
+            cpu = procStats(self.proc.pid())['cpu']-cpu0
+
+            latency, drops = [], []
+            for A, S in zip(C.arrive, start):
+                seen = set()
+                for B, T in A[S:]: # only this round, without duplicates
+                    if B in sent and B not in seen:
+                        seen.add(B)
+                        latency.append(T-sent[B])
+                drops.append(nbeacon-len(seen))
+
+            case = 'rate=%g'%rate
+            extra = {'nclient':self.nclient, 'rate':rate}
+            self.report('inject_rate', value=nbeacon/(T1-T0), unit='beacon/s', case=case, **extra)
+            if latency:
+                self.report('fanout_latency', samples=latency, unit='s', case=case, **extra)
+            self.report('drops', samples=drops, unit='beacon', case=case, **extra)
+            ratio = sum(drops)/float(nbeacon*self.nclient)
+            self.report('drop_ratio', value=ratio, unit='ratio', case=case, **extra)
+            self.report('repeater_cpu', value=cpu/(T1-T0), unit='cpu/s', case=case, **extra)
+            if rate==min(self.rates):
+                self.assertLessEqual(ratio, self.maxdrop)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
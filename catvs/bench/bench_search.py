@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import unittest, socket, logging, os, random
+from ..util import Msg, PVSet
+from .common import BenchClient, now, cstr
+
+class TestSearchScale(BenchClient, unittest.TestCase):
+    '''Name search and channel create cost vs. number of PVs served
+    '''
+    pvs = PVSet(1000, types=('LONG', 'DOUBLE', 'SHORT'), nelm=(1, 1, 1, 16))
+    nsearch = 1000
+
+    def names(self):
+        'Random (but repeatable) selection of existing names'
+        names = self.pvs.names()
+        return random.Random(42).sample(names, min(self.nsearch, len(names)))
+
+    def test_udp_hit(self):
+        'UDP search latency for existing names'
+        lat = []
+        for i, name in enumerate(self.names()):
+            T0 = now()
+            self.sendUDP([
+                Msg(cmd=0, dcnt=13),
+                Msg(cmd=6, body=cstr(name), dtype=5, dcnt=13, p1=i, p2=i),
+            ])
+            rep = self.recvUDP()
+            lat.append(now()-T0)
+            self.assertCAEqual(rep[-1], cmd=6, p2=i)
+
+        self.report('udp_search_hit', samples=lat, unit='s', npv=len(self.pvs))
+
+    def _tcp_search(self, names, metric):
+        self.openCircuit()
+        if self.sver<12:
+            self.skipTest("Server doesn't support TCP lookup")
+
+        lat = []
+        for i, name in enumerate(names):
+            T0 = now()
+            self.sendTCP([
+                Msg(cmd=6, body=cstr(name), dtype=10, dcnt=13, p1=i, p2=i),
+            ])
+            rep = self.recvTCP()
+            lat.append(now()-T0)
+            self.assertIn(rep.cmd, (6, 14))
+            self.assertCAEqual(rep, p2=i)
+
+        self.report(metric, samples=lat, unit='s', npv=len(self.pvs))
+
+    def test_tcp_hit(self):
+        'TCP search latency for existing names'
+        self._tcp_search(self.names(), 'tcp_search_hit')
+
+    def test_tcp_miss(self):
+        'TCP search latency for non-existant names w/ reply (NOT_FOUND)'
+        self._tcp_search(self.pvs.missing(self.nsearch), 'tcp_search_miss')
+
+    def test_create(self):
+        'Pipelined channel create rate'
+        names = self.names()
+        self.openCircuit()
+
+        T0 = now()
+        done = self.createChannels(names)
+        T1 = now()
+
+        self.assertEqual(len(done), len(names))
+        for _T0, _T1, rep in done.values():
+            self.assertCAEqual(rep, cmd=18)
+
+        self.report('create_rate', value=len(names)/(T1-T0), unit='chan/s', npv=len(self.pvs))
+        self.report('create_latency', samples=[B-A for A, B, _rep in done.values()],
+                    unit='s', npv=len(self.pvs))
+
+class TestSearchBatch(BenchClient, unittest.TestCase):
+    '''Batched name search over a TCP circuit compared with UDP
+    '''
+    pvs = PVSet(10000)
+    nbatch = 10000
+    hitratio = 0.5
+    window = 1024 # max. searches outstanding
+    udpmax = 1400 # max. UDP payload (bytes)
+
+    def batch(self):
+        'Shuffled mix of existing and non-existant names'
+        R = random.Random(42)
+        nhit = int(self.nbatch*self.hitratio)
+        names = R.sample(self.pvs.names(), nhit) + self.pvs.missing(self.nbatch-nhit)
+        R.shuffle(names)
+        return names, nhit
+
+    def searchTCP(self, names):
+        'Returns (elapsed time, dict of searchid -> (send time, reply time, reply Msg))'
+        reqs = [(i, Msg(cmd=6, body=cstr(name), dtype=10, dcnt=13, p1=i, p2=i))
+                for i, name in enumerate(names)]
+
+        T0 = now()
+        done = self.pipelineTCP(reqs, lambda M: M.p2 if M.cmd in (6, 14) else None,
+                                window=self.window)
+        return now()-T0, done
+
+    def searchUDP(self, names, hits):
+        '''Search as many names in each UDP packet as will fit.
+        Only 'hits' will be answered.
+        Returns (elapsed time, list of latencies, number of lost replies)
+        '''
+        frames, frame, fsize = [], [], self.udpmax
+        for i, name in enumerate(names):
+            M = Msg(cmd=6, body=cstr(name), dtype=5, dcnt=13, p1=i, p2=i)
+            if fsize+16+M.size>self.udpmax:
+                frame = [Msg(cmd=0, dcnt=13)]
+                fsize = 16
+                frames.append(frame)
+            frame.append(M)
+            fsize += 16+M.size
+
+        sent, lat, lost = {}, [], 0
+        outstanding = set()
+        T0 = now()
+        frames.reverse()
+        while frames or outstanding:
+            while frames and len(outstanding)<self.window:
+                frame = frames.pop()
+                T = now()
+                for M in frame[1:]:
+                    sent[M.p2] = T
+                outstanding.update([M.p2 for M in frame[1:] if M.p2 in hits])
+                self.sendUDP(frame)
+
+            if not outstanding:
+                continue
+
+            try:
+                rep = self.recvUDP()
+            except socket.timeout:
+                lost += len(outstanding)
+                outstanding.clear()
+                continue
+            T = now()
+            for M in rep:
+                if M.cmd==6 and M.p2 in outstanding:
+                    outstanding.remove(M.p2)
+                    lat.append(T-sent[M.p2])
+
+        return now()-T0, lat, lost
+
+    def test_batch(self):
+        'TCP vs. UDP search of a batch of names'
+        names, nhit = self.batch()
+        existing = set(self.pvs.names())
+        hits = set([i for i, name in enumerate(names) if name in existing])
+        self.assertEqual(len(hits), nhit)
+
+        self.openCircuit()
+        if self.sver<12:
+            self.skipTest("Server doesn't support TCP lookup")
+
+        tcptime, done = self.searchTCP(names)
+
+        self.assertEqual(len(done), len(names))
+        self.assertSetEqual(hits, set([K for K, (_T0, _T1, rep) in done.items() if rep.cmd==6]))
+
+        self.report('tcp_batch_rate', value=len(names)/tcptime, unit='name/s', nbatch=len(names))
+        self.report('tcp_batch_latency', samples=[B-A for A, B, _rep in done.values()],
+                    unit='s', nbatch=len(names))
+
+        udptime, lat, lost = self.searchUDP(names, hits)
+
+        self.report('udp_batch_rate', value=len(names)/udptime, unit='name/s', nbatch=len(names))
+        self.report('udp_batch_latency', samples=lat, unit='s', nbatch=len(names))
+        self.report('udp_batch_lost', value=lost, unit='name', nbatch=len(names))
+
+        self.report('tcp_udp_speedup', value=udptime/tcptime, unit='', nbatch=len(names))
+
+class TestSearchScale10k(TestSearchScale):
+    pvs = PVSet(10000, types=('LONG', 'DOUBLE', 'SHORT'), nelm=(1, 1, 1, 16))
+    dutwait = 10.0
+
+class TestSearchScale100k(TestSearchScale):
+    pvs = PVSet(100000, types=('LONG', 'DOUBLE', 'SHORT'), nelm=(1, 1, 1, 16))
+    dutwait = 60.0
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
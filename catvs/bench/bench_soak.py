@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os, random
+from struct import pack
+from ..util import Msg, MsgParser, PVSet
+from .common import BenchClient, now, cstr, linfit
+
+_log = logging.getLogger(__name__)
+
+# DBR type -> struct format of a single element
+_fmt = {1:'!h', 2:'!f', 5:'!i', 6:'!d'}
+
+def _mix(spec):
+    'Parse eg. "get=4,put=4,clear=1" into a dict'
+    ret = {}
+    for ent in spec.split(','):
+        K, _sep, V = ent.partition('=')
+        ret[K.strip()] = float(V)
+    return ret
+
+class TestSoak(BenchClient, unittest.TestCase):
+    '''Long running loop of a weighted mix of operations.
+
+    The DUT RSS and open fd count are sampled periodically.
+    Fails if the trend of either over the run exceeds a threshold.
+
+    Configured through the environment
+
+      SOAK_DURATION - Run time in seconds
+      SOAK_INTERVAL - Sample interval in seconds
+      SOAK_MIX      - Operation weights.  eg. "get=4,put=4,clear=1"
+      SOAK_MAXRSS   - Max. RSS growth (bytes) over the run
+      SOAK_MAXFDS   - Max. fd count growth over the run
+      SOAK_OUTPUT   - Time series file name.  Not written if not set
+    '''
+    pvs = PVSet(100, types=('LONG', 'DOUBLE', 'SHORT'), nelm=(1, 1, 1, 16))
+    maxchan = 200 # limit on channels open at once
+    mix = 'create=2,get=4,put=4,monitor=2,cancel=2,clear=2,reconnect=0.1'
+
+    def setUp(self):
+        super().setUp()
+        env = os.environ
+        self.duration = float(env.get('SOAK_DURATION', '60'))
+        self.interval = float(env.get('SOAK_INTERVAL', '1'))
+        self.maxrss = float(env.get('SOAK_MAXRSS', str(10*2**20)))
+        self.maxfds = float(env.get('SOAK_MAXFDS', '5'))
+        self.output = env.get('SOAK_OUTPUT')
+
+        self.ops = sorted(_mix(env.get('SOAK_MIX', self.mix)).items())
+        self.R = random.Random(42)
+        self.names = self.pvs.names()
+        self.ioid = 0
+        self.nupdate = 0
+
+    def _connect(self):
+        self.openCircuit()
+        self.chans = {} # cid -> CREATE_CHAN reply
+        self.subs = {} # ioid -> cid
+
+    def _await(self, match):
+        'Receive until match() returns True.  Subscription updates are counted and dropped.'
+        while True:
+            rep = self.recvTCP()
+            if rep is None:
+                self.fail("DUT closed circuit")
+            elif match(rep):
+                return rep
+            elif rep.cmd==1 and rep.p2 in self.subs:
+                self.nupdate += 1
+            elif rep.cmd!=22: # ignore ACCESS_RIGHTS
+                self.fail("Unexpected %s"%rep)
+
+    def _nextid(self):
+        self.ioid += 1
+        return self.ioid
+
+    def op_create(self):
+        if len(self.chans)>=self.maxchan:
+            return self.op_clear()
+        cid = self._nextid()
+        self.sendTCP([
+            Msg(cmd=18, p1=cid, p2=13, body=cstr(self.R.choice(self.names))),
+        ])
+        rep = self._await(lambda M:M.cmd in (18, 26) and M.p1==cid)
+        self.assertCAEqual(rep, cmd=18)
+        self.chans[cid] = rep
+
+    def _pick(self):
+        if not self.chans:
+            self.op_create()
+        return self.chans[self.R.choice(list(self.chans))]
+
+    def op_get(self):
+        C, ioid = self._pick(), self._nextid()
+        self.sendTCP([
+            Msg(cmd=15, dtype=C.dtype, dcnt=C.dcnt, p1=C.p2, p2=ioid),
+        ])
+        rep = self._await(lambda M:M.cmd==15 and M.p2==ioid)
+        self.assertCAEqual(rep, p1=1)
+
+    def op_put(self):
+        C, ioid = self._pick(), self._nextid()
+        self.sendTCP([
+            Msg(cmd=19, dtype=C.dtype, dcnt=1, p1=C.p2, p2=ioid,
+                body=pack(_fmt[C.dtype], self.R.randint(0, 100))),
+        ])
+        rep = self._await(lambda M:M.cmd==19 and M.p2==ioid)
+        self.assertCAEqual(rep, p1=1)
+
+    def op_monitor(self):
+        C, ioid = self._pick(), self._nextid()
+        self.sendTCP([
+            Msg(cmd=1, dtype=C.dtype, dcnt=C.dcnt, p1=C.p2, p2=ioid,
+                body=Msg._sub_body.pack(0.0, 0.0, 0.0, 1)), # DBE_VALUE
+        ])
+        # wait for initial update
+        self._await(lambda M:M.cmd==1 and M.p2==ioid)
+        self.subs[ioid] = C.p1
+
+    def op_cancel(self):
+        if not self.subs:
+            return self.op_monitor()
+        ioid = self.R.choice(list(self.subs))
+        C = self.chans[self.subs[ioid]]
+        self.sendTCP([
+            Msg(cmd=2, dtype=C.dtype, dcnt=C.dcnt, p1=C.p2, p2=ioid),
+        ])
+        # confirmation is an EVENT_ADD w/o payload
+        self._await(lambda M:M.cmd==1 and M.p2==ioid and M.size==0)
+        del self.subs[ioid]
+
+    def op_clear(self):
+        if not self.chans:
+            return self.op_create()
+        cid = self.R.choice(list(self.chans))
+        C = self.chans.pop(cid)
+        self.sendTCP([
+            Msg(cmd=12, p1=C.p2, p2=cid),
+        ])
+        self._await(lambda M:M.cmd==12 and M.p1==C.p2)
+        # updates may still arrive for subscriptions of the cleared channel
+        self.subs = dict([(K, V) for K, V in self.subs.items() if V!=cid])
+
+    def op_reconnect(self):
+        'Abandon circuit (and all channels and subscriptions) w/o clearing'
+        self.sess.close()
+        self.sess, self.rx = None, MsgParser()
+        self._connect()
+
+    def test_soak(self):
+        'Weighted mix of operations w/ leak detection'
+        self._connect()
+
+        ops = [(getattr(self, 'op_'+K), W) for K, W in self.ops if W>0]
+        total = sum([W for _op, W in ops])
+
+        samples, nops = [], 0
+        T0 = now()
+        Tsample, Tend = T0, T0+self.duration
+        while True:
+            T = now()
+            if T>=Tsample:
+                S = self.dutStats()
+                samples.append((T-T0, S['rss'], S['fds'], nops))
+                _log.debug("sample %s", samples[-1])
+                Tsample += self.interval
+            if T>=Tend:
+                break
+
+            X = self.R.uniform(0, total)
+            for op, W in ops:
+                X -= W
+                if X<=0:
+                    break
+            op()
+            nops += 1
+
+        if self.output:
+            with open(self.output, 'w') as F:
+                F.write('# time rss fds ops\n')
+                for S in samples:
+                    F.write('%.3f %d %d %d\n'%S)
+
+        self.report('soak_rate', value=nops/(samples[-1][0] or 1.0), unit='op/s',
+                    updates=self.nupdate)
+
+        # ignore the first 10% of samples as warmup
+        samples = samples[len(samples)//10:]
+        if len(samples)<3:
+            self.skipTest("Too few samples to fit")
+        T = [S[0] for S in samples]
+        span = T[-1]-T[0]
+
+        rss = linfit(T, [S[1] for S in samples])[0]*span
+        fds = linfit(T, [S[2] for S in samples])[0]*span
+        self.report('soak_rss_growth', value=rss, unit='bytes', duration=span)
+        self.report('soak_fds_growth', value=fds, unit='fd', duration=span)
+
+        self.assertLessEqual(rss, self.maxrss, "RSS growth %d bytes"%rss)
+        self.assertLessEqual(fds, self.maxfds, "fd growth %.1f"%fds)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
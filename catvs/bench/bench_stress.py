@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os, random, threading, itertools
+from struct import pack
+from ..util import Msg, PVSet
+from .common import BenchClient, Circuit, now, cstr
+
+_log = logging.getLogger(__name__)
+
+class Tracker(object):
+    '''Matches replies with requests from several threads, and checks
+    protocol invariants.
+
+      Each request is answered exactly once.
+      No subscription updates after cancel (or channel clear) is confirmed.
+      No errors, and no circuit closed by the server.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiting = {} # key -> [Event, reply Msg]
+        self.answered = set()
+        self.subs = {} # ioid -> cid
+        self.cancelled = set() # ioid
+        self.closing = False
+        self.nupdate = 0
+        self.violations = []
+
+    def violation(self, msg):
+        _log.error("%s", msg)
+        with self.lock:
+            self.violations.append(msg)
+
+    def expect(self, key):
+        'Call before sending a request.  Returns [Event, reply]'
+        E = [threading.Event(), None]
+        with self.lock:
+            self.waiting[key] = E
+        return E
+
+    def subscribe(self, ioid, cid):
+        with self.lock:
+            self.subs[ioid] = cid
+
+    def resolve(self, key, M):
+        with self.lock:
+            if key in self.answered:
+                E = None
+                msg = "%s answered twice %s"%(key, M)
+            else:
+                E = self.waiting.pop(key, None)
+                msg = "%s unexpected %s"%(key, M)
+                if E is not None:
+                    self.answered.add(key)
+        if E is None:
+            self.violation(msg)
+        else:
+            E[1] = M
+            E[0].set()
+
+    def handle(self, circ, M):
+        'Called from Circuit reader threads'
+        if M is None:
+            if not self.closing:
+                self.violation("Circuit closed by server")
+        elif M.cmd in (0, 22): # VERSION, ACCESS_RIGHTS
+            pass
+        elif M.cmd==18:
+            self.resolve(('create', M.p1), M)
+        elif M.cmd==19:
+            self.resolve(('put', M.p2), M)
+        elif M.cmd==12:
+            with self.lock:
+                self.cancelled.update([I for I, C in self.subs.items() if C==M.p2])
+            self.resolve(('clear', M.p2), M)
+        elif M.cmd==1 and M.size==0:
+            with self.lock:
+                self.cancelled.add(M.p2)
+            self.resolve(('cancel', M.p2), M)
+        elif M.cmd==1:
+            with self.lock:
+                after = M.p2 in self.cancelled
+                initial = ('sub', M.p2) in self.waiting
+                self.nupdate += 1
+            if after:
+                self.violation("Update after cancel %s"%M)
+            elif initial:
+                self.resolve(('sub', M.p2), M)
+        else:
+            self.violation("Unexpected %s"%M)
+
+    def unanswered(self):
+        with self.lock:
+            return sorted(self.waiting)
+
+class TestStress(BenchClient, unittest.TestCase):
+    '''Threads interleaving put, subscribe, cancel, and clear.
+
+    All threads operate on the same few PVs, each through its own channels.
+    Threads share one circuit, or each has its own.
+    '''
+    pvs = PVSet(4, pattern='stress:%d')
+    nthread = 8
+    nops = 500 # per thread
+    timeout = 5.0
+    mix = (('put', 4), ('sub', 2), ('cancel', 2), ('clear', 1))
+
+    def setUp(self):
+        super().setUp()
+        self.T = Tracker()
+        self.ids = itertools.count(1) # cids and ioids.  next() is atomic
+        self.circs = []
+        self.addCleanup(self._closeCircuits)
+
+    def _closeCircuits(self):
+        self.T.closing = True
+        for C in self.circs:
+            C.close()
+
+    def circuit(self):
+        C = Circuit(self.testport, self.T.handle, user=self.user, host=self.host, timeout=self.timeout,
+                    sockprof=self.sockprof)
+        self.circs.append(C)
+        return C
+
+    def call(self, circ, key, msg, op, lat):
+        'Send request and wait for reply.  Returns reply, or None on timeout'
+        E = self.T.expect(key)
+        T0 = now()
+        circ.send(msg)
+        if not E[0].wait(self.timeout):
+            self.T.violation("%s timeout"%(key,))
+            return None
+        lat.setdefault(op, []).append(now()-T0)
+        return E[1]
+
+    def worker(self, circ, seed, lat):
+        R = random.Random(seed)
+        names = self.pvs.names()
+        ops = [op for op, W in self.mix for i in range(W)]
+        cid = sid = None
+        subs = []
+        for n in range(self.nops):
+            if cid is None:
+                cid = next(self.ids)
+                rep = self.call(circ, ('create', cid),
+                                [Msg(cmd=18, p1=cid, p2=13, body=cstr(R.choice(names)))], 'create', lat)
+                if rep is None:
+                    return
+                sid = rep.p2
+                continue
+
+            op = R.choice(ops)
+            if op=='put':
+                ioid = next(self.ids)
+                self.call(circ, ('put', ioid),
+                          [Msg(cmd=19, dtype=5, dcnt=1, p1=sid, p2=ioid, body=pack('!i', n))], op, lat)
+            elif op=='sub':
+                ioid = next(self.ids)
+                self.T.subscribe(ioid, cid)
+                if self.call(circ, ('sub', ioid),
+                             [Msg(cmd=1, dtype=5, dcnt=1, p1=sid, p2=ioid,
+                                  body=Msg._sub_body.pack(0.0, 0.0, 0.0, 1))], op, lat):
+                    subs.append(ioid)
+            elif op=='cancel' and subs:
+                ioid = subs.pop(R.randrange(len(subs)))
+                self.call(circ, ('cancel', ioid),
+                          [Msg(cmd=2, dtype=5, dcnt=1, p1=sid, p2=ioid)], op, lat)
+            elif op=='clear':
+                # subscriptions are implicitly cancelled
+                self.call(circ, ('clear', cid), [Msg(cmd=12, p1=sid, p2=cid)], op, lat)
+                cid = sid = None
+                subs = []
+
+    def stress(self, shared):
+        if shared:
+            C = self.circuit()
+            circs = [C]*self.nthread
+        else:
+            circs = [self.circuit() for i in range(self.nthread)]
+
+        lats = [{} for i in range(self.nthread)]
+        errors = []
+        def run(i):
+            try:
+                self.worker(circs[i], i, lats[i])
+            except Exception as e:
+                _log.exception("worker %d", i)
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.nthread)]
+
+        T0 = now()
+        for T in threads:
+            T.start()
+        for T in threads:
+            T.join()
+        T1 = now()
+
+        unanswered = self.T.unanswered()
+        if unanswered:
+            self.T.violation("%d requests unanswered: %s"%(len(unanswered), unanswered[:10]))
+
+        extra = {'threads':self.nthread, 'circuits':len(set(circs)), 'shared':shared}
+        total = 0
+        for op, W in (('create', 0),)+self.mix:
+            samples = sum([L.get(op, []) for L in lats], [])
+            total += len(samples)
+            if samples:
+                self.report('latency', samples=samples, unit='s', case=op, **extra)
+        self.report('op_rate', value=total/(T1-T0), unit='op/s', **extra)
+        self.report('update_rate', value=self.T.nupdate/(T1-T0), unit='update/s', **extra)
+        self.report('violations', value=len(self.T.violations), unit='', **extra)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.T.violations, [])
+
+    def test_shared(self):
+        'All threads on one circuit'
+        self.stress(shared=True)
+
+    def test_separate(self):
+        'Each thread with its own circuit'
+        self.stress(shared=False)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os, socket, select, signal, struct, threading, time
+from ..util import MsgParser, PVSet
+from .common import BenchClient, now
+
+_log = logging.getLogger(__name__)
+
+class TestTeardown(BenchClient, unittest.TestCase):
+    '''Mass teardown of many circuits, each with many channels.
+
+    Client side close: time for the DUT to reclaim resources,
+    as seen in its open fd count.
+
+    DUT exit on SIGTERM or SIGKILL: time for each client circuit
+    to see the disconnect, and any SERVER_DISCONN messages delivered first.
+    '''
+    ncirc = 32
+    pvs = PVSet(128, pattern='td:%d')
+    timeout = 5.0 # per socket operation
+    settle = 10.0 # limit on time to wait for teardown
+
+    def openCircuits(self):
+        'Open ncirc circuits, each with a channel to every PV.  Returns a list of (socket, MsgParser)'
+        circs = []
+        self.addCleanup(self._closeCircuits, circs)
+        for i in range(self.ncirc):
+            self.sess, self.rx = None, MsgParser()
+            self.openCircuit()
+            done = self.createChannels(self.pvs.names())
+            for _T0, _T1, rep in done.values():
+                self.assertCAEqual(rep, cmd=18)
+            circs.append((self.sess, self.rx))
+        self.sess = None
+        return circs
+
+    def _closeCircuits(self, circs):
+        for S, _P in circs:
+            S.close()
+
+    def awaitDisconnect(self, circs, T0):
+        '''Wait for the DUT to close each circuit.
+
+        Returns (list of latencies from T0, number of SERVER_DISCONN, number still open)
+        '''
+        pending = dict([(S.fileno(), (S, P)) for S, P in circs])
+        latency, ndisconn = [], 0
+        while pending:
+            remaining = T0+self.settle-now()
+            if remaining<=0:
+                break
+            ready, _W, _X = select.select(list(pending), [], [], remaining)
+            T = now()
+            for fd in ready:
+                S, P = pending[fd]
+                try:
+                    B = S.recv(self.sockprof.chunk)
+                except socket.error:
+                    B = b'' # ECONNRESET
+                if B:
+                    P.feed(B)
+                    ndisconn += len([M for M in P if M.cmd==27])
+                else:
+                    latency.append(T-T0)
+                    del pending[fd]
+        return latency, ndisconn, len(pending)
+
+    def awaitReclaim(self, baseline, T0):
+        'Poll DUT fd count until it returns to baseline.  Returns (time from T0, final stats)'
+        while True:
+            S = self.dutStats()
+            T = now()
+            if S['fds']<=baseline['fds'] or T-T0>self.settle:
+                return T-T0, S
+            time.sleep(0.01)
+
+    def clientClose(self, reset):
+        # may include the startup probe connection if the DUT hasn't closed it yet
+        baseline = self.dutStats()
+        circs = self.openCircuits()
+        loaded = self.dutStats()
+
+        if reset:
+            # SO_LINGER w/ zero timeout, close() sends RST
+            for S, _P in circs:
+                S.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        T0 = now()
+        self._closeCircuits(circs)
+        T1 = now()
+        reclaim, final = self.awaitReclaim(baseline, T0)
+
+        extra = {'circuits':self.ncirc, 'channels':self.ncirc*len(self.pvs)}
+        self.report('close_time', value=T1-T0, unit='s', **extra)
+        self.report('reclaim_time', value=reclaim, unit='s',
+                    fds_baseline=baseline['fds'], fds_loaded=loaded['fds'], fds_final=final['fds'],
+                    rss_baseline=baseline['rss'], rss_loaded=loaded['rss'], rss_final=final['rss'],
+                    **extra)
+        self.assertLessEqual(final['fds'], baseline['fds'], "DUT did not close all circuits")
+
+    def test_client_close(self):
+        'Client closes all circuits (FIN)'
+        self.clientClose(reset=False)
+
+    def test_client_reset(self):
+        'Client aborts all circuits (RST)'
+        self.clientClose(reset=True)
+
+    def serverExit(self, sig):
+        circs = self.openCircuits()
+
+        # watch the circuits while _stop_dut() waits for exit
+        exittime = []
+        T = threading.Thread(target=lambda:exittime.append(self._stop_dut(sig)))
+        T0 = now()
+        T.start()
+        latency, ndisconn, nopen = self.awaitDisconnect(circs, T0)
+        T.join()
+        exittime = exittime[0] if exittime else None
+
+        extra = {'circuits':self.ncirc, 'channels':self.ncirc*len(self.pvs),
+                 'signal':signal.Signals(sig).name}
+        if exittime is not None:
+            self.report('exit_time', value=exittime, unit='s', **extra)
+        self.report('server_disconn', value=ndisconn, unit='msg', **extra)
+        if latency:
+            self.report('detect_latency', samples=latency, unit='s', undetected=nopen, **extra)
+        self.assertEqual(nopen, 0, "%d circuits not closed"%nopen)
+
+    def test_sigterm(self):
+        'DUT exits on SIGTERM'
+        self.serverExit(signal.SIGTERM)
+
+    def test_sigkill(self):
+        'DUT killed'
+        self.serverExit(signal.SIGKILL)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
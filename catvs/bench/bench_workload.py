@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""Mixed workload described by a scenario file
+
+  WORKLOAD=myfacility.json python -m unittest catvs.bench.bench_workload
+
+The default is catvs/bench/workload.json .  YAML files (.yaml or .yml)
+may be used if PyYAML is installed.  The format is
+
+  {
+    "pvs": {"count": 200, "pattern": "wl:%d", "types": ["DOUBLE"], "nelm": [1, 256]},
+    "clients": {
+      "<population>": {"count": 8},
+      ...
+    },
+    "phases": [
+      {"name": "<phase>", "duration": 2.0,
+       "load": {
+         "<population>": {"create": 50, "monitor": 50, "rate": 10, "mix": {"get": 2, "put": 1}},
+         ...
+       }},
+      ...
+    ]
+  }
+
+"pvs" are arguments of PVSet (see catvs/util.py).  Each population is
+'count' clients, each with its own circuit and UDP socket, kept for all
+phases.  In each phase, each client of a population first creates 'create'
+channels, and subscribes to the first 'monitor' of its channels, all at once.
+Then it performs operations chosen from 'mix' (relative weights) at 'rate'
+per second, until the phase ends.  Operations are
+
+  search          - UDP search for a PV, waiting for the reply
+  search_missing  - UDP search for a PV which does not exist.  No reply, so
+                    only the number sent is reported
+  create          - create a channel to a PV
+  clear           - clear a channel without subscriptions
+  get             - READ_NOTIFY of a scalar channel
+  get_array       - READ_NOTIFY of an array channel
+  put             - WRITE_NOTIFY to a scalar channel
+
+PVs are chosen at random.  Subscriptions are kept until the end.
+
+Latency of an operation is timed from when it was due, not when it was
+sent.  A client which falls behind its rate sends late, and the delay
+is counted, as it would be for the users being modelled.
+"""
+
+import unittest, logging, os, json, random, socket, threading, itertools, time, inspect
+from struct import pack
+from ..util import Msg, MsgParser, PVSet
+from .common import BenchClient, Circuit, now, cstr
+
+_log = logging.getLogger(__name__)
+
+_ops = ('search', 'search_missing', 'create', 'clear', 'get', 'get_array', 'put')
+
+# DBR type -> struct format of a single element
+_fmt = {1:'!h', 2:'!f', 5:'!i', 6:'!d'}
+
+def load(fname):
+    'Read and check a workload file.  Returns a dict'
+    with open(fname) as F:
+        if fname.endswith(('.yaml', '.yml')):
+            import yaml # optional, only for YAML workloads
+            spec = yaml.safe_load(F)
+        else:
+            spec = json.load(F)
+
+    for K in ('pvs', 'clients', 'phases'):
+        if K not in spec:
+            raise ValueError("%s: missing '%s'"%(fname, K))
+    try:
+        inspect.signature(PVSet).bind(**spec['pvs'])
+    except TypeError as e:
+        raise ValueError("%s: bad 'pvs': %s"%(fname, e))
+    for P in spec['phases']:
+        for K in ('name', 'duration'):
+            if K not in P:
+                raise ValueError("%s: phase missing '%s'"%(fname, K))
+        for pop, L in P.get('load', {}).items():
+            if pop not in spec['clients']:
+                raise ValueError("%s: phase '%s' unknown population '%s'"%(fname, P['name'], pop))
+            bad = set(L)-set(['create', 'monitor', 'rate', 'mix'])
+            if bad:
+                raise ValueError("%s: phase '%s' unknown %s"%(fname, P['name'], sorted(bad)))
+            bad = set(L.get('mix', {}))-set(_ops)
+            if bad:
+                raise ValueError("%s: phase '%s' unknown operation %s"%(fname, P['name'], sorted(bad)))
+    return spec
+
+class Client(object):
+    '''One client of a population.  A circuit and a UDP socket.
+
+    Operations are synchronous, each waiting for its reply.
+    Replies are matched by the circuit reader thread.
+    '''
+    def __init__(self, test, names, seed):
+        self.names, self.timeout = names, test.timeout
+        self.R = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.pending = {} # key -> [Event, reply Msg]
+        self.chans = {} # cid -> CREATE_CHAN reply
+        self.subs = set() # cids with a subscription
+        self.nupdate = 0
+        self.closed = False
+        self.port = test.testport
+        self.dgram = test.sockprof.dgram
+
+        self.U = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        test.sockprof.applyUDP(self.U)
+        self.U.bind(('127.0.0.1', 0))
+        self.U.settimeout(self.timeout)
+        self.C = Circuit(test.testport, self.handle, user=test.user, host=test.host,
+                         timeout=test.timeout, sockprof=test.sockprof)
+
+    def close(self):
+        self.closed = True
+        self.C.close()
+        self.U.close()
+
+    def resolve(self, key, M):
+        with self.lock:
+            E = self.pending.pop(key, None)
+        if E is not None:
+            E[1] = M
+            E[0].set()
+        return E is not None
+
+    def handle(self, circ, M):
+        if M is None:
+            if not self.closed:
+                _log.error("Circuit closed by server")
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            for E in pending.values():
+                E[0].set()
+        elif M.cmd in (18, 26):
+            self.resolve(('create', M.p1), M)
+        elif M.cmd==15:
+            self.resolve(('get', M.p2), M)
+        elif M.cmd==19:
+            self.resolve(('put', M.p2), M)
+        elif M.cmd==12:
+            self.resolve(('clear', M.p2), M)
+        elif M.cmd==1:
+            if not self.resolve(('monitor', M.p2), M):
+                self.nupdate += 1
+        elif M.cmd==11:
+            # body begins with the header of the failed request
+            if len(M.body)<Msg._head.size:
+                _log.error("Error with short body %s", M)
+                return
+            req = Msg.unpack_from(M.body)
+            key = {18:('create', req.p1), 15:('get', req.p2), 19:('put', req.p2)}.get(req.cmd)
+            if key is None or not self.resolve(key, M):
+                _log.error("Error %s", M)
+
+    def start(self, key, msg):
+        'Send request.  Returns [Event, reply]'
+        E = [threading.Event(), None]
+        with self.lock:
+            self.pending[key] = E
+        self.C.send(msg)
+        return E
+
+    def finish(self, E, cmd, stats, op, T0):
+        'Wait for reply of the expected command, and record latency or error'
+        if not E[0].wait(self.timeout) or E[1] is None or E[1].cmd!=cmd or (cmd==19 and E[1].p1!=1):
+            stats['errors'] += 1
+            _log.error("%s failed: %s", op, E[1] or 'timeout')
+            return None
+        stats['lat'].setdefault(op, []).append(now()-T0)
+        return E[1]
+
+    def create(self, N, stats, window=64, T0=None):
+        '''Create N channels, keeping at most window outstanding.
+        Latency is from T0, if given, or from each request
+        '''
+        waiting = []
+        for i in range(N):
+            cid = next(self.ids)
+            waiting.append((cid, now() if T0 is None else T0, self.start(('create', cid),
+                            [Msg(cmd=18, p1=cid, p2=13, body=cstr(self.R.choice(self.names)))])))
+            if len(waiting)>=window or i==N-1:
+                for cid, T1, E in waiting:
+                    rep = self.finish(E, 18, stats, 'create', T1)
+                    if rep is not None:
+                        self.chans[cid] = rep
+                waiting = []
+
+    def monitor(self, N, stats):
+        'Subscribe to the first N channels'
+        waiting = []
+        for cid in sorted(self.chans)[:N]:
+            if cid in self.subs:
+                continue
+            rep = self.chans[cid]
+            ioid = next(self.ids)
+            waiting.append((cid, now(), self.start(('monitor', ioid),
+                            [Msg(cmd=1, dtype=rep.dtype, dcnt=rep.dcnt, p1=rep.p2, p2=ioid,
+                                 body=Msg._sub_body.pack(0.0, 0.0, 0.0, 1))])))
+        for cid, T0, E in waiting:
+            if self.finish(E, 1, stats, 'monitor', T0) is not None:
+                self.subs.add(cid)
+
+    def pick(self, array):
+        'Random channel, scalar or array.  Or None'
+        C = [cid for cid, rep in self.chans.items() if (rep.dcnt>1)==array and rep.dtype in _fmt]
+        return self.R.choice(C) if C else None
+
+    def op(self, op, stats, due):
+        'Perform one operation, which was due at time T0'
+        T0 = due
+        if op in ('search', 'search_missing'):
+            name = self.R.choice(self.names)
+            if op=='search_missing':
+                name = 'no'+name
+            sid = next(self.ids)
+            self.U.sendto(Msg(cmd=0, dcnt=13).pack()+Msg(cmd=6, body=cstr(name), dtype=5, dcnt=13,
+                                                        p1=sid, p2=sid).pack(), ('127.0.0.1', self.port))
+            if op=='search_missing':
+                stats['sent'][op] = stats['sent'].get(op, 0)+1
+                return
+            while True:
+                try:
+                    pkt, _src = self.U.recvfrom(self.dgram)
+                except socket.timeout:
+                    stats['errors'] += 1
+                    _log.error("search timeout")
+                    return
+                P = MsgParser()
+                P.feed(pkt)
+                if [M for M in P if M.cmd==6 and M.p2==sid]:
+                    break # ignore late replies to earlier searches
+            stats['lat'].setdefault(op, []).append(now()-T0)
+
+        elif op=='create':
+            self.create(1, stats, T0=T0)
+
+        elif op=='clear':
+            C = [cid for cid in self.chans if cid not in self.subs]
+            if not C:
+                stats['skipped'] += 1
+                return
+            cid = self.R.choice(C)
+            rep = self.chans.pop(cid)
+            E = self.start(('clear', cid), [Msg(cmd=12, p1=rep.p2, p2=cid)])
+            self.finish(E, 12, stats, op, T0)
+
+        else:
+            cid = self.pick(op=='get_array')
+            if cid is None:
+                stats['skipped'] += 1
+                return
+            rep, ioid = self.chans[cid], next(self.ids)
+            if op=='put':
+                E = self.start(('put', ioid), [Msg(cmd=19, dtype=rep.dtype, dcnt=1, p1=rep.p2, p2=ioid,
+                                                   body=pack(_fmt[rep.dtype], self.R.randint(0, 100)))])
+                self.finish(E, 19, stats, op, T0)
+            else:
+                E = self.start(('get', ioid), [Msg(cmd=15, dtype=rep.dtype, dcnt=rep.dcnt, p1=rep.p2, p2=ioid)])
+                self.finish(E, 15, stats, op, T0)
+
+    def phase(self, load, Tend):
+        'Run one phase.  Returns statistics'
+        stats = {'lat':{}, 'sent':{}, 'errors':0, 'skipped':0}
+        N0 = self.nupdate
+        if load.get('create'):
+            self.create(load['create'], stats)
+        if load.get('monitor'):
+            self.monitor(load['monitor'], stats)
+
+        mix = [op for op, W in sorted(load.get('mix', {}).items()) for i in range(int(W))]
+        rate = float(load.get('rate', 0))
+        if mix and rate>0:
+            due = now()+self.R.random()/rate # spread out clients
+            while not self.closed:
+                delay = due-now()
+                if due>=Tend:
+                    break
+                elif delay>0:
+                    time.sleep(delay)
+                self.op(self.R.choice(mix), stats, due)
+                due += 1.0/rate
+
+        delay = Tend-now()
+        if delay>0:
+            time.sleep(delay)
+        stats['updates'] = self.nupdate-N0
+        return stats
+
+def _run(pop, C, load, Tend, results):
+    'Thread running one phase for client C of population pop'
+    try:
+        results.append((pop, C.phase(load.get(pop, {}), Tend)))
+    except Exception:
+        _log.exception("client of %s", pop)
+        results.append((pop, {'lat':{}, 'sent':{}, 'errors':1, 'skipped':0, 'updates':0}))
+
+class TestWorkload(BenchClient, unittest.TestCase):
+    '''Runs the workload file named by $WORKLOAD.  See the module documentation.
+
+    For each phase, reports total throughput, and the rate and latency of
+    each operation of each population, as well as subscription updates
+    received and errors.  Operations without a reply (search_missing) are
+    reported as a count sent, and not included in the throughput.
+    Fails if there were any errors.
+    '''
+    timeout = 5.0
+    default = os.path.join(os.path.dirname(__file__), 'workload.json')
+
+    def setUp(self):
+        self.fname = os.environ.get('WORKLOAD', self.default)
+        self.spec = load(self.fname)
+        self.pvs = PVSet(**self.spec['pvs'])
+        super().setUp()
+
+    def test_workload(self):
+        'Workload phases'
+        names = self.pvs.names()
+        clients = {}
+        self.addCleanup(lambda:[C.close() for L in clients.values() for C in L])
+        seed = itertools.count()
+        for pop, P in sorted(self.spec['clients'].items()):
+            clients[pop] = [Client(self, names, next(seed)) for i in range(P.get('count', 1))]
+
+        errors = 0
+        for P in self.spec['phases']:
+            load, results = P.get('load', {}), []
+            T0 = now()
+            Tend = T0+P['duration']
+            threads = [threading.Thread(target=_run, args=(pop, C, load, Tend, results))
+                       for pop, L in sorted(clients.items()) for C in L]
+            for T in threads:
+                T.start()
+            for T in threads:
+                T.join()
+            T1 = now()
+
+            phase, extra = P['name'], {'phase':P['name'], 'workload':os.path.basename(self.fname)}
+            ops, sent = {}, {}
+            for pop, S in results:
+                for op, L in S['lat'].items():
+                    ops.setdefault((pop, op), []).extend(L)
+                for op, N in S['sent'].items():
+                    sent[(pop, op)] = sent.get((pop, op), 0)+N
+            nerr = sum([S['errors'] for _pop, S in results])
+            total = sum([len(L) for L in ops.values()])
+            self.report('throughput', value=total/(T1-T0), unit='op/s', case=phase, **extra)
+            self.report('update_rate', value=sum([S['updates'] for _pop, S in results])/(T1-T0),
+                        unit='update/s', case=phase, **extra)
+            self.report('phase_time', value=T1-T0, unit='s', case=phase, planned=P['duration'], **extra)
+            self.report('errors', value=nerr, unit='', case=phase,
+                        skipped=sum([S['skipped'] for _pop, S in results]), **extra)
+            for (pop, op), L in sorted(ops.items()):
+                case = '%s %s %s'%(phase, pop, op)
+                self.report('op_rate', value=len(L)/(T1-T0), unit='op/s', case=case,
+                            population=pop, op=op, **extra)
+                self.report('latency', samples=L, unit='s', case=case, population=pop, op=op, **extra)
+            for (pop, op), N in sorted(sent.items()):
+                self.report('sent', value=N, unit='msg', case='%s %s %s'%(phase, pop, op),
+                            population=pop, op=op, **extra)
+            errors += nerr
+
+        self.assertEqual(errors, 0)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
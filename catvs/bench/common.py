@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""Helpers shared by benchmark scenarios
+"""
+
+import sys, os, socket, json, math, time, threading, platform, logging
+from time import perf_counter as now
+
+from ..util import TestClient, Msg, MsgParser, SockProfile
+
+_log = logging.getLogger(__name__)
+
+__all__ = [
+    'now',
+    'cstr',
+    'percentile',
+    'summarize',
+    'linfit',
+    'Circuit',
+    'MockPeer',
+    'BenchReport',
+    'BenchClient',
+]
+
+def cstr(name):
+    'Nil terminated bytes.  Msg only pads to a multiple of 8'
+    if not isinstance(name, bytes):
+        name = name.encode()
+    return name+b'\0'
+
+def percentile(samples, P):
+    'Linear interpolated percentile of a sorted list of samples'
+    if not samples:
+        return float('nan')
+    X = (len(samples)-1)*P/100.0
+    L = int(math.floor(X))
+    H = min(L+1, len(samples)-1)
+    return samples[L] + (samples[H]-samples[L])*(X-L)
+
+def summarize(samples):
+    'Summary statistics of a list of samples'
+    S = sorted(samples)
+    N = len(S)
+    mean = sum(S)/float(N) if N else float('nan')
+    std = math.sqrt(sum([(X-mean)**2 for X in S])/(N-1)) if N>1 else 0.0
+    return {
+        'n':N,
+        'mean':mean,
+        'std':std,
+        'min':S[0] if N else float('nan'),
+        'p50':percentile(S, 50),
+        'p90':percentile(S, 90),
+        'p99':percentile(S, 99),
+        'max':S[-1] if N else float('nan'),
+    }
+
+def linfit(X, Y):
+    'Least squares fit of Y = slope*X + intercept.  Returns (slope, intercept)'
+    N = float(len(X))
+    mX, mY = sum(X)/N, sum(Y)/N
+    SXX = sum([(x-mX)**2 for x in X])
+    SXY = sum([(x-mX)*(y-mY) for x, y in zip(X, Y)])
+    slope = SXY/SXX if SXX else 0.0
+    return slope, mY-slope*mX
+
+class Circuit(object):
+    '''A TCP circuit which may be shared by several threads.
+
+    A reader thread parses messages and passes each to handler(circuit, Msg),
+    then handler(circuit, None) when the circuit is closed.
+    send() may be called from any thread.
+    Socket options are from 'sockprof', a SockProfile.
+    '''
+    def __init__(self, port, handler, user=b'foo', host=b'localhost', cver=13, timeout=5.0,
+                 sockprof=None):
+        self.handler = handler
+        self.sockprof = sockprof or SockProfile.fromEnv()
+        self.sock = self.sockprof.connect(('127.0.0.1', port), timeout)
+        self.sock.settimeout(None) # reader blocks until close()
+        self.lock = threading.Lock()
+        self.rx = MsgParser()
+        self.reader = threading.Thread(target=self._run, name='circuit %d'%self.sock.fileno())
+        self.reader.daemon = True
+        self.reader.start()
+        self.send([
+            Msg(cmd=0, dcnt=cver),
+            Msg(cmd=20, body=cstr(user)),
+            Msg(cmd=21, body=cstr(host)),
+        ])
+
+    def send(self, msg):
+        pkt = b''.join([M.pack() for M in msg])
+        with self.lock:
+            self.sock.sendall(pkt)
+
+    def _run(self):
+        try:
+            while True:
+                B = self.sock.recv(self.sockprof.chunk)
+                if not B:
+                    break
+                self.rx.feed(B)
+                for M in self.rx:
+                    self.handler(self, M)
+        except socket.error:
+            pass # closed
+        finally:
+            self.handler(self, None)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR) # wake reader
+        except socket.error:
+            pass
+        self.reader.join()
+        self.sock.close()
+
+class MockPeer(object):
+    '''In-process TCP peer for benchmarks of the harness itself.
+
+    'client' is one end of a loopback TCP connection, to be used as
+    a harness circuit.  A thread writes 'blob' to the other end 'repeat'
+    times, as fast as the client reads, then closes.  Anything sent by
+    the client is read and discarded.
+    '''
+    def __init__(self, blob, repeat=1, sockprof=None):
+        self.blob, self.repeat = blob, repeat
+        sockprof = sockprof or SockProfile.fromEnv()
+        L = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sockprof.applyTCP(L)
+            L.bind(('127.0.0.1', 0))
+            L.listen(1)
+            self.client = sockprof.connect(L.getsockname(), 5.0)
+            self.peer, _addr = L.accept()
+        finally:
+            L.close()
+        self.threads = [threading.Thread(target=self._write), threading.Thread(target=self._drain)]
+        for T in self.threads:
+            T.daemon = True
+            T.start()
+
+    def _write(self):
+        try:
+            for i in range(self.repeat):
+                self.peer.sendall(self.blob)
+            self.peer.shutdown(socket.SHUT_WR)
+        except socket.error:
+            pass # client closed early
+
+    def _drain(self):
+        try:
+            while self.peer.recv(65536):
+                pass
+        except socket.error:
+            pass
+
+    def close(self):
+        self.client.close()
+        for T in self.threads:
+            T.join()
+        self.peer.close()
+
+class BenchReport(object):
+    '''Results of benchmark scenarios.
+
+    Results are passed to report(), which writes a summary to stderr,
+    and appends a JSON line to the file named by $BENCHOUT (if set).
+    A scenario which reports a metric for several parameters (eg. each
+    DBR type) distinguishes them with 'case'.
+    '''
+    def report(self, metric, value=None, samples=None, unit='', case='', **extra):
+        R = {
+            'scenario':self.id(),
+            'metric':metric,
+            'case':case,
+            'unit':unit,
+            'dut':self.dut,
+            'time':time.time(),
+            'python':platform.python_version(),
+            'sockprofile':self.sockprof.asdict(),
+        }
+        R.update(extra)
+        name = '%s %s'%(self.id(), metric) + ('[%s]'%case if case else '')
+        if samples is not None:
+            R.update(summarize(samples))
+            sys.stderr.write('%s: n=%d p50=%g p90=%g p99=%g %s\n'%(name,
+                             R['n'], R['p50'], R['p90'], R['p99'], unit))
+        else:
+            R['value'] = value
+            sys.stderr.write('%s: %g %s\n'%(name, value, unit))
+
+        if self.prof is not None:
+            R['harness_overhead'] = self.prof.overhead()
+            N, cpu, _wait = self.prof.totals()
+            if unit=='s' and samples and N and cpu/N > self.prof.maxoverhead*R['p50']:
+                _log.warning("%s %s: harness CPU per message (%g s) is a large fraction of median latency (%g s)",
+                             self.id(), metric, cpu/N, R['p50'])
+
+        fname = os.environ.get('BENCHOUT')
+        if fname:
+            with open(fname, 'a') as F:
+                F.write(json.dumps(R, sort_keys=True)+'\n')
+        return R
+
+class BenchClient(BenchReport, TestClient):
+    '''Base for benchmark scenarios run against the DUT.  See BenchReport
+    '''
+    user = b'foo'
+    host = socket.gethostname().encode()
+
+    def openCircuit(self, cver=13):
+        'Open TCP connection and sent version and auth info'
+        self.connectTCP()
+        self.sendTCP([
+            Msg(cmd=0, dcnt=cver),
+            Msg(cmd=20, body=cstr(self.user)),
+            Msg(cmd=21, body=cstr(self.host)),
+        ])
+
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=0)
+        self.sver = rep.dcnt
+
+    def pipelineTCP(self, reqs, match, window=64):
+        '''Send requests while keeping at most 'window' outstanding.
+
+        'reqs' is a sequence of (key, Msg).  Each reply received is passed
+        to match(), which returns the key of the completed request, or None.
+        Returns a dict of key -> (send time, reply time, reply Msg)
+        '''
+        pending, done = {}, {}
+        reqs = iter(reqs)
+        more = True
+        while True:
+            batch = []
+            while more and len(pending)+len(batch)<window:
+                try:
+                    batch.append(next(reqs))
+                except StopIteration:
+                    more = False
+            if batch:
+                T = now()
+                for key, _M in batch:
+                    pending[key] = T
+                self.sendTCP([M for _key, M in batch])
+
+            if not pending:
+                break
+
+            rep = self.recvTCP()
+            if rep is None:
+                raise RuntimeError("Circuit closed with %d requests pending"%len(pending))
+            T = now()
+            key = match(rep)
+            if key is not None:
+                done[key] = (pending.pop(key), T, rep)
+        return done
+
+    def createChannels(self, names, cid0=1, window=64):
+        '''Create a channel for each name on the current circuit.
+
+        Returns a dict of cid -> (send time, reply time, reply Msg)
+        where the reply is CREATE_CHAN or CREATE_CH_FAIL.
+        '''
+        def match(M):
+            if M.cmd in (18, 26):
+                return M.p1
+            elif M.cmd==11:
+                raise RuntimeError("Error during channel create %s"%M)
+        reqs = [(cid0+i, Msg(cmd=18, p1=cid0+i, p2=13, body=cstr(name))) for i, name in enumerate(names)]
+        return self.pipelineTCP(reqs, match, window=window)
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""History of benchmark and test results, and trend reports
+
+  python -m catvs.bench.history ingest --repo /path/to/base --branch 7.0 bench.jsonl results.jsonl
+  python -m catvs.bench.history report -o trends.html
+
+ingest adds results to a SQLite database (default history.db).  Accepts the
+JSON lines written by benchmarks ($BENCHOUT), and by catvs.results (test
+durations and DUT startup time).  Each result is keyed by
+
+  rev         - git revision under test.  --rev, or HEAD of the --repo checkout
+  branch      - EPICS branch, eg. "7.0" or "3.15"
+  dut         - $DUT command, or --dut to give a shorter name
+  python      - Python version which ran the harness
+  sockprofile - socket options (see SockProfile in catvs/util.py)
+
+Revisions are plotted in the order of 'seq', which is the commit time of
+the revision in --repo, or given with --seq.  So results of an old revision,
+ingested later, are plotted in their place.  Ingesting the same file twice
+has no effect.
+
+report writes a static HTML page, with no external dependencies, plotting
+each metric over revisions, for each combination of keys.  Where several
+results exist for one revision, the median is plotted.  A change point is
+marked where the mean of the next 'window' revisions differs from the
+previous 'window' by Welch's t-test, and by more than --min-change.
+"""
+
+import sys, json, time, sqlite3, subprocess, logging
+from html import escape
+from .matrix import welch, _stats, _better
+
+_log = logging.getLogger(__name__)
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS result (
+    rev TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    dut TEXT NOT NULL,
+    python TEXT NOT NULL,
+    sockprofile TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    scenario TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    casename TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    time REAL NOT NULL,
+    value REAL,
+    p50 REAL,
+    p90 REAL,
+    p99 REAL,
+    n INTEGER,
+    extra TEXT,
+    seq REAL,
+    UNIQUE(rev, branch, dut, scenario, metric, casename, time)
+);
+CREATE INDEX IF NOT EXISTS result_series ON result(scenario, metric, casename);
+'''
+
+_key = ('scenario', 'metric', 'casename', 'unit', 'dut', 'branch', 'python', 'sockprofile')
+
+def connect(fname):
+    db = sqlite3.connect(fname)
+    db.executescript(_schema)
+    if 'seq' not in [C[1] for C in db.execute('PRAGMA table_info(result)')]:
+        db.execute('ALTER TABLE result ADD COLUMN seq REAL') # database from before 'seq'
+    return db
+
+def _profile(sp):
+    'eg. {"name":"ca", "nodelay":1} -> "ca,nodelay=1"'
+    if not sp:
+        return ''
+    sp = dict(sp)
+    return ','.join([sp.pop('name', '')]+['%s=%s'%(K, V) for K, V in sorted(sp.items())])
+
+def gitrev(path='.'):
+    'Returns the short revision of HEAD, or "unknown"'
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=path,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def gitseq(rev, path='.'):
+    'Returns the commit time of rev, as a POSIX timestamp, or None'
+    try:
+        return float(subprocess.check_output(['git', 'show', '-s', '--format=%ct', rev], cwd=path,
+                                             stderr=subprocess.DEVNULL).decode().strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+def rows(R):
+    '''Convert one JSON result record into a list of dicts, one for each row.
+
+    Benchmark records have 'scenario' and 'metric'.  Test records (from
+    catvs.results) have 'id' and 'outcome', and give duration and dut_startup rows.
+    '''
+    common = {
+        'dut':R.get('dut') or '',
+        'python':R.get('python') or '',
+        'sockprofile':_profile(R.get('sockprofile')),
+    }
+    if 'metric' in R:
+        common.update({
+            'kind':'bench',
+            'scenario':R['scenario'],
+            'metric':R['metric'],
+            'casename':R.get('case', ''),
+            'unit':R.get('unit', ''),
+            'time':R['time'],
+            'value':R.get('value'),
+            'p50':R.get('p50'),
+            'p90':R.get('p90'),
+            'p99':R.get('p99'),
+            'n':R.get('n'),
+        })
+        known = set(['scenario', 'metric', 'case', 'unit', 'dut', 'time', 'python', 'sockprofile',
+                     'value', 'p50', 'p90', 'p99', 'n'])
+        common['extra'] = json.dumps(dict([(K, V) for K, V in R.items() if K not in known]), sort_keys=True)
+        return [common]
+
+    elif 'outcome' in R:
+        ret = []
+        extra = json.dumps({'outcome':R['outcome']})
+        for metric in ('duration', 'dut_startup'):
+            if R.get(metric) is not None:
+                E = dict(common)
+                E.update({'kind':'test', 'scenario':R['id'], 'metric':metric, 'casename':'',
+                          'unit':'s', 'time':R['start'], 'value':R[metric], 'extra':extra})
+                ret.append(E)
+        return ret
+
+    raise ValueError("Not a result record: %r"%R)
+
+def ingest(db, records, rev, branch='', dut=None, seq=None):
+    '''Add result records of revision rev, which is at 'seq' in the order of revisions.
+    Returns the number of new rows
+    '''
+    cols = ('rev', 'branch', 'dut', 'python', 'sockprofile', 'kind', 'scenario', 'metric', 'casename',
+            'unit', 'time', 'value', 'p50', 'p90', 'p99', 'n', 'extra', 'seq')
+    sql = 'INSERT OR IGNORE INTO result (%s) VALUES (%s)'%(','.join(cols), ','.join(['?']*len(cols)))
+    N = 0
+    with db:
+        for R in records:
+            for E in rows(R):
+                E.update({'rev':rev, 'branch':branch, 'seq':seq})
+                if dut is not None:
+                    E['dut'] = dut
+                N += db.execute(sql, [E.get(C) for C in cols]).rowcount
+    return N
+
+def _median(X):
+    X = sorted(X)
+    N = len(X)
+    return X[N//2] if N%2 else 0.5*(X[N//2-1]+X[N//2])
+
+def series(db):
+    '''Returns a dict of key -> [(rev, time, value), ...] in order of revision.
+
+    The key is a tuple of the _key columns.  Each point is the median of the
+    results for one revision, at the time of the first.  Revisions are
+    ordered by 'seq', or by the time of the first result if it is not known.
+    '''
+    ret = {}
+    cur = db.execute('SELECT %s, rev, time, coalesce(value, p50), seq FROM result ORDER BY time'%','.join(_key))
+    for row in cur:
+        key, (rev, T, V, seq) = row[:len(_key)], row[len(_key):]
+        if V is None:
+            continue
+        S = ret.setdefault(key, {})
+        P = S.get(rev)
+        if P is None:
+            S[rev] = P = [T, T if seq is None else seq, []]
+        P[2].append(V)
+    for key, S in ret.items():
+        ret[key] = [(rev, T, _median(V)) for rev, (T, _seq, V) in
+                    sorted(S.items(), key=lambda E:(E[1][1], E[1][0]))]
+    return ret
+
+def changepoints(values, window=5, alpha=0.01, minchange=0.05):
+    '''Indices of the first value after each change point.
+
+    Compares the 'window' values before each index with the 'window' from it.
+    Of nearby candidates, the one with the smallest p-value is kept.
+    Returns a list of (index, mean before, mean after, p-value)
+    '''
+    cand = []
+    for i in range(2, len(values)-1):
+        m1, s1, n1 = _stats(values[max(0, i-window):i])
+        m2, s2, n2 = _stats(values[i:i+window])
+        if n1<2 or n2<2 or not m1:
+            continue
+        _t, p = welch(m2, s2, n2, m1, s1, n1)
+        if p<alpha and abs(m2/m1-1.0)>=minchange:
+            cand.append((i, m1, m2, p))
+
+    ret = []
+    for C in cand:
+        near = [D for D in cand if abs(D[0]-C[0])<window]
+        if min(near, key=lambda D:(D[3], D[0]))==C:
+            ret.append(C)
+    return ret
+
+def _svg(points, changes, unit, width=640, height=140, pad=30):
+    V = [P[2] for P in points]
+    lo, hi = min(V), max(V)
+    if hi==lo:
+        lo, hi = lo-1.0, hi+1.0
+    N = max(len(points)-1, 1)
+    def X(i):
+        return pad+(width-2*pad)*i/float(N)
+    def Y(v):
+        return height-pad-(height-2*pad)*(v-lo)/(hi-lo)
+
+    L = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d">'%(width, height),
+         '<rect x="%d" y="%d" width="%d" height="%d" fill="none" stroke="#ccc"/>'%(
+             pad, pad//2, width-2*pad, height-pad-pad//2),
+         '<text x="2" y="%d" font-size="10">%.4g</text>'%(pad//2+8, hi),
+         '<text x="2" y="%d" font-size="10">%.4g</text>'%(height-pad, lo)]
+    for i, m1, m2, _p in changes:
+        better = _better(unit, m2/m1)
+        color = {True:'green', False:'red', None:'orange'}[better]
+        L.append('<line x1="%.1f" y1="%d" x2="%.1f" y2="%d" stroke="%s" stroke-dasharray="4,2"/>'%(
+                 X(i-0.5), pad//2, X(i-0.5), height-pad, color))
+    L.append('<polyline fill="none" stroke="#36c" points="%s"/>'%' '.join(
+             ['%.1f,%.1f'%(X(i), Y(P[2])) for i, P in enumerate(points)]))
+    for i, (rev, T, v) in enumerate(points):
+        L.append('<circle cx="%.1f" cy="%.1f" r="2.5" fill="#36c"><title>%s %s %.4g %s</title></circle>'%(
+                 X(i), Y(v), escape(rev), time.strftime('%Y-%m-%d', time.localtime(T)), v, escape(unit)))
+    for i in (0, len(points)-1):
+        L.append('<text x="%.1f" y="%d" font-size="10" text-anchor="middle">%s</text>'%(
+                 X(i), height-pad+14, escape(points[i][0])))
+    L.append('</svg>')
+    return '\n'.join(L)
+
+def html(allseries, window=5, alpha=0.01, minchange=0.05):
+    L = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>CA performance history</title>',
+         '<style>',
+         'table {border-collapse: collapse} td, th {border: 1px solid #ccc; padding: 2px 6px}',
+         '.better {background: #c8f0c8} .worse {background: #f0c8c8} .differ {background: #f0f0b0}',
+         'div.series {margin: 1em 0} p.key {margin: 0; font-family: monospace}',
+         '</style></head><body>',
+         '<h1>CA performance history</h1>']
+
+    found, body = [], []
+    for n, key in enumerate(sorted(allseries)):
+        points = allseries[key]
+        K = dict(zip(_key, key))
+        changes = changepoints([P[2] for P in points], window=window, alpha=alpha, minchange=minchange)
+        name = '%s %s'%(K['scenario'], K['metric'])+('[%s]'%K['casename'] if K['casename'] else '')
+        for i, m1, m2, p in changes:
+            found.append((n, name, K, points[i][0], m1, m2, p))
+        body.extend(['<div class="series" id="s%d">'%n, '<h3>%s</h3>'%escape(name),
+                     '<p class="key">dut=%s branch=%s python=%s sockprofile=%s</p>'%tuple(
+                         [escape(K[C]) for C in ('dut', 'branch', 'python', 'sockprofile')]),
+                     _svg(points, changes, K['unit']), '</div>'])
+
+    L.append('<h2>Change points</h2>')
+    if found:
+        L.append('<table><tr><th>Series</th><th>DUT</th><th>Revision</th><th>Before</th><th>After</th>'
+                 '<th>Ratio</th><th>p</th></tr>')
+        for n, name, K, rev, m1, m2, p in found:
+            cls = {True:'better', False:'worse', None:'differ'}[_better(K['unit'], m2/m1)]
+            L.append('<tr class="%s"><td><a href="#s%d">%s</a></td><td>%s</td><td>%s</td>'
+                     '<td>%.4g</td><td>%.4g</td><td>x%.2f</td><td>%.2g</td></tr>'%(
+                     cls, n, escape(name), escape(K['dut']), escape(rev), m1, m2, m2/m1, p))
+        L.append('</table>')
+    else:
+        L.append('<p>None</p>')
+    L.append('<h2>Series</h2>')
+    L.extend(body)
+    L.append('</body></html>')
+    return '\n'.join(L)+'\n'
+
+def main(args=None):
+    import argparse
+    P = argparse.ArgumentParser(description='History of benchmark and test results')
+    P.add_argument('--db', default='history.db', help='SQLite database file')
+    SP = P.add_subparsers(dest='action')
+
+    I = SP.add_parser('ingest', help='Add JSON lines result files')
+    I.add_argument('files', nargs='+')
+    I.add_argument('--repo', help='git checkout of the EPICS source under test')
+    I.add_argument('--rev', help='Revision under test.  Default is HEAD of --repo')
+    I.add_argument('--seq', type=float,
+                   help='Order of this revision.  Default is its commit time in --repo')
+    I.add_argument('--branch', default='', help='EPICS branch under test')
+    I.add_argument('--dut', help='Name of the DUT, instead of the $DUT command recorded')
+
+    R = SP.add_parser('report', help='Write HTML trend report')
+    R.add_argument('-o', '--output', default='history.html')
+    R.add_argument('--window', type=int, default=5, help='Revisions compared either side of a change point')
+    R.add_argument('--alpha', type=float, default=0.01, help='Significance level of change points')
+    R.add_argument('--min-change', type=float, default=0.05, help='Smallest relative change point')
+
+    args = P.parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+
+    db = connect(args.db)
+    if args.action=='ingest':
+        if not args.repo and (args.rev is None or args.seq is None):
+            P.error('ingest needs --repo, or both --rev and --seq')
+        rev = args.rev or gitrev(args.repo)
+        seq = args.seq if args.seq is not None else gitseq(rev, args.repo)
+        if rev=='unknown' or seq is None:
+            P.error('%s is not a revision of %s'%(rev, args.repo))
+        for fname in args.files:
+            with open(fname) as F:
+                N = ingest(db, [json.loads(L) for L in F if L.strip()], rev, branch=args.branch, dut=args.dut,
+                           seq=seq)
+            _log.info("%s: %d new results for %s", fname, N, rev)
+    elif args.action=='report':
+        with open(args.output, 'w') as F:
+            F.write(html(series(db), window=args.window, alpha=args.alpha, minchange=args.min_change))
+    else:
+        P.print_help()
+        sys.exit(1)
+
+if __name__=='__main__':
+    main()
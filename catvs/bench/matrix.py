@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Run benchmark scenarios against several servers and compare
+
+  python -m catvs.bench.matrix matrix.json -o report
+
+Writes report.json and report.html .  The configuration file lists
+the servers (DUT) to compare, with the environment for each.
+
+  {
+    "repeat": 3,
+    "tests": ["catvs.bench.bench_search.TestSearchBatch"],
+    "duts": [
+      {"name": "3.15", "DUT": "/path/to/wrapioc.sh", "SOFTIOC": "/path/to/3.15/softIoc"},
+      {"name": "7.0", "DUT": "/path/to/wrapioc.sh", "SOFTIOC": "/path/to/7.0/softIoc"},
+      {"name": "pcas", "DUT": "/path/to/pcas", "env": {"EPICS_CAS_INTF_ADDR_LIST": "localhost"}}
+    ]
+  }
+
+"tests" defaults to all bench_*.py scenarios.  The first server is the
+baseline.  Each result is compared with the baseline using Welch's t-test
+over the repeated runs (or the samples of a single run).
+"""
+
+import sys, os, json, math, subprocess, tempfile, logging
+from html import escape
+
+_log = logging.getLogger(__name__)
+
+_top = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _betacf(a, b, x):
+    'Continued fraction for the incomplete beta function'
+    qab, qap, qam = a+b, a+1.0, a-1.0
+    c, d = 1.0, 1.0-qab*x/qap
+    d = 1.0/(d or 1e-30)
+    h = d
+    for m in range(1, 201):
+        m2 = 2*m
+        aa = m*(b-m)*x/((qam+m2)*(a+m2))
+        d = 1.0+aa*d
+        d = 1.0/(d or 1e-30)
+        c = 1.0+aa/(c or 1e-30)
+        h *= d*c
+        aa = -(a+m)*(qab+m)*x/((a+m2)*(qap+m2))
+        d = 1.0+aa*d
+        d = 1.0/(d or 1e-30)
+        c = 1.0+aa/(c or 1e-30)
+        D = d*c
+        h *= D
+        if abs(D-1.0)<1e-12:
+            break
+    return h
+
+def _betai(a, b, x):
+    'Regularized incomplete beta function'
+    if x<=0.0:
+        return 0.0
+    elif x>=1.0:
+        return 1.0
+    bt = math.exp(math.lgamma(a+b)-math.lgamma(a)-math.lgamma(b)+a*math.log(x)+b*math.log(1.0-x))
+    if x<(a+1.0)/(a+b+2.0):
+        return bt*_betacf(a, b, x)/a
+    else:
+        return 1.0-bt*_betacf(b, a, 1.0-x)/b
+
+def welch(m1, s1, n1, m2, s2, n2):
+    'Welch two sample t-test.  Returns (t, two sided p-value)'
+    if n1<2 or n2<2:
+        return float('nan'), float('nan')
+    v1, v2 = s1*s1/n1, s2*s2/n2
+    if v1+v2==0.0:
+        return (0.0, 1.0) if m1==m2 else (float('inf'), 0.0)
+    t = (m1-m2)/math.sqrt(v1+v2)
+    df = (v1+v2)**2/(v1*v1/(n1-1)+v2*v2/(n2-1))
+    return t, _betai(0.5*df, 0.5, df/(df+t*t))
+
+def _stats(X):
+    N = len(X)
+    mean = sum(X)/N
+    std = math.sqrt(sum([(x-mean)**2 for x in X])/(N-1)) if N>1 else 0.0
+    return mean, std, N
+
+def run(config, python=sys.executable):
+    'Run each configured server.  Returns the list of result records'
+    tests = config.get('tests') or ['discover', '-p', 'bench_*.py', 'catvs.bench']
+    records = []
+    for dut in config['duts']:
+        for rep in range(config.get('repeat', 1)):
+            env = os.environ.copy()
+            env.update(dut.get('env', {}))
+            for K in ('DUT', 'SOFTIOC'):
+                if K in dut:
+                    env[K] = dut[K]
+            env['PYTHONPATH'] = os.pathsep.join([_top]+[P for P in [env.get('PYTHONPATH')] if P])
+
+            with tempfile.NamedTemporaryFile(suffix='.jsonl') as F:
+                env['BENCHOUT'] = F.name
+                _log.info("Run %d of %s", rep, dut['name'])
+                ret = subprocess.call([python, '-m', 'unittest']+tests, env=env)
+                if ret:
+                    _log.warning("Run %d of %s exit with %d", rep, dut['name'], ret)
+                with open(F.name) as R:
+                    for L in R:
+                        rec = json.loads(L)
+                        rec.update({'server':dut['name'], 'run':rep, 'exitcode':ret})
+                        records.append(rec)
+    return records
+
+def compare(names, records, alpha=0.05):
+    '''Group records by scenario, metric, and case and compare each server with the first.
+
+    Returns a list of dicts, one for each scenario, metric, and case.
+    '''
+    groups = {}
+    for R in records:
+        key = (R['scenario'], R['metric'], R.get('case', ''))
+        G = groups.setdefault(key, {'unit':R.get('unit', ''), 'runs':{}})
+        G['runs'].setdefault(R['server'], []).append(R)
+
+    ret = []
+    for (scenario, metric, case), G in sorted(groups.items()):
+        E = {'scenario':scenario, 'metric':metric, 'case':case, 'unit':G['unit'], 'servers':{}}
+        for name, runs in G['runs'].items():
+            if len(runs)==1 and 'mean' in runs[0]:
+                R = runs[0]
+                mean, std, N = R['mean'], R['std'], R['n']
+            else:
+                mean, std, N = _stats([R['value'] if 'value' in R else R['mean'] for R in runs])
+            E['servers'][name] = {'mean':mean, 'std':std, 'n':N}
+
+        base = E['servers'].get(names[0])
+        for name, S in E['servers'].items():
+            if base is None or name==names[0]:
+                continue
+            t, p = welch(S['mean'], S['std'], S['n'], base['mean'], base['std'], base['n'])
+            S.update({
+                'ratio':S['mean']/base['mean'] if base['mean'] else float('nan'),
+                't':t,
+                'p':p,
+                'significant':p<alpha,
+            })
+        ret.append(E)
+    return ret
+
+def _better(unit, ratio):
+    'Returns True if ratio>1 is better for this unit, False if worse, or None if unknown'
+    if unit.endswith('/s'):
+        return ratio>1.0
+    elif unit=='s':
+        return ratio<1.0
+    return None
+
+def html(names, results):
+    L = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>CA server comparison</title>',
+         '<style>',
+         'table {border-collapse: collapse} td, th {border: 1px solid #ccc; padding: 2px 6px}',
+         'td {text-align: right} td.name {text-align: left}',
+         '.better {background: #c8f0c8} .worse {background: #f0c8c8} .differ {background: #f0f0b0}',
+         '</style></head><body>',
+         '<h1>CA server comparison</h1>',
+         '<p>Baseline is %s.  Highlighted cells differ significantly from the baseline.</p>'%escape(names[0]),
+         '<table><tr><th>Scenario</th><th>Metric</th><th>Case</th><th>Unit</th>']
+    L.extend(['<th>%s</th>'%escape(N) for N in names])
+    L.append('</tr>')
+    for E in results:
+        L.append('<tr><td class="name">%s</td><td class="name">%s</td><td class="name">%s</td><td class="name">%s</td>'%(
+                 escape(E['scenario']), escape(E['metric']), escape(E.get('case', '')), escape(E['unit'])))
+        for N in names:
+            S = E['servers'].get(N)
+            if S is None:
+                L.append('<td>-</td>')
+                continue
+            cls, note = '', ''
+            if 'ratio' in S:
+                note = ' (x%.2f, p=%.2g)'%(S['ratio'], S['p'])
+                if S['significant']:
+                    better = _better(E['unit'], S['ratio'])
+                    cls = {True:'better', False:'worse', None:'differ'}[better]
+            L.append('<td class="%s">%.4g &plusmn; %.2g%s</td>'%(cls, S['mean'], S['std'], note))
+        L.append('</tr>')
+    L.append('</table></body></html>')
+    return '\n'.join(L)+'\n'
+
+def main(args=None):
+    import argparse
+    P = argparse.ArgumentParser(description='Compare benchmark results across CA servers')
+    P.add_argument('config', help='JSON file listing servers')
+    P.add_argument('-o', '--output', default='matrix', help='Output file name prefix')
+    P.add_argument('--alpha', type=float, default=0.05, help='Significance level')
+    P.add_argument('--records', help='Reuse records saved by a previous run instead of running')
+    args = P.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+
+    with open(args.config) as F:
+        config = json.load(F)
+    names = [D['name'] for D in config['duts']]
+
+    if args.records:
+        with open(args.records) as F:
+            records = json.load(F)['records']
+    else:
+        records = run(config)
+
+    results = compare(names, records, alpha=args.alpha)
+
+    with open(args.output+'.json', 'w') as F:
+        json.dump({'servers':names, 'results':results, 'records':records}, F, indent=1, sort_keys=True)
+    with open(args.output+'.html', 'w') as F:
+        F.write(html(names, results))
+
+if __name__=='__main__':
+    main()
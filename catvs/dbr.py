@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Encode and decode DBR payloads
+
+Covers the plain, STS, TIME, GR, and CTRL types (0-34).
+Layouts follow db_access.h, including the RISC_pad members.
+"""
+
+from struct import Struct
+
+__all__ = [
+    'DBR',
+    'dbrname',
+    'dbrclass',
+    'dbrsize',
+    'decode',
+    'encode',
+]
+
+# seconds between the POSIX and EPICS epochs
+POSIX_TIME_AT_EPICS_EPOCH = 631152000
+
+_base = ['STRING', 'SHORT', 'FLOAT', 'ENUM', 'CHAR', 'LONG', 'DOUBLE']
+_class = ['', 'STS_', 'TIME_', 'GR_', 'CTRL_']
+
+# struct format of one element of each base type
+_elem = ['40s', 'h', 'f', 'H', 'B', 'i', 'd']
+
+_limits = [
+    'upper_disp_limit', 'lower_disp_limit',
+    'upper_alarm_limit', 'upper_warning_limit',
+    'lower_warning_limit', 'lower_alarm_limit',
+    'upper_ctrl_limit', 'lower_ctrl_limit',
+]
+
+def _meta(dtype):
+    'Returns (struct format, field names) of the meta-data preceding the value'
+    base, cls = dtype%7, dtype//7
+    if cls==0:
+        return '', []
+
+    fmt, names = 'hh', ['status', 'severity']
+    if cls==2:
+        fmt += 'II' + {1:'2x', 3:'2x', 4:'3x', 6:'4x'}.get(base, '')
+        names += ['secs', 'nsec']
+    elif cls==1 or base==0:
+        # STS_*, and GR/CTRL_STRING which are the same as STS_STRING
+        fmt += {4:'x', 6:'4x'}.get(base, '')
+    elif base==3:
+        # GR_ENUM and CTRL_ENUM
+        fmt += 'h' + '26s'*16
+        names += ['no_str'] + ['str%d'%i for i in range(16)]
+    else:
+        nlim = 6 if cls==3 else 8
+        if base in (2, 6):
+            fmt += 'h2x'
+            names += ['precision']
+        fmt += '8s' + _elem[base]*nlim + ('x' if base==4 else '')
+        names += ['units'] + _limits[:nlim]
+    return fmt, names
+
+_layout = [(Struct('!'+F), N) for F, N in [_meta(D) for D in range(35)]]
+
+def _values(base, n):
+    'Struct for n elements of a base type'
+    if base==0:
+        return Struct('!'+'40s'*n)
+    return Struct('!%d%s'%(n, _elem[base]))
+
+def dbrname(dtype):
+    'eg. 19 -> "DBR_TIME_LONG"'
+    return 'DBR_'+_class[dtype//7]+_base[dtype%7]
+
+def dbrclass(dtype):
+    'One of "", "STS", "TIME", "GR", or "CTRL"'
+    return _class[dtype//7].rstrip('_')
+
+def dbrsize(dtype, dcnt):
+    'Payload size in bytes (before padding) of dcnt elements'
+    return _layout[dtype][0].size + _values(dtype%7, 1).size*dcnt
+
+class DBR(object):
+    '''A decoded DBR payload.
+
+    'value' is a list of dcnt elements (bytes for DBR_STRING).
+    Meta-data fields are attributes named as in db_access.h
+    (status, severity, units, upper_disp_limit, ...).
+    TIME types also have 'stamp' in POSIX seconds.
+    GR/CTRL_ENUM have 'strs', a list of no_str state strings.
+    '''
+    def __init__(self, **kws):
+        self.dtype = 0
+        self.value = []
+        for K,V in kws.items():
+            setattr(self, K, V)
+
+    def __str__(self):
+        S = dict(vars(self))
+        S.pop('dtype')
+        V = S.pop('value')
+        return 'DBR(%s, value=%r%s, %s)'%(dbrname(self.dtype), V[:4],
+                                          '...' if len(V)>4 else '',
+                                          ', '.join(['%s=%r'%E for E in sorted(S.items())]))
+    __repr__ = __str__
+
+def decode(dtype, dcnt, body):
+    'Decode DBR payload'
+    if dtype<0 or dtype>=len(_layout):
+        raise ValueError("Unknown DBR type %d"%dtype)
+    S, names = _layout[dtype]
+    D = DBR(dtype=dtype)
+    for K, V in zip(names, S.unpack_from(body)):
+        if isinstance(V, bytes):
+            V = V.split(b'\0', 1)[0].decode('latin-1')
+        setattr(D, K, V)
+    if hasattr(D, 'no_str'):
+        D.strs = [D.__dict__.pop('str%d'%i) for i in range(16)][:D.no_str]
+    if hasattr(D, 'secs'):
+        D.stamp = D.secs + POSIX_TIME_AT_EPICS_EPOCH + D.nsec*1e-9
+
+    V = _values(dtype%7, dcnt).unpack_from(body, S.size)
+    if dtype%7==0:
+        V = [E.split(b'\0', 1)[0] for E in V]
+    D.value = list(V)
+    return D
+
+def encode(dtype, value, **meta):
+    '''Encode DBR payload of a list of values (or a single value).
+
+    Meta-data fields not given are zero.  For TIME types, 'stamp'
+    in POSIX seconds may be given instead of secs/nsec.
+    For GR/CTRL_ENUM, 'strs' is a list of state strings.
+    '''
+    if dtype<0 or dtype>=len(_layout):
+        raise ValueError("Unknown DBR type %d"%dtype)
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    if 'stamp' in meta:
+        stamp = meta.pop('stamp')-POSIX_TIME_AT_EPICS_EPOCH
+        meta['secs'] = int(stamp)
+        meta['nsec'] = int((stamp-int(stamp))*1e9)
+    if 'strs' in meta:
+        strs = meta.pop('strs')
+        meta.setdefault('no_str', len(strs))
+        for i, S in enumerate(strs):
+            meta['str%d'%i] = S
+    S, names = _layout[dtype]
+    M = []
+    for K in names:
+        V = meta.get(K)
+        if V is None:
+            # string fields (units, enum strings) default to empty
+            V = b'' if K=='units' or K.startswith('str') else 0
+        elif isinstance(V, str):
+            V = V.encode('latin-1')
+        M.append(V)
+    if dtype%7==0:
+        value = [V.encode('latin-1') if isinstance(V, str) else V for V in value]
+    return S.pack(*M) + _values(dtype%7, len(value)).pack(*value)
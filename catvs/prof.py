@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Accounting of time spent in the harness itself
+
+Enabled by setting $PROFILE=1 .  Each test is then run under cProfile,
+and the time spent in the harness send/receive methods is split
+into CPU time (client overhead) and waiting (for the DUT),
+grouped by CA command.
+
+If $PROFILEDIR is set, cProfile statistics are also written there
+as "<test id>.prof" for use with pstats or snakeviz.
+"""
+
+import sys, os, logging, cProfile, pstats
+from time import perf_counter, thread_time
+
+_log = logging.getLogger(__name__)
+
+__all__ = [
+    'HarnessProfile',
+]
+
+# functions called out in the report
+_hot = (
+    'recvTCP',
+    'sendTCP',
+    'recvUDP',
+    'sendUDP',
+    'pack',
+    'unpack',
+    'unpack_from',
+    'feed',
+    'next',
+    'view',
+    'tally',
+    '_frame_at',
+    'countTCP',
+)
+
+class HarnessProfile(object):
+    '''Wraps the send/receive methods of one test instance.
+
+    Accounting is by (direction, CA command) -> [count, cpu, wait]
+    in seconds.  Time spent in a call which carries several messages
+    is divided evenly among them.
+    '''
+    maxoverhead = 0.25 # warn when CPU time exceeds this fraction of harness time
+
+    def __init__(self):
+        self.stats = {}
+        self.profiler = cProfile.Profile()
+
+    def attach(self, T):
+        'Wrap methods of test instance T'
+        for name in ('recvTCP', 'recvUDP'):
+            setattr(T, name, self._wrap(getattr(T, name), 'rx', None))
+        for name in ('sendTCP', 'sendUDP'):
+            setattr(T, name, self._wrap(getattr(T, name), 'tx', 0))
+        T.countTCP = self._wrapCount(T.countTCP)
+
+    def _account(self, direction, cmds, cpu, wait):
+        'cmds is a dict of CA command -> count.  Time is divided evenly among all'
+        N = float(sum(cmds.values()) or 1)
+        for cmd, cnt in (cmds or {None:1}).items():
+            S = self.stats.setdefault((direction, cmd), [0, 0.0, 0.0])
+            S[0] += cnt
+            S[1] += cpu*cnt/N
+            S[2] += wait*cnt/N
+
+    def _wrap(self, fn, direction, arg):
+        def wrapper(*args):
+            W0, C0 = perf_counter(), thread_time()
+            ret = fn(*args)
+            W1, C1 = perf_counter(), thread_time()
+
+            msgs = args[arg] if arg is not None else ret
+            if msgs is None:
+                msgs = [] # circuit closed
+            elif not isinstance(msgs, list):
+                msgs = [msgs]
+            cmds = {}
+            for M in msgs:
+                cmds[M.cmd] = cmds.get(M.cmd, 0)+1
+            self._account(direction, cmds, C1-C0, max(0.0, (W1-W0)-(C1-C0)))
+            return ret
+        return wrapper
+
+    def _wrapCount(self, fn):
+        'countTCP() adds to a dict of (cmd, p2) -> count, which may already have counts'
+        def wrapper(counts, N):
+            before = dict(counts)
+            W0, C0 = perf_counter(), thread_time()
+            ret = fn(counts, N)
+            W1, C1 = perf_counter(), thread_time()
+
+            cmds = {}
+            for K, cnt in counts.items():
+                new = cnt-before.get(K, 0)
+                if new:
+                    cmds[K[0]] = cmds.get(K[0], 0)+new
+            self._account('rx', cmds, C1-C0, max(0.0, (W1-W0)-(C1-C0)))
+            return ret
+        return wrapper
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def totals(self):
+        'Returns (message count, cpu, wait)'
+        N = cpu = wait = 0
+        for cnt, C, W in self.stats.values():
+            N, cpu, wait = N+cnt, cpu+C, wait+W
+        return N, cpu, wait
+
+    def overhead(self):
+        'Fraction of time in the harness which is client CPU'
+        N, cpu, wait = self.totals()
+        return cpu/(cpu+wait) if cpu+wait>0 else 0.0
+
+    def hot(self):
+        'Returns a list of (name, ncalls, tottime, cumtime) for harness and socket functions'
+        ret = []
+        for (fname, _line, func), (_cc, nc, tt, ct, _callers) in pstats.Stats(self.profiler).stats.items():
+            if fname.endswith(os.path.join('catvs', 'util.py')) and func in _hot:
+                ret.append((func, nc, tt, ct))
+            elif fname=='~' and '_socket.socket' in func:
+                # "<method 'recv' of '_socket.socket' objects>"
+                ret.append(('socket.'+func.split("'")[1], nc, tt, ct))
+        ret.sort(key=lambda E:-E[2])
+        return ret
+
+    def format(self, name):
+        from .util import _msgname
+        L = ['Harness profile of %s'%name,
+             '  %-26s %8s %10s %10s %10s'%('command', 'count', 'cpu (s)', 'wait (s)', 'cpu/msg (us)')]
+        for (D, cmd), (cnt, cpu, wait) in sorted(self.stats.items(), key=lambda E:(E[0][0], E[0][1] or 0)):
+            cname = '%s(%2d)'%(_msgname.get(cmd, 'UNKNOWN').strip(), cmd) if cmd is not None else 'closed'
+            L.append('  %s %-23s %8d %10.4f %10.4f %10.1f'%(D, cname, cnt, cpu, wait, 1e6*cpu/(cnt or 1)))
+        L.append('  %-26s %8s %10s %10s'%('function', 'calls', 'tottime', 'cumtime'))
+        for func, nc, tt, ct in self.hot():
+            L.append('  %-26s %8d %10.4f %10.4f'%(func[:26], nc, tt, ct))
+        N, cpu, wait = self.totals()
+        L.append('  client overhead %.1f%% of %.4f s in harness'%(100.0*self.overhead(), cpu+wait))
+        return '\n'.join(L)+'\n'
+
+    def finish(self, T):
+        'Stop profiling test instance T and report'
+        self.stop()
+        sys.stderr.write(self.format(T.id()))
+        N, cpu, wait = self.totals()
+        if cpu+wait>0.01 and self.overhead()>self.maxoverhead:
+            _log.warning("%s: client overhead is %.0f%% of harness time.  Results may be client bound.",
+                         T.id(), 100.0*self.overhead())
+        pdir = os.environ.get('PROFILEDIR')
+        if pdir:
+            self.profiler.dump_stats(os.path.join(pdir, '%s.prof'%T.id()))
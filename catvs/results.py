@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Structured results of test runs
+
+  python -m catvs.results -o results.jsonl discover catvs.server
+
+Runs unittest as usual, and also appends one JSON object per test
+to the output file.  Each has
+
+  id          - unittest test id
+  outcome     - "pass", "fail", "error", "skip", "xfail", or "xpass"
+  start       - POSIX time when the test started
+  duration    - seconds, including setUp/tearDown and DUT startup/shutdown
+  dut         - $DUT command
+  dut_startup - seconds until the DUT accepted TCP connections (0.1 s resolution)
+  tx_msg, tx_bytes, rx_msg, rx_bytes - CA traffic exchanged by the harness
+  compat      - list of server specific behaviours seen (see compat() in catvs/util.py)
+  sockprofile - socket options used (see SockProfile in catvs/util.py)
+  message     - first line of the failure/error/skip reason
+
+Other arguments are passed to unittest.
+"""
+
+import sys, os, time, json, platform, unittest, logging
+
+_log = logging.getLogger(__name__)
+
+__all__ = [
+    'JSONResult',
+    'JSONRunner',
+]
+
+def _reason(err):
+    'First line of an exception from exc_info, or a skip reason'
+    if isinstance(err, tuple):
+        err = '%s: %s'%(err[0].__name__, err[1])
+    return str(err).split('\n', 1)[0]
+
+class JSONResult(unittest.TextTestResult):
+    '''Records test outcomes, and writes them as JSON lines to 'output',
+    a file like object.
+    '''
+    def __init__(self, stream, descriptions, verbosity, output=None):
+        unittest.TextTestResult.__init__(self, stream, descriptions, verbosity)
+        self.output = output
+        self._rec = None
+
+    def startTest(self, test):
+        self._rec = {
+            'id':test.id(),
+            'outcome':'pass',
+            'start':time.time(),
+            'python':platform.python_version(),
+        }
+        self._T0 = time.perf_counter()
+        unittest.TextTestResult.startTest(self, test)
+
+    def _outcome(self, outcome, err=None):
+        R = self._rec
+        if R is None:
+            return # eg. error in setUpClass
+        # the first failure of a test (or subtest) takes precedence
+        if R['outcome']=='pass':
+            R['outcome'] = outcome
+            if err is not None:
+                R['message'] = _reason(err)
+
+    def addError(self, test, err):
+        unittest.TextTestResult.addError(self, test, err)
+        self._outcome('error', err)
+
+    def addFailure(self, test, err):
+        unittest.TextTestResult.addFailure(self, test, err)
+        self._outcome('fail', err)
+
+    def addSubTest(self, test, subtest, err):
+        unittest.TextTestResult.addSubTest(self, test, subtest, err)
+        if err is not None:
+            self._outcome('fail' if issubclass(err[0], test.failureException) else 'error', err)
+
+    def addSkip(self, test, reason):
+        unittest.TextTestResult.addSkip(self, test, reason)
+        self._outcome('skip', reason)
+
+    def addExpectedFailure(self, test, err):
+        unittest.TextTestResult.addExpectedFailure(self, test, err)
+        self._outcome('xfail', err)
+
+    def addUnexpectedSuccess(self, test):
+        unittest.TextTestResult.addUnexpectedSuccess(self, test)
+        self._outcome('xpass')
+
+    def stopTest(self, test):
+        unittest.TextTestResult.stopTest(self, test)
+        R, self._rec = self._rec, None
+        if R is None:
+            return
+        R['duration'] = time.perf_counter()-self._T0
+        R['dut'] = getattr(test, 'dut', None)
+        R['dut_startup'] = getattr(test, 'dutstart', None)
+        R.update(getattr(test, 'counters', {}))
+        R['compat'] = list(getattr(test, 'branches', []))
+        if getattr(test, 'sockprof', None) is not None:
+            R['sockprofile'] = test.sockprof.asdict()
+        if self.output is not None:
+            self.output.write(json.dumps(R, sort_keys=True)+'\n')
+            self.output.flush()
+
+class JSONRunner(unittest.TextTestRunner):
+    'Runs tests with JSONResult, appending to the file named by fname'
+    resultclass = JSONResult
+
+    def __init__(self, fname, **kws):
+        unittest.TextTestRunner.__init__(self, **kws)
+        self.fname = fname
+
+    def _makeResult(self):
+        return self.resultclass(self.stream, self.descriptions, self.verbosity,
+                                output=self._output)
+
+    def run(self, test):
+        with open(self.fname, 'a') as self._output:
+            return unittest.TextTestRunner.run(self, test)
+
+def main(args=None):
+    import argparse
+    P = argparse.ArgumentParser(description='Run unittest and write JSON lines results',
+                                usage='%(prog)s [-o FILE] [unittest args...]')
+    P.add_argument('-o', '--output', default='results.jsonl', help='Append results to this file')
+    args, rest = P.parse_known_args(args)
+
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+
+    unittest.main(module=None, argv=['catvs.results']+rest,
+                  testRunner=JSONRunner(args.output))
+
+if __name__=='__main__':
+    main()
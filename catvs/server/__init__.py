@@ -1,3 +1,10 @@
-from test_chan import *
-from test_ops import *
-from test_search import *
+from .test_chan import *
+from .test_dbr import *
+from .test_ops import *
+from .test_search import *
+
+def load_tests(loader, tests, pattern):
+    # The modules above are also found by 'discover'.
+    # Returning only the tests imported here keeps it from
+    # recursing into this package and running each test twice.
+    return tests
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import unittest, socket, logging, os, time
+from struct import pack
+from ..util import TestClient, Msg
+from ..dbr import decode, dbrname, dbrsize
+
+_log = logging.getLogger(__name__)
+
+class TestDBR(TestClient, unittest.TestCase):
+    'Compound DBR types (STS, TIME, GR, CTRL) of a LONG scalar'
+
+    user = b'foo'
+    host = socket.gethostname().encode()
+
+    def openChan(self):
+        'Open TCP connection, create channel, and put a known value'
+        self.cid = 156
+        self.connectTCP()
+        self.sendTCP([
+            Msg(cmd=0, dcnt=13),
+            Msg(cmd=20, body=self.user),
+            Msg(cmd=21, body=self.host),
+            Msg(cmd=18, p1=self.cid, p2=13, body=b'ival'),
+        ])
+
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=0)
+        self.assertGreater(rep.dcnt, 6) # server version must be post Base 3.12
+        self.sver = rep.dcnt
+
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=22, p1=self.cid, p2=3)
+
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=18, dtype=5, dcnt=1, p1=self.cid)
+        self.sid = rep.p2
+
+        self.addCleanup(self._closeChan)
+
+        # processing updates the timestamp and clears any UDF alarm
+        self.tput = time.time()
+        self.sendTCP([
+            Msg(cmd=19, dtype=5, dcnt=1, p1=self.sid, p2=1101, body=pack('!i', 43)),
+        ])
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=19, dtype=5, dcnt=1, p1=1, p2=1101)
+
+    def _closeChan(self):
+        self.sendTCP([
+            Msg(cmd=12, p1=self.sid, p2=self.cid),
+        ])
+
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=12, p1=self.sid, p2=self.cid)
+
+    def getDBR(self, dtype):
+        'Get and decode one element'
+        ioid = 1102+dtype
+        self.sendTCP([
+            Msg(cmd=15, dtype=dtype, dcnt=1, p1=self.sid, p2=ioid),
+        ])
+
+        rep = self.recvTCP()
+        # Note P1 in reply is a CA status code (1==ok)
+        self.assertCAEqual(rep, cmd=15, dtype=dtype, dcnt=1, p1=1, p2=ioid)
+        self.assertGreaterEqual(rep.size, dbrsize(dtype, 1), dbrname(dtype))
+
+        val = decode(dtype, 1, rep.body)
+        _log.debug("%s", val)
+        if dtype%7==0:
+            self.assertEqual(val.value, [b'43'], dbrname(dtype))
+        else:
+            self.assertEqual(val.value, [43], dbrname(dtype))
+        return val
+
+    def checkAlarm(self, val):
+        self.assertEqual((val.status, val.severity), (0, 0), val)
+
+    def test_sts(self):
+        self.openChan()
+        for dtype in range(7, 14):
+            if dtype==10:
+                continue # ENUM
+            self.checkAlarm(self.getDBR(dtype))
+
+    def test_time(self):
+        self.openChan()
+        for dtype in range(14, 21):
+            if dtype==17:
+                continue # ENUM
+            val = self.getDBR(dtype)
+            self.checkAlarm(val)
+            # stamp is from the put in openChan()
+            self.assertAlmostEqual(val.stamp, self.tput, delta=10.0, msg=str(val))
+
+    # limits are not checked as the test servers don't agree on them
+
+    def test_gr(self):
+        self.openChan()
+        for dtype in (22, 23, 25, 26, 27):
+            val = self.getDBR(dtype)
+            self.checkAlarm(val)
+
+    def test_ctrl(self):
+        self.openChan()
+        for dtype in (29, 30, 32, 33, 34):
+            val = self.getDBR(dtype)
+            self.checkAlarm(val)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
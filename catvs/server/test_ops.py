@@ -8,8 +8,8 @@ _log = logging.getLogger(__name__)
 
 class TestScalar(TestClient, unittest.TestCase):
 
-    user = 'foo'
-    host = socket.gethostname()
+    user = b'foo'
+    host = socket.gethostname().encode()
 
     def openChan(self):
         'Open TCP connection and create channel'
@@ -19,7 +19,7 @@ class TestScalar(TestClient, unittest.TestCase):
             Msg(cmd=0, dcnt=13),
             Msg(cmd=20, body=self.user),
             Msg(cmd=21, body=self.host),
-            Msg(cmd=18, p1=self.cid, p2=13, body='ival'),
+            Msg(cmd=18, p1=self.cid, p2=13, body=b'ival'),
         ])
 
         rep = self.recvTCP()
@@ -101,7 +101,7 @@ class TestScalar(TestClient, unittest.TestCase):
         self.openChan()
         ioid = 1102
         self.sendTCP([
-            Msg(cmd=4, dtype=5, dcnt=1, p1=self.sid, p2=1101, body='\0\0\0\x2b'),
+            Msg(cmd=4, dtype=5, dcnt=1, p1=self.sid, p2=1101, body=b'\0\0\0\x2b'),
             Msg(cmd=15, dtype=5, dcnt=1, p1=self.sid, p2=ioid),
         ])
 
@@ -116,12 +116,13 @@ class TestScalar(TestClient, unittest.TestCase):
         self.openChan()
         ioid = 1102
         self.sendTCP([
-            Msg(cmd=4, dtype=0xefef, dcnt=1, p1=self.sid, p2=1101, body='\0\0\0\x2b'),
+            Msg(cmd=4, dtype=0xefef, dcnt=1, p1=self.sid, p2=1101, body=b'\0\0\0\x2b'),
         ])
 
         rep = self.recvTCP()
         if rep is None:
             # RSRV queues an error, then closes the connection before send()ing...
+            self.compat('rsrv_close_on_bad_dbr')
             self.live = False
         else:
             self.assertCAEqual(rep, cmd=11, dtype=0, dcnt=0, p1=self.cid, p2=0x72) # ECA_BADTYPE
@@ -130,7 +131,7 @@ class TestScalar(TestClient, unittest.TestCase):
         'Put w/ reply'
         self.openChan()
         self.sendTCP([
-            Msg(cmd=19, dtype=5, dcnt=1, p1=self.sid, p2=1101, body='\0\0\0\x2c'),
+            Msg(cmd=19, dtype=5, dcnt=1, p1=self.sid, p2=1101, body=b'\0\0\0\x2c'),
         ])
 
         rep = self.recvTCP()
@@ -144,21 +145,22 @@ class TestScalar(TestClient, unittest.TestCase):
         # Note P1 in reply is a CA status code (1==ok)
         self.assertCAEqual(rep, cmd=15, dtype=5, dcnt=1, p1=1, p2=1102)
 
-        self.assertEqual(rep.body[:4], '\0\0\0\x2c')
+        self.assertEqual(rep.body[:4], b'\0\0\0\x2c')
 
     def test_put_callback_bad(self):
         'Put w/ reply w/ bad DBR'
         self.openChan()
         self.sendTCP([
-            Msg(cmd=19, dtype=0xefef, dcnt=1, p1=self.sid, p2=1101, body='\0\0\0\x2c'),
+            Msg(cmd=19, dtype=0xefef, dcnt=1, p1=self.sid, p2=1101, body=b'\0\0\0\x2c'),
         ])
 
         rep = self.recvTCP()
         if rep is None:
             # RSRV queues an error, then closes the connection before send()ing...
+            self.compat('rsrv_close_on_bad_dbr')
             self.live = False
         else:
-            self.assertCAEqual(rep, cmd=19, dtype=0xefef, dcnt=1, p1=0x72, p2=1101, body='') # ECA_BADTYPE
+            self.assertCAEqual(rep, cmd=19, dtype=0xefef, dcnt=1, p1=0x72, p2=1101, body=b'') # ECA_BADTYPE
 
     def test_monitor(self):
         self.openChan()
@@ -173,18 +175,18 @@ class TestScalar(TestClient, unittest.TestCase):
         rep = self.recvTCP()
         # Note P1 in reply is a CA status code (1==ok)
         self.assertCAEqual(rep, cmd=1, dtype=5, dcnt=1, p1=1, p2=ioid)
-        self.assertEqual(rep.body[:4], '\0\0\0\x2a')
+        self.assertEqual(rep.body[:4], b'\0\0\0\x2a')
 
         # Send a Put to trigger a subscription update
         self.sendTCP([
-            Msg(cmd=4, dtype=5, dcnt=1, p1=self.sid, p2=1101, body='\0\0\0\x2d'),
+            Msg(cmd=4, dtype=5, dcnt=1, p1=self.sid, p2=1101, body=b'\0\0\0\x2d'),
         ])
 
         # wait for update
         rep = self.recvTCP()
         # Note P1 in reply is a CA status code (1==ok)
         self.assertCAEqual(rep, cmd=1, dtype=5, dcnt=1, p1=1, p2=ioid)
-        self.assertEqual(rep.body[:4], '\0\0\0\x2d')
+        self.assertEqual(rep.body[:4], b'\0\0\0\x2d')
 
         # cancel subscription
         self.sendTCP([
@@ -200,8 +202,8 @@ class TestScalar(TestClient, unittest.TestCase):
 
 class TestArray(TestClient, unittest.TestCase):
 
-    user = 'foo'
-    host = socket.gethostname()
+    user = b'foo'
+    host = socket.gethostname().encode()
 
     def openChan(self, cver=13):
         'Open TCP connection and create channel'
@@ -211,7 +213,7 @@ class TestArray(TestClient, unittest.TestCase):
             Msg(cmd=0, dcnt=cver),
             Msg(cmd=20, body=self.user),
             Msg(cmd=21, body=self.host),
-            Msg(cmd=18, p1=self.cid, p2=cver, body='aval'),
+            Msg(cmd=18, p1=self.cid, p2=cver, body=b'aval'),
         ])
 
         rep = self.recvTCP()
@@ -258,9 +260,10 @@ class TestArray(TestClient, unittest.TestCase):
         # RSRV weirdness.
         # first element is undefined when NORD==0
         # should be zero...
-        if rep.body[:2]!='\0\0':
-            _log.warn("RSRV weirdness, first element of empty array is undefined")
-        self.assertEqual(rep.body[2:], '\0'*14)
+        if rep.body[:2]!=b'\0\0':
+            _log.warning("RSRV weirdness, first element of empty array is undefined")
+            self.compat('rsrv_undefined_first_element')
+        self.assertEqual(rep.body[2:], b'\0'*14)
 
     def test_get_some(self):
         self.openChan()
@@ -299,9 +302,9 @@ class TestArray(TestClient, unittest.TestCase):
         # reply may either ok w/ length zero or error ECA_BADCOUNT
         self.assertCAEqual(rep, cmd=15, dtype=1, p2=ioid)
         if rep.p1==1 and rep.dcnt==0: # RSRV does this
-            pass
+            self.compat('rsrv_zero_count')
         elif rep.p1>>3==22: # PCAS does this
-            pass
+            self.compat('pcas_badcount')
         else:
             self.fail("No match %s", rep)
         # RSRV returns a body w/ 8 bytes, not sure what this is?
@@ -323,9 +326,9 @@ class TestArray(TestClient, unittest.TestCase):
             if rep.dcnt not in (0,5):
                 self.fail("Bad count %s"%rep)
         elif rep.p1==1 and rep.dcnt==0: # RSRV does this
-            pass
+            self.compat('rsrv_zero_count')
         elif rep.p1>>3==22: # PCAS does this
-            pass
+            self.compat('pcas_badcount')
         else:
             self.fail("No match %s"%rep)
         # RSRV returns a body w/ 8 bytes, not sure what this is?
@@ -335,17 +338,17 @@ class TestArray(TestClient, unittest.TestCase):
         ioid = 1102
 
         self.sendTCP([
-            Msg(cmd=4, dtype=1, dcnt=2, p1=self.sid, p2=1101, body='\0\x2b\0\x2c'),
+            Msg(cmd=4, dtype=1, dcnt=2, p1=self.sid, p2=1101, body=b'\0\x2b\0\x2c'),
             Msg(cmd=15, dtype=1, dcnt=5, p1=self.sid, p2=ioid),
             Msg(cmd=15, dtype=1, dcnt=2, p1=self.sid, p2=ioid+1),
         ])
 
         rep = self.recvTCP()
         self.assertCAEqual(rep, cmd=15, dtype=1, dcnt=5, p1=1, p2=ioid)
-        self.assertEqual(rep.body, '\0\x2b\0\x2c\0\0\0\0\0\0\0\0\0\0\0\0')
+        self.assertEqual(rep.body, b'\0\x2b\0\x2c\0\0\0\0\0\0\0\0\0\0\0\0')
         rep = self.recvTCP()
         self.assertCAEqual(rep, cmd=15, dtype=1, dcnt=2, p1=1, p2=ioid+1)
-        self.assertEqual(rep.body, '\0\x2b\0\x2c\0\0\0\0')
+        self.assertEqual(rep.body, b'\0\x2b\0\x2c\0\0\0\0')
 
     def test_monitor_one_fixed(self):
         self.openChan()
@@ -364,32 +367,33 @@ class TestArray(TestClient, unittest.TestCase):
         # RSRV weirdness.
         # first element is undefined when NORD==0
         # should be zero...
-        if rep.body[:2]!='\0\0':
-            _log.warn("RSRV weirdness, first element of empty array is undefined")
-        self.assertEqual(rep.body[2:4], '\0\0')
-        # should be self.assertEqual(rep.body[:4], '\0\0\0\0')
+        if rep.body[:2]!=b'\0\0':
+            _log.warning("RSRV weirdness, first element of empty array is undefined")
+            self.compat('rsrv_undefined_first_element')
+        self.assertEqual(rep.body[2:4], b'\0\0')
+        # should be self.assertEqual(rep.body[:4], b'\0\0\0\0')
 
         # Send Puts to trigger subscription updates
         self.sendTCP([
-            Msg(cmd=4, dtype=5, dcnt=2, p1=self.sid, p2=1101, body='\0\0\0\x2a\0\0\0\x2d'),
+            Msg(cmd=4, dtype=5, dcnt=2, p1=self.sid, p2=1101, body=b'\0\0\0\x2a\0\0\0\x2d'),
         ])
         rep = self.recvTCP()
         self.assertCAEqual(rep, cmd=1, dtype=5, dcnt=1, p1=1, p2=ioid)
-        self.assertEqual(rep.body[:4], '\0\0\0\x2a')
+        self.assertEqual(rep.body[:4], b'\0\0\0\x2a')
 
         self.sendTCP([
-            Msg(cmd=4, dtype=1, dcnt=4, p1=self.sid, p2=1101, body='\0\x2b\0\x2c\0\x2d\0\x2e'),
+            Msg(cmd=4, dtype=1, dcnt=4, p1=self.sid, p2=1101, body=b'\0\x2b\0\x2c\0\x2d\0\x2e'),
         ])
         rep = self.recvTCP()
         self.assertCAEqual(rep, cmd=1, dtype=5, dcnt=1, p1=1, p2=ioid)
-        self.assertEqual(rep.body[:4], '\0\0\0\x2b')
+        self.assertEqual(rep.body[:4], b'\0\0\0\x2b')
 
         self.sendTCP([
-            Msg(cmd=4, dtype=1, dcnt=1, p1=self.sid, p2=1101, body='\0\x2c'),
+            Msg(cmd=4, dtype=1, dcnt=1, p1=self.sid, p2=1101, body=b'\0\x2c'),
         ])
         rep = self.recvTCP()
         self.assertCAEqual(rep, cmd=1, dtype=5, dcnt=1, p1=1, p2=ioid)
-        self.assertEqual(rep.body[:4], '\0\0\0\x2c')
+        self.assertEqual(rep.body[:4], b'\0\0\0\x2c')
 
         # cancel subscription
         self.sendTCP([
@@ -417,32 +421,33 @@ class TestArray(TestClient, unittest.TestCase):
         # RSRV weirdness.
         # first element is undefined when NORD==0
         # should be zero...
-        if rep.body[:2]!='\0\0':
-            _log.warn("RSRV weirdness, first element of empty array is undefined")
-        self.assertEqual(rep.body[2:12], '\0'*10)
-        # should be self.assertEqual(rep.body[:12], '\0'*12)
+        if rep.body[:2]!=b'\0\0':
+            _log.warning("RSRV weirdness, first element of empty array is undefined")
+            self.compat('rsrv_undefined_first_element')
+        self.assertEqual(rep.body[2:12], b'\0'*10)
+        # should be self.assertEqual(rep.body[:12], b'\0'*12)
 
         # Send Puts to trigger subscription updates
         self.sendTCP([
-            Msg(cmd=4, dtype=5, dcnt=2, p1=self.sid, p2=1101, body='\0\0\0\x2a\0\0\0\x2d'),
+            Msg(cmd=4, dtype=5, dcnt=2, p1=self.sid, p2=1101, body=b'\0\0\0\x2a\0\0\0\x2d'),
         ])
         rep = self.recvTCP()
         self.assertCAEqual(rep, cmd=1, dtype=5, dcnt=3, p1=1, p2=ioid)
-        self.assertEqual(rep.body[:12], '\0\0\0\x2a\0\0\0\x2d\0\0\0\0')
+        self.assertEqual(rep.body[:12], b'\0\0\0\x2a\0\0\0\x2d\0\0\0\0')
 
         self.sendTCP([
-            Msg(cmd=4, dtype=1, dcnt=4, p1=self.sid, p2=1101, body='\0\x2b\0\x2c\0\x2d\0\x2e'),
+            Msg(cmd=4, dtype=1, dcnt=4, p1=self.sid, p2=1101, body=b'\0\x2b\0\x2c\0\x2d\0\x2e'),
         ])
         rep = self.recvTCP()
         self.assertCAEqual(rep, cmd=1, dtype=5, dcnt=3, p1=1, p2=ioid)
-        self.assertEqual(rep.body[:12], '\0\0\0\x2b\0\0\0\x2c\0\0\0\x2d')
+        self.assertEqual(rep.body[:12], b'\0\0\0\x2b\0\0\0\x2c\0\0\0\x2d')
 
         self.sendTCP([
-            Msg(cmd=4, dtype=1, dcnt=1, p1=self.sid, p2=1101, body='\0\x2c'),
+            Msg(cmd=4, dtype=1, dcnt=1, p1=self.sid, p2=1101, body=b'\0\x2c'),
         ])
         rep = self.recvTCP()
         self.assertCAEqual(rep, cmd=1, dtype=5, dcnt=3, p1=1, p2=ioid)
-        self.assertEqual(rep.body[:12], '\0\0\0\x2c' + '\0'*8)
+        self.assertEqual(rep.body[:12], b'\0\0\0\x2c' + b'\0'*8)
 
         # cancel subscription
         self.sendTCP([
@@ -470,7 +475,7 @@ class TestArray(TestClient, unittest.TestCase):
 
         # Send a Put to trigger a subscription update
         self.sendTCP([
-            Msg(cmd=4, dtype=5, dcnt=2, p1=self.sid, p2=1101, body='\0\0\0\x2a\0\0\0\x2d'),
+            Msg(cmd=4, dtype=5, dcnt=2, p1=self.sid, p2=1101, body=b'\0\0\0\x2a\0\0\0\x2d'),
         ])
         rep = self.recvTCP()
         # Note P1 in reply is a CA status code (1==ok)
@@ -479,16 +484,16 @@ class TestArray(TestClient, unittest.TestCase):
             # Server support dynamic array size
             self.assertCAEqual(rep, p1=1, dcnt=2)
         elif rep.p1==1 and rep.dcnt==0: # RSRV does this
-            pass
+            self.compat('rsrv_zero_count')
         elif rep.p1>>3==22: # PCAS does this
-            pass
+            self.compat('pcas_badcount')
         else:
             self.fail("No match %s"%rep)
-        self.assertEqual(rep.body[:8], '\0\0\0\x2a\0\0\0\x2d')
+        self.assertEqual(rep.body[:8], b'\0\0\0\x2a\0\0\0\x2d')
 
         # Send a Put to trigger a subscription update
         self.sendTCP([
-            Msg(cmd=4, dtype=1, dcnt=4, p1=self.sid, p2=1101, body='\0\x2b\0\x2c\0\x2d\0\x2e'),
+            Msg(cmd=4, dtype=1, dcnt=4, p1=self.sid, p2=1101, body=b'\0\x2b\0\x2c\0\x2d\0\x2e'),
         ])
         rep = self.recvTCP()
         # Note P1 in reply is a CA status code (1==ok)
@@ -497,16 +502,16 @@ class TestArray(TestClient, unittest.TestCase):
             # Server support dynamic array size
             self.assertCAEqual(rep, p1=1, dcnt=4)
         elif rep.p1==1 and rep.dcnt==0: # RSRV does this
-            pass
+            self.compat('rsrv_zero_count')
         elif rep.p1>>3==22: # PCAS does this
-            pass
+            self.compat('pcas_badcount')
         else:
             self.fail("No match %s"%rep)
-        self.assertEqual(rep.body[:16], '\0\0\0\x2b\0\0\0\x2c\0\0\0\x2d\0\0\0\x2e')
+        self.assertEqual(rep.body[:16], b'\0\0\0\x2b\0\0\0\x2c\0\0\0\x2d\0\0\0\x2e')
 
         # Send a Put to trigger a subscription update
         self.sendTCP([
-            Msg(cmd=4, dtype=1, dcnt=1, p1=self.sid, p2=1101, body='\0\x2c'),
+            Msg(cmd=4, dtype=1, dcnt=1, p1=self.sid, p2=1101, body=b'\0\x2c'),
         ])
         rep = self.recvTCP()
         # Note P1 in reply is a CA status code (1==ok)
@@ -515,12 +520,12 @@ class TestArray(TestClient, unittest.TestCase):
             # Server support dynamic array size
             self.assertCAEqual(rep, p1=1, dcnt=1)
         elif rep.p1==1 and rep.dcnt==0: # RSRV does this
-            pass
+            self.compat('rsrv_zero_count')
         elif rep.p1>>3==22: # PCAS does this
-            pass
+            self.compat('pcas_badcount')
         else:
             self.fail("No match %s"%rep)
-        self.assertEqual(rep.body[:4], '\0\0\0\x2c')
+        self.assertEqual(rep.body[:4], b'\0\0\0\x2c')
 
         # cancel subscription
         self.sendTCP([
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import unittest, socket, logging, os
+import unittest, logging, os
 from ..util import TestClient, Msg
 
 class TestEcho(TestClient, unittest.TestCase):
@@ -9,7 +9,7 @@ class TestEcho(TestClient, unittest.TestCase):
         self.sendUDP([
             Msg(cmd=23, dtype=12, dcnt=23, p1=5678, p2=9101112),
         ])
-        self.assertRaises(socket.timeout, self.recvUDP)
+        self.expectNoReplyUDP()
         #rep, src = self.recvUDP()
         #self.assertCAEqual(rep[0], cmd=23, dtype=12, dcnt=23, p1=5678, p2=9101112)
 
@@ -20,7 +20,7 @@ class TestSearchUDP(TestClient, unittest.TestCase):
         searchid = 0x12345678
         self.sendUDP([
             Msg(cmd=0, dcnt=13),
-            Msg(cmd=6, body='ival', dtype=5, dcnt=13, p1=searchid, p2=searchid),
+            Msg(cmd=6, body=b'ival', dtype=5, dcnt=13, p1=searchid, p2=searchid),
         ])
 
         rep = self.recvUDP()
@@ -40,10 +40,10 @@ class TestSearchUDP(TestClient, unittest.TestCase):
         searchid = 0x12345678
         self.sendUDP([
             Msg(cmd=0, dcnt=13),
-            Msg(cmd=6, body='invalid', dtype=5, dcnt=13, p1=searchid, p2=searchid),
+            Msg(cmd=6, body=b'invalid', dtype=5, dcnt=13, p1=searchid, p2=searchid),
         ])
 
-        self.assertRaises(socket.timeout, self.recvUDP)
+        self.expectNoReplyUDP()
 
     def test_udplookup_err2(self):
         '''UDP lookup of non-existant
@@ -52,10 +52,10 @@ class TestSearchUDP(TestClient, unittest.TestCase):
         searchid = 0x12345678
         self.sendUDP([
             Msg(cmd=0, dcnt=13),
-            Msg(cmd=6, body='invalid', dtype=10, dcnt=13, p1=searchid, p2=searchid),
+            Msg(cmd=6, body=b'invalid', dtype=10, dcnt=13, p1=searchid, p2=searchid),
         ])
 
-        self.assertRaises(socket.timeout, self.recvUDP)
+        self.expectNoReplyUDP()
 
 class TestSearchTCP(TestClient, unittest.TestCase):
     def test_tcplookup(self):
@@ -76,7 +76,7 @@ class TestSearchTCP(TestClient, unittest.TestCase):
             self.skipTest("Server doesn't support TCP lookup")
 
         self.sendTCP([
-            Msg(cmd=6, body='ival', dtype=5, dcnt=13, p1=searchid, p2=searchid),
+            Msg(cmd=6, body=b'ival', dtype=5, dcnt=13, p1=searchid, p2=searchid),
         ])
 
         rep = self.recvTCP()
@@ -89,7 +89,8 @@ class TestSearchTCP(TestClient, unittest.TestCase):
         if rep.p1!=0xffffffff:
             self.assertEqual(rep.dtype, self.testport)
         else:
-            pass # PCAS returns dtype (port) 0 here, not sure if it should
+            # PCAS returns dtype (port) 0 here, not sure if it should
+            self.compat('pcas_search_port_zero')
 
     def test_tcplookup_err1(self):
         'TCP lookup of non-existant w/o reply'
@@ -109,10 +110,10 @@ class TestSearchTCP(TestClient, unittest.TestCase):
             self.skipTest("Server doesn't support TCP lookup")
 
         self.sendTCP([
-            Msg(cmd=6, body='invalid', dtype=5, dcnt=rep.dcnt, p1=searchid, p2=searchid),
+            Msg(cmd=6, body=b'invalid', dtype=5, dcnt=rep.dcnt, p1=searchid, p2=searchid),
         ])
 
-        self.assertRaises(socket.timeout, self.recvTCP)
+        self.expectNoReplyTCP()
 
     def test_tcplookup_err2(self):
         'TCP lookup of non-existant w/ reply'
@@ -132,7 +133,7 @@ class TestSearchTCP(TestClient, unittest.TestCase):
             self.skipTest("Server doesn't support TCP lookup")
 
         self.sendTCP([
-            Msg(cmd=6, body='invalid', dtype=10, dcnt=13, p1=searchid, p2=searchid),
+            Msg(cmd=6, body=b'invalid', dtype=10, dcnt=13, p1=searchid, p2=searchid),
         ])
 
         rep = self.recvTCP()
@@ -150,7 +151,7 @@ class TestSearchTCP(TestClient, unittest.TestCase):
         searchid = 0x12345678
         self.sendTCP([
             Msg(cmd=0, dcnt=11),
-            Msg(cmd=6, body='ival', dtype=5, dcnt=11, p1=searchid, p2=searchid),
+            Msg(cmd=6, body=b'ival', dtype=5, dcnt=11, p1=searchid, p2=searchid),
         ])
 
         rep = self.recvTCP()
@@ -161,7 +162,7 @@ class TestSearchTCP(TestClient, unittest.TestCase):
             self.skipTest("Server doesn't support TCP lookup")
 
         self.sendTCP([
-            Msg(cmd=6, body='ival', dtype=5, dcnt=13, p1=searchid, p2=searchid),
+            Msg(cmd=6, body=b'ival', dtype=5, dcnt=13, p1=searchid, p2=searchid),
         ])
 
         rep = self.recvTCP()
@@ -174,7 +175,8 @@ class TestSearchTCP(TestClient, unittest.TestCase):
         if rep.p1!=0xffffffff:
             self.assertEqual(rep.dtype, self.testport)
         else:
-            pass # PCAS returns dtype (port) 0 here, not sure if it should
+            # PCAS returns dtype (port) 0 here, not sure if it should
+            self.compat('pcas_search_port_zero')
 
 if __name__=='__main__':
     if 'LOGLEVEL' in os.environ:
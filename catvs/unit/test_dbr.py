@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os
+from ..dbr import decode, encode, dbrname, dbrclass, dbrsize, _layout
+
+# sizeof() each struct, as dbr_size[] in db_access.h
+_sizes = [
+    40, 2, 4, 2, 1, 4, 8, # plain
+    44, 6, 8, 6, 6, 8, 16, # STS
+    52, 16, 16, 16, 16, 16, 24, # TIME
+    44, 26, 44, 424, 20, 40, 72, # GR
+    44, 30, 52, 424, 22, 48, 88, # CTRL
+]
+
+class TestCodec(unittest.TestCase):
+    'DBR encode() and decode() without a DUT'
+
+    def value(self, dtype, i):
+        return [b'val%d'%i, -i, 0.5*i, i, i, -1000*i, 0.25*i][dtype%7]
+
+    def meta(self, dtype):
+        'Distinct, non-zero value of each meta-data field'
+        M = {}
+        for n, K in enumerate(_layout[dtype][1]):
+            if K=='units':
+                M[K] = 'mA'
+            elif K.startswith('str'):
+                M[K] = 'state%d'%n
+            elif K=='severity':
+                M[K] = 2
+            elif K=='no_str':
+                M[K] = 16
+            elif K.endswith('_limit'):
+                M[K] = self.value(dtype, n+1)
+            else:
+                M[K] = n+3
+        return M
+
+    def test_sizes(self):
+        for dtype, size in enumerate(_sizes):
+            self.assertEqual(dbrsize(dtype, 1), size, dbrname(dtype))
+            self.assertEqual(len(encode(dtype, self.value(dtype, 1))), size, dbrname(dtype))
+
+    def test_names(self):
+        self.assertEqual(dbrname(19), 'DBR_TIME_LONG')
+        self.assertEqual(dbrname(34), 'DBR_CTRL_DOUBLE')
+        self.assertEqual(dbrclass(19), 'TIME')
+        self.assertEqual(dbrclass(6), '')
+
+    def test_roundtrip(self):
+        for dtype in range(len(_sizes)):
+            value = [self.value(dtype, i) for i in range(1, 4)]
+            meta = self.meta(dtype)
+            B = encode(dtype, value, **meta)
+            self.assertEqual(len(B), dbrsize(dtype, 3), dbrname(dtype))
+
+            D = decode(dtype, 3, B)
+            self.assertEqual(D.dtype, dtype)
+            self.assertEqual(D.value, value, dbrname(dtype))
+            for K, V in meta.items():
+                if K.startswith('str'):
+                    continue
+                self.assertEqual(getattr(D, K), V, '%s %s'%(dbrname(dtype), K))
+            if 'no_str' in meta:
+                self.assertEqual(D.strs, [meta['str%d'%i] for i in range(16)])
+
+    def test_stamp(self):
+        B = encode(19, 5, stamp=1500000000.25, status=1)
+        D = decode(19, 1, B)
+        self.assertEqual((D.status, D.secs, D.nsec), (1, 1500000000-631152000, 250000000))
+        self.assertAlmostEqual(D.stamp, 1500000000.25, places=6)
+
+    def test_enum_strs(self):
+        B = encode(31, 1, strs=['Off', 'On'])
+        D = decode(31, 1, B)
+        self.assertEqual((D.no_str, D.strs, D.value), (2, ['Off', 'On'], [1]))
+
+    def test_defaults(self):
+        'Meta-data not given is zero'
+        D = decode(34, 1, encode(34, 1.5))
+        self.assertEqual((D.status, D.severity, D.precision, D.units, D.upper_ctrl_limit, D.value),
+                         (0, 0, 0, '', 0.0, [1.5]))
+
+    def test_bad_type(self):
+        for dtype in (-1, 35):
+            self.assertRaises(ValueError, encode, dtype, 0)
+            self.assertRaises(ValueError, decode, dtype, 1, b'\0'*100)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
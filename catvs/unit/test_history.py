@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os, random
+from ..bench.history import connect, rows, ingest, series, changepoints
+
+class TestHistory(unittest.TestCase):
+    'Result history in an in-memory database'
+
+    bench = {'scenario':'catvs.bench.bench_search.TestSearch.test_udp', 'metric':'search_rate',
+             'case':'batch=10', 'unit':'req/s', 'dut':'softIoc', 'time':1000.0, 'python':'3.11.2',
+             'sockprofile':{'name':'ca', 'nodelay':1}, 'value':5000.0, 'batch':10}
+    test = {'id':'catvs.server.test_ops.TestScalar.test_get', 'outcome':'success', 'start':1000.0,
+            'duration':0.25, 'dut_startup':None, 'dut':'softIoc'}
+
+    def setUp(self):
+        self.db = connect(':memory:')
+        self.addCleanup(self.db.close)
+
+    def result(self, T, value):
+        R = dict(self.bench)
+        R.update({'time':T, 'value':value})
+        return R
+
+    def test_rows_bench(self):
+        [E] = rows(self.bench)
+        self.assertEqual((E['kind'], E['metric'], E['casename'], E['unit'], E['value']),
+                         ('bench', 'search_rate', 'batch=10', 'req/s', 5000.0))
+        self.assertEqual(E['sockprofile'], 'ca,nodelay=1')
+        self.assertEqual(E['extra'], '{"batch": 10}')
+
+    def test_rows_test(self):
+        'Only metrics which were measured'
+        [E] = rows(self.test)
+        self.assertEqual((E['kind'], E['scenario'], E['metric'], E['value'], E['time']),
+                         ('test', self.test['id'], 'duration', 0.25, 1000.0))
+        self.assertEqual(E['extra'], '{"outcome": "success"}')
+
+    def test_rows_bad(self):
+        with self.assertRaisesRegex(ValueError, "Not a result record"):
+            rows({'foo':1})
+
+    def test_ingest_twice(self):
+        recs = [self.bench, self.test]
+        self.assertEqual(ingest(self.db, recs, 'abc123', branch='7.0', seq=1.0), 2)
+        self.assertEqual(ingest(self.db, recs, 'abc123', branch='7.0', seq=1.0), 0)
+        self.assertEqual(self.db.execute('SELECT count(*) FROM result').fetchone()[0], 2)
+        # same results of another revision are new
+        self.assertEqual(ingest(self.db, recs, 'def456', branch='7.0', seq=2.0), 2)
+
+    def test_dut_override(self):
+        ingest(self.db, [self.bench], 'abc123', dut='base-7.0', seq=1.0)
+        self.assertEqual(self.db.execute('SELECT dut FROM result').fetchone()[0], 'base-7.0')
+
+    def test_series_median(self):
+        ingest(self.db, [self.result(1000.0+i, V) for i, V in enumerate([1.0, 5.0, 2.0])], 'r1', seq=1.0)
+        [points] = series(self.db).values()
+        self.assertEqual(points, [('r1', 1000.0, 2.0)])
+
+    def test_series_order(self):
+        'Ordered by revision, not by when the results were ingested'
+        ingest(self.db, [self.result(2000.0, 20.0)], 'r2', seq=2.0)
+        ingest(self.db, [self.result(3000.0, 30.0)], 'r3', seq=3.0)
+        ingest(self.db, [self.result(4000.0, 10.0)], 'r1', seq=1.0) # backfilled
+        ingest(self.db, [self.result(5000.0, 22.0)], 'r2', seq=2.0) # re-run
+        [points] = series(self.db).values()
+        self.assertEqual([P[0] for P in points], ['r1', 'r2', 'r3'])
+        self.assertEqual(points[1], ('r2', 2000.0, 21.0))
+
+    def test_series_keys(self):
+        'One series for each combination of keys'
+        other = dict(self.bench, dut='pcas')
+        ingest(self.db, [self.bench, other], 'r1', seq=1.0)
+        self.assertEqual(sorted([K[4] for K in series(self.db)]), ['pcas', 'softIoc'])
+
+    def test_changepoints_step(self):
+        R = random.Random(1)
+        values = [100.0+R.gauss(0, 1) for i in range(15)]+[130.0+R.gauss(0, 1) for i in range(15)]
+        [(i, m1, m2, p)] = changepoints(values)
+        self.assertEqual(i, 15)
+        self.assertAlmostEqual(m2/m1, 1.3, places=1)
+        self.assertLess(p, 0.01)
+
+    def test_changepoints_noise(self):
+        R = random.Random(1)
+        self.assertEqual(changepoints([100.0+R.gauss(0, 1) for i in range(30)]), [])
+
+    def test_changepoints_minchange(self):
+        'Significant, but smaller than minchange'
+        values = [100.0, 100.1]*8+[101.0, 101.1]*8
+        self.assertEqual(changepoints(values, minchange=0.05), [])
+        self.assertEqual([C[0] for C in changepoints(values, minchange=0.005)], [16])
+
+    def test_changepoints_short(self):
+        self.assertEqual(changepoints([]), [])
+        self.assertEqual(changepoints([1.0, 2.0, 3.0]), [])
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
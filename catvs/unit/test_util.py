@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Tests of the harness itself, which do not need a DUT
+"""
+
+import unittest, logging, os, sys
+from ..util import Msg, MsgParser, PVSet, ACF, DUTPool
+
+class TestMsgParser(unittest.TestCase):
+    'Framing of a stream of CA messages'
+
+    msgs = [
+        Msg(cmd=0, dcnt=13),
+        Msg(cmd=18, p1=156, p2=13, body=b'ival'),
+        Msg(cmd=1, dtype=5, dcnt=1, p1=1, p2=42, body=b'\0\0\0\x2a'),
+        Msg(cmd=23),
+    ]
+
+    def ext(self, cmd=1, size=24, dcnt=100000, p1=1, p2=2):
+        'Serialized message with an extended header'
+        return Msg._head.pack(cmd, 0xffff, 5, 0, p1, p2)+Msg._head_ext.pack(size, dcnt)+bytes(range(size))
+
+    def assertMsgs(self, actual, expect):
+        self.assertEqual([M.pack() for M in actual], [M.pack() for M in expect])
+
+    def test_whole(self):
+        P = MsgParser()
+        P.feed(b''.join([M.pack() for M in self.msgs]))
+        self.assertMsgs(list(P), self.msgs)
+        self.assertEqual(len(P), 0)
+        self.assertIsNone(P.next())
+
+    def test_split(self):
+        'Split at every byte boundary'
+        raw = b''.join([M.pack() for M in self.msgs])
+        for i in range(len(raw)+1):
+            P = MsgParser()
+            P.feed(raw[:i])
+            got = list(P)
+            P.feed(raw[i:])
+            got += list(P)
+            self.assertMsgs(got, self.msgs)
+            self.assertEqual(len(P), 0, i)
+
+    def test_bytewise(self):
+        'Fed one byte at a time'
+        raw = b''.join([M.pack() for M in self.msgs])
+        P = MsgParser()
+        got = []
+        for i in range(len(raw)):
+            P.feed(raw[i:i+1])
+            got += list(P)
+        self.assertMsgs(got, self.msgs)
+
+    def test_header_straddle(self):
+        'Header split across two feeds is not parsed until complete'
+        P = MsgParser()
+        raw = Msg(cmd=18, p1=1, p2=13, body=b'ival').pack()
+        P.feed(raw[:10])
+        self.assertIsNone(P.next())
+        self.assertEqual(len(P), 10)
+        P.feed(raw[10:])
+        M = P.next()
+        self.assertEqual((M.cmd, M.size, M.p1, M.p2, M.body), (18, 8, 1, 13, b'ival\0\0\0\0'))
+
+    def test_extended(self):
+        'Extended header, with size and dcnt from the second part'
+        raw = self.ext()
+        for i in (0, 16, 20, 24, 30, len(raw)):
+            P = MsgParser()
+            P.feed(raw[:i])
+            if i<len(raw):
+                self.assertIsNone(P.next(), i)
+            P.feed(raw[i:])
+            M = P.next()
+            self.assertEqual((M.cmd, M.size, M.dcnt, M.p1, M.p2), (1, 24, 100000, 1, 2))
+            self.assertEqual(M.body, bytes(range(24)))
+            self.assertEqual(len(P), 0)
+
+    def test_extended_dcnt(self):
+        'dcnt of 0xffff also flags an extended header'
+        raw = Msg._head.pack(1, 8, 5, 0xffff, 0, 0)+Msg._head_ext.pack(8, 70000)+b'\1'*8+Msg(cmd=23).pack()
+        P = MsgParser()
+        P.feed(raw)
+        M = P.next()
+        self.assertEqual((M.size, M.dcnt, M.body), (8, 70000, b'\1'*8))
+        self.assertEqual(P.next().cmd, 23)
+
+    def test_view_tally(self):
+        'view() and tally() frame the same as next()'
+        raw = b''.join([M.pack() for M in self.msgs])+self.ext()
+        P = MsgParser()
+        P.feed(raw)
+        V = []
+        while True:
+            M = P.view()
+            if M is None:
+                break
+            V.append((M.cmd, M.size, M.dcnt, M.p2, bytes(M.body)))
+        self.assertEqual(V, [(M.cmd, M.size, M.dcnt, M.p2, M.body) for M in self.msgs]
+                         +[(1, 24, 100000, 2, bytes(range(24)))])
+
+        P = MsgParser()
+        counts = {}
+        P.feed(raw[:-1])
+        self.assertEqual(P.tally(counts), len(self.msgs))
+        P.feed(raw[-1:])
+        self.assertEqual(P.tally(counts), 1)
+        self.assertEqual(counts, {(0, 0):1, (18, 13):1, (1, 42):1, (23, 0):1, (1, 2):1})
+
+    def test_compact(self):
+        'Consumed bytes are dropped once past compact'
+        P = MsgParser()
+        P.compact = 64
+        M = Msg(cmd=1, p2=7, body=b'x'*8).pack() # 24 bytes
+        N = 0
+        for i in range(20):
+            # always leave a partial message so the buffer is not simply cleared
+            P.feed(M+M[:5] if i==0 else M[5:]+M+M[:5])
+            while P.next() is not None:
+                N += 1
+            self.assertLessEqual(P.pos, P.compact+2*len(M))
+            self.assertLessEqual(len(P.buf), P.compact+3*len(M))
+            self.assertEqual(len(P), 5)
+        self.assertEqual(N, 1+2*19)
+        P.feed(M[5:])
+        self.assertEqual(P.next().pack(), M)
+        self.assertEqual(len(P.buf), 0)
+
+    def test_stream(self):
+        raw = b''.join([M.pack() for M in self.msgs])
+        chunks = [raw[i:i+7] for i in range(0, len(raw), 7)]
+        self.assertMsgs(list(MsgParser().stream(chunks)), self.msgs)
+
+    def test_stream_truncated(self):
+        raw = b''.join([M.pack() for M in self.msgs])
+        # first message is 16 bytes, the second 24
+        for cut, left in ((1, 1), (15, 15), (17, 1), (39, 23)):
+            with self.assertRaisesRegex(RuntimeError, "Truncated message, %d bytes left"%left):
+                list(MsgParser().stream([raw, raw[:cut]]))
+
+class TestPoolKey(unittest.TestCase):
+    'DUTs are pooled by value of the configuration'
+
+    def test_equal(self):
+        A = DUTPool._key('dut', PVSet(10, types=('LONG', 'DOUBLE')), ACF(nrule=5), None)
+        B = DUTPool._key('dut', PVSet(10, types=('LONG', 'DOUBLE')), ACF(nrule=5), None)
+        self.assertEqual(A, B)
+        self.assertEqual(hash(A), hash(B))
+
+    def test_differ(self):
+        A = DUTPool._key('dut', PVSet(10), None, None)
+        self.assertNotEqual(A, DUTPool._key('dut', PVSet(11), None, None))
+        self.assertNotEqual(A, DUTPool._key('dut', PVSet(10, fields={'MDEL':'1'}), None, None))
+        self.assertNotEqual(A, DUTPool._key('dut', PVSet(10), ACF(), None))
+        self.assertNotEqual(A, DUTPool._key('other', PVSet(10), None, None))
+
+class TestPool(unittest.TestCase):
+    '''Pool of a stand-in DUT, which listens on its port after a delay.
+    Needs no CA server.
+    '''
+    dut = sys.executable+''' -c "import os, socket, time
+time.sleep(float(os.environ.get('DELAY', '0')))
+S = socket.socket()
+S.bind(('127.0.0.1', int(os.environ['EPICS_CA_SERVER_PORT'])))
+S.listen(5)
+time.sleep(30)"'''
+
+    def setUp(self):
+        self.pool = DUTPool(1, wait=0.3)
+        self.addCleanup(self.pool.close)
+
+    def settle(self):
+        for W in list(self.pool.workers):
+            W.join()
+
+    def test_wait(self):
+        'Spares are given the wait of the test'
+        dut = 'DELAY=0.6 '+self.dut
+        P = self.pool.acquire(dut, testname='slow', wait=5.0)
+        self.assertTrue(P.waitReady(5.0))
+        self.pool.retire(P)
+        self.settle()
+        self.assertEqual(len(self.pool.spares[DUTPool._key(dut, None, None, 'slow')]), 1)
+
+    def test_lru(self):
+        'Spares of recently used configurations are kept'
+        self.pool.nkeys = 2
+        def use(name):
+            P = self.pool.acquire(self.dut, testname=name)
+            self.assertTrue(P.waitReady(5.0))
+            self.pool.retire(P)
+            self.settle()
+        key = lambda name:DUTPool._key(self.dut, None, None, name)
+
+        use('A')
+        use('B')
+        use('A')
+        self.assertEqual(sorted(self.pool.spares), sorted([key('A'), key('B')]))
+        use('C') # B is the least recently used
+        self.assertEqual(sorted(self.pool.spares), sorted([key('A'), key('C')]))
+        for Q in self.pool.spares.values():
+            self.assertEqual(len(Q), 1)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import unittest, logging, os, json, threading, itertools, random
+from ..util import Msg, TempDir
+from ..bench import bench_workload
+from ..bench.bench_workload import load, Client
+
+class TestLoad(unittest.TestCase):
+    'Checking of workload files'
+
+    spec = {
+        'pvs':{'count':10, 'pattern':'wl:%d'},
+        'clients':{'opi':{'count':2}},
+        'phases':[{'name':'steady', 'duration':1.0,
+                   'load':{'opi':{'rate':5, 'mix':{'get':1, 'search_missing':1}}}}],
+    }
+
+    def setUp(self):
+        self.TDIR = TempDir()
+        self.addCleanup(self.TDIR.close)
+
+    def write(self, spec):
+        fname = os.path.join(self.TDIR.dir, 'workload.json')
+        with open(fname, 'w') as F:
+            json.dump(spec, F)
+        return fname
+
+    def modified(self, edit):
+        spec = json.loads(json.dumps(self.spec)) # deep copy
+        edit(spec)
+        return self.write(spec)
+
+    def assertBad(self, edit, msg):
+        with self.assertRaisesRegex(ValueError, msg):
+            load(self.modified(edit))
+
+    def test_ok(self):
+        self.assertEqual(load(self.write(self.spec)), self.spec)
+
+    def test_default(self):
+        'The bundled example'
+        spec = load(bench_workload.TestWorkload.default)
+        self.assertIn('phases', spec)
+
+    def test_missing(self):
+        for K in ('pvs', 'clients', 'phases'):
+            self.assertBad(lambda S:S.pop(K), "missing '%s'"%K)
+        self.assertBad(lambda S:S['phases'][0].pop('duration'), "phase missing 'duration'")
+
+    def test_population(self):
+        self.assertBad(lambda S:S['phases'][0]['load'].update({'archiver':{}}), "unknown population 'archiver'")
+
+    def test_load_key(self):
+        self.assertBad(lambda S:S['phases'][0]['load']['opi'].update({'ratee':1}), r"unknown \['ratee'\]")
+
+    def test_op(self):
+        self.assertBad(lambda S:S['phases'][0]['load']['opi']['mix'].update({'monitor':1}),
+                       r"unknown operation \['monitor'\]")
+
+    def test_pvs(self):
+        'pvs must be arguments of PVSet'
+        self.assertBad(lambda S:S['pvs'].update({'nelms':[1]}), "bad 'pvs'")
+        self.assertBad(lambda S:S['pvs'].pop('count'), "bad 'pvs'")
+
+class TestClientHandle(unittest.TestCase):
+    'Reply matching by the circuit reader, without a circuit'
+
+    def setUp(self):
+        self.C = Client.__new__(Client)
+        self.C.lock = threading.Lock()
+        self.C.pending, self.C.nupdate, self.C.closed = {}, 0, False
+
+    def test_error(self):
+        E = [threading.Event(), None]
+        self.C.pending[('get', 7)] = E
+        req = Msg(cmd=15, dtype=5, dcnt=1, p1=3, p2=7)
+        self.C.handle(None, Msg(cmd=11, p2=48, body=req.pack()+b'oops'))
+        self.assertTrue(E[0].is_set())
+        self.assertEqual(E[1].cmd, 11)
+
+    def test_error_short(self):
+        'ERROR with a body too short to hold a request header is logged and ignored'
+        with self.assertLogs('catvs.bench.bench_workload', logging.ERROR):
+            self.C.handle(None, Msg(cmd=11, body=b'short'))
+        self.C.handle(None, Msg(cmd=1, p2=5))
+        self.assertEqual(self.C.nupdate, 1)
+
+class _Circuit(object):
+    'Replies to CREATE_CHAN at once'
+    def __init__(self, client):
+        self.client = client
+    def send(self, msg):
+        for M in msg:
+            self.client.handle(self, Msg(cmd=18, dtype=6, dcnt=1, p1=M.p1, p2=1000+M.p1))
+
+class TestClientCreate(unittest.TestCase):
+    'Channel creation, without a circuit'
+
+    def setUp(self):
+        self.C = Client.__new__(Client)
+        self.C.lock = threading.Lock()
+        self.C.pending, self.C.chans, self.C.closed = {}, {}, False
+        self.C.ids, self.C.R, self.C.names = itertools.count(1), random.Random(1), ['a', 'b']
+        self.C.timeout = 1.0
+        self.C.C = _Circuit(self.C)
+
+        # a clock which ticks once for each call
+        clock = itertools.count()
+        orig, bench_workload.now = bench_workload.now, lambda:float(next(clock))
+        self.addCleanup(setattr, bench_workload, 'now', orig)
+
+        self.times = []
+        finish = self.C.finish
+        def record(E, cmd, stats, op, T0):
+            self.times.append(T0)
+            return finish(E, cmd, stats, op, T0)
+        self.C.finish = record
+
+    def test_windows(self):
+        'More than one window.  Each request is timed from its own send'
+        stats = {'lat':{}, 'errors':0}
+        self.C.create(10, stats, window=4)
+        self.assertEqual(len(self.C.chans), 10)
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual(len(set(self.times)), 10)
+        self.assertEqual(self.times, sorted(self.times))
+
+    def test_due(self):
+        'From the due time, when given'
+        stats = {'lat':{}, 'errors':0}
+        self.C.create(6, stats, window=4, T0=-5.0)
+        self.assertEqual(self.times, [-5.0]*6)
+
+if __name__=='__main__':
+    if 'LOGLEVEL' in os.environ:
+        logging.basicConfig(level=logging.getLevelName(os.environ['LOGLEVEL']))
+    unittest.main()
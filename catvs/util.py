@@ -5,7 +5,7 @@ Created on Sat Jul 30 13:04:26 2016
 @author: mdavidsaver
 """
 
-import sys, os, time, errno, signal, threading
+import sys, os, time, errno, signal, threading, pty, subprocess
 import socket, logging, shutil
 from struct import Struct
 
@@ -13,10 +13,17 @@ _log = logging.getLogger(__name__)
 
 __all__ = [
     'Msg',
+    'MsgView',
+    'MsgParser',
     'TestMixinUDP',
     'TestMixinClient',
     'TestMixinServer',
     'TestMixinRunServer',
+    'DUTProcess',
+    'DUTPool',
+    'PVSet',
+    'ACF',
+    'SockProfile',
 ]
 
 _msgname = {
@@ -50,6 +57,47 @@ _msgname = {
     27:'SERVER_DISCONN   ',
 }
 
+def _children(pid):
+    'List PIDs of the child processes of pid'
+    try:
+        with open('/proc/%d/task/%d/children'%(pid, pid)) as F:
+            return [int(C) for C in F.read().split()]
+    except IOError as e:
+        if e.errno!=errno.ENOENT:
+            raise
+    # kernel w/o CONFIG_PROC_CHILDREN
+    ret = []
+    for C in os.listdir('/proc'):
+        if not C.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat'%C) as F:
+                ppid = int(F.read().rsplit(')',1)[1].split()[1])
+        except IOError:
+            continue # already exited
+        if ppid==pid:
+            ret.append(int(C))
+    return ret
+
+def procStats(pid):
+    'Returns a dict with rss (bytes), fds (count), and cpu (seconds) of a process'
+    with open('/proc/%d/status'%pid) as F:
+        for L in F:
+            if L.startswith('VmRSS:'):
+                rss = int(L.split()[1])*1024
+                break
+        else:
+            rss = 0 # zombie
+    with open('/proc/%d/stat'%pid) as F:
+        fields = F.read().rsplit(')',1)[1].split()
+    # utime and stime are fields 14 and 15 of stat, the 12th and 13th after comm
+    cpu = (int(fields[11])+int(fields[12]))/float(os.sysconf('SC_CLK_TCK'))
+    return {
+        'rss':rss,
+        'fds':len(os.listdir('/proc/%d/fd'%pid)),
+        'cpu':cpu,
+    }
+
 class TempDir(object):
     def __init__(self):
         self.dir = None
@@ -76,7 +124,7 @@ class SpamThread(threading.Thread):
         self._pr, self._pw = os.pipe()
         self.fd = fd
     def join(self):
-        os.write(self._pw, ' ')
+        os.write(self._pw, b' ')
         ret = threading.Thread.join(self)
         os.close(self._pr)
         os.close(self._pw)
@@ -95,12 +143,12 @@ class SpamThread(threading.Thread):
                         return
                     raise
                 if len(B):
-                    sys.stdout.write(B)
+                    sys.stdout.write(B.decode('utf-8', 'replace'))
             if self._pr in R:
                 break
 
 class Msg(object):
-    'A CA message'
+    'A CA message.  The body is bytes'
     _head = Struct("!HHHHII")
     _head_ext = Struct("!II")
     _sub_body = Struct("!fffH")
@@ -108,42 +156,404 @@ class Msg(object):
     def __init__(self, **kws):
         'Build CA message'
         self.cmd = self.size = self.dtype = self.dcnt = self.p1 = self.p2 = 0
-        self.body = kws.pop('body','')
+        self.body = kws.pop('body',b'')
         for K,V in kws.items():
             setattr(self, K, V)
         BL = len(self.body)
         if BL%8:
-            self.body = self.body + '\0'*(8-BL%8)
+            self.body = self.body + b'\0'*(8-BL%8)
         self.size = len(self.body)
         assert self.size%8==0, self.size
 
     @classmethod
-    def unpack(klass, bytes):
+    def unpack(klass, data):
         'Unpack basic (short) CA header'
+        I = klass.unpack_from(data)
+        return I, data[klass._head.size:]
+
+    @classmethod
+    def unpack_from(klass, buf, offset=0):
+        'Unpack basic (short) CA header from any buffer w/o copying'
         I = klass()
-        I.cmd, I.size, I.dtype, I.dcnt, I.p1, I.p2 = klass._head.unpack(bytes[:klass._head.size])
-        bytes = bytes[klass._head.size:]
-        return I, bytes
+        I.cmd, I.size, I.dtype, I.dcnt, I.p1, I.p2 = klass._head.unpack_from(buf, offset)
+        return I
 
     def pack(self):
         'Serialize CA message'
-        B = self.body or ''
+        B = self.body or b''
         self.size = len(B)
         H = self._head.pack(self.cmd, self.size, self.dtype, self.dcnt, self.p1, self.p2)
         return H+B
 
     def __str__(self):
-        S = vars(self)
-        S['cmdname']='%s(%2d)'%(_msgname.get(self.cmd, 'UNKNOWN'), self.cmd)
-        self.size = len(self.body or '')
-        S['body'] = self.body[:16] + ('...' if self.size>16 else '')
-        return 'Msg(cmd=%(cmdname)s, size=%(size)d, dtype=%(dtype)d, dcnt=%(dcnt)d, p1=%(p1)d, p2=%(p2)d, body="%(body)s")'%vars(self)
+        B = self.body or b''
+        return 'Msg(cmd=%s(%2d), size=%d, dtype=%d, dcnt=%d, p1=%d, p2=%d, body=%r%s)'%(
+            _msgname.get(self.cmd, 'UNKNOWN'), self.cmd, len(B),
+            self.dtype, self.dcnt, self.p1, self.p2,
+            bytes(B[:16]), '...' if len(B)>16 else '')
+    __repr__ = __str__
+
+class MsgView(object):
+    '''A CA message parsed lazily from a buffer.  See MsgParser.view()
+
+    Header fields are decoded on first access.  The body is a memoryview.
+    '''
+    __slots__ = ('_buf', '_off', '_hs', 'size', 'cmd', 'dtype', 'dcnt', 'p1', 'p2')
+
+    def __init__(self, buf, off, hs, size):
+        self._buf, self._off, self._hs, self.size = buf, off, hs, size
+
+    def __getattr__(self, name):
+        if name not in ('cmd', 'dtype', 'dcnt', 'p1', 'p2'):
+            raise AttributeError(name)
+        self.cmd, _size, self.dtype, self.dcnt, self.p1, self.p2 = Msg._head.unpack_from(self._buf, self._off)
+        if self._hs>Msg._head.size:
+            _size, self.dcnt = Msg._head_ext.unpack_from(self._buf, self._off+Msg._head.size)
+        return getattr(self, name)
+
+    @property
+    def body(self):
+        start = self._off+self._hs
+        return self._buf[start:start+self.size]
+
+    def pack(self):
+        'Serialized message, as received'
+        return bytes(self._buf[self._off:self._off+self._hs+self.size])
+
+    __str__ = Msg.__str__
+    __repr__ = __str__
+
+class MsgParser(object):
+    '''Incremental parser of a stream of CA messages.
+
+    feed() bytes in chunks of any size, then take complete messages
+    with next() or by iteration.  A partial message is kept until
+    the rest is fed.  Consumed bytes are dropped from the front of
+    the buffer lazily, not as each message is parsed.
+
+    Usable with any source of bytes.  eg. to read a file
+
+      for M in MsgParser().stream(iter(lambda:F.read(65536), b'')):
+          print(M)
+    '''
+    compact = 65536 # drop consumed bytes when more than this
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.pos = 0 # start of the first unparsed message in buf
+        self._snap = None # (immutable copy of buf, from offset) for view()
+
+    def __len__(self):
+        'Number of bytes not yet parsed'
+        return len(self.buf)-self.pos
+
+    def feed(self, data):
+        if self.pos>self.compact:
+            del self.buf[:self.pos]
+            self.pos = 0
+        self.buf += data
+        self._snap = None
+
+    @staticmethod
+    def _frame_at(buf, pos, end):
+        '''Frame the message at buf[pos:end].  The only place headers are framed.
+
+        Returns (header fields, header size, body size) of a complete message,
+        or None.  The header fields are those of the short header, with size
+        and dcnt replaced from an extended header.
+        '''
+        HS = Msg._head.size
+        if end-pos<HS:
+            return None
+        H = Msg._head.unpack_from(buf, pos)
+        cmd, size, dtype, dcnt, p1, p2 = H
+        if size==0xffff or dcnt==0xffff:
+            HS += Msg._head_ext.size
+            if end-pos<HS:
+                return None
+            size, dcnt = Msg._head_ext.unpack_from(buf, pos+Msg._head.size)
+            H = (cmd, size, dtype, dcnt, p1, p2)
+        if end-pos<HS+size:
+            return None
+        return H, HS, size
+
+    def _frame(self):
+        'Returns (header fields, header size, body size) of the next complete message, or None'
+        return self._frame_at(self.buf, self.pos, len(self.buf))
+
+    def _consume(self, N):
+        self.pos += N
+        if self.pos==len(self.buf):
+            del self.buf[:] # cheaper than waiting to compact
+            self.pos = 0
+            self._snap = None
+
+    def next(self):
+        'Returns the next complete message, or None'
+        F = self._frame()
+        if F is None:
+            return None
+        H, HS, size = F
+        M = Msg()
+        M.cmd, M.size, M.dtype, M.dcnt, M.p1, M.p2 = H
+        M.body = bytes(self.buf[self.pos+HS:self.pos+HS+size])
+        self._consume(HS+size)
+        return M
+
+    def view(self):
+        '''Returns the next complete message as a MsgView, or None.
+
+        Cheaper than next() when few fields, or not the body, are used.
+        The buffer is copied once after each feed(), not for each message.
+        '''
+        F = self._frame()
+        if F is None:
+            return None
+        if self._snap is None:
+            with memoryview(self.buf) as V:
+                self._snap = (memoryview(bytes(V[self.pos:])), self.pos)
+        snap, base = self._snap
+        _H, HS, size = F
+        M = MsgView(snap, self.pos-base, HS, size)
+        self._consume(HS+size)
+        return M
+
+    def tally(self, counts):
+        '''Consume all complete messages, without decoding them, only counting
+        in 'counts', a dict of (cmd, p2) -> count.  Returns the number consumed.
+        '''
+        buf, pos, end = self.buf, self.pos, len(self.buf)
+        frame = self._frame_at
+        N = 0
+        while True:
+            F = frame(buf, pos, end)
+            if F is None:
+                break
+            H, HS, size = F
+            pos += HS+size
+            K = (H[0], H[5]) # (cmd, p2)
+            counts[K] = counts.get(K, 0)+1
+            N += 1
+        self._consume(pos-self.pos)
+        return N
+
+    def __iter__(self):
+        while True:
+            M = self.next()
+            if M is None:
+                break
+            yield M
+
+    def stream(self, chunks):
+        'Generator of messages parsed from an iterable of byte chunks'
+        for B in chunks:
+            self.feed(B)
+            for M in self:
+                yield M
+        if len(self):
+            raise RuntimeError("Truncated message, %d bytes left"%len(self))
+
+class PVSet(object):
+    '''A generated population of PVs to be served by the DUT.
+
+    Written to a file which is passed to the DUT as $TEST_PVLIST.
+    One PV per line as
+
+      <name> <type> <count> [<field>=<value> ...]
+
+    where <type> is one of LONG, SHORT, or DOUBLE.
+    Types and array sizes are assigned round robin from 'types' and 'nelm'.
+    'fields' is a dict of record fields for all PVs, or a list of dicts
+    also assigned round robin.
+    '''
+    def __init__(self, count, pattern='pv:%d', types=('LONG',), nelm=(1,), fields=None):
+        self.count = count
+        self.pattern = pattern
+        self.types = types
+        self.nelm = nelm
+        self.fields = fields or {}
+
+    def __len__(self):
+        return self.count
+
+    def names(self):
+        return [self.pattern%i for i in range(self.count)]
+
+    def missing(self, count):
+        'Names which are not served by the DUT'
+        return ['no'+self.pattern%i for i in range(count)]
+
+    def entries(self):
+        'Yield tuples of (name, type, count)'
+        NT, NE = len(self.types), len(self.nelm)
+        for i, name in enumerate(self.names()):
+            yield name, self.types[i%NT], self.nelm[i%NE]
+
+    def write(self, fname):
+        fields = self.fields if isinstance(self.fields, (list, tuple)) else [self.fields]
+        extra = [''.join([' %s=%s'%(K,V) for K,V in sorted(E.items())]) for E in fields]
+        with open(fname, 'w') as F:
+            for i, (name, T, N) in enumerate(self.entries()):
+                F.write('%s %s %d%s\n'%(name, T, N, extra[i%len(extra)]))
+
+class ACF(object):
+    '''A generated access security configuration for the DUT.
+
+    Written to a file which is passed to the DUT as $TEST_ACF.
+    Defines 'ngroup' user (UAG) and host (HAG) access groups of 'nmember'
+    names each, and 'nasg' access security groups named asg0, asg1, ...
+    (see asgs()) each with 'nrule' WRITE rules.  Rule i refers to
+    the UAG and HAG i%ngroup .  'users' and 'hosts' are added to the UAG
+    and HAG used by the last rule, (nrule-1)%ngroup , so every rule which
+    uses that group also grants them WRITE.  The server evaluates all
+    rules either way, so the size of the ACF, not the order of the rules,
+    is what is exercised.  Clients which don't match any rule have READ access.
+
+    With 'gate', a PV name, WRITE rules also require that PV be non-zero.
+    Changing it changes the access rights of every channel in these ASGs.
+
+    PVs are placed in an ASG with the ASG field.  eg. with
+    PVSet(fields=[{'ASG':A} for A in acf.asgs()])
+    '''
+    def __init__(self, nasg=1, nrule=10, ngroup=10, nmember=10, users=(), hosts=(), gate=None):
+        self.nasg = nasg
+        self.nrule = nrule
+        self.ngroup = ngroup
+        self.nmember = nmember
+        self.users = users
+        self.hosts = hosts
+        self.gate = gate
+
+    def asgs(self):
+        return ['asg%d'%i for i in range(self.nasg)]
+
+    def write(self, fname):
+        last = (self.nrule-1)%self.ngroup
+        with open(fname, 'w') as F:
+            for kind, pre, extra in (('UAG', 'user', self.users), ('HAG', 'host', self.hosts)):
+                for i in range(self.ngroup):
+                    members = ['%s%d_%d'%(pre, i, j) for j in range(self.nmember)]
+                    if i==last:
+                        members.extend(extra)
+                    F.write('%s(%s%d) {%s}\n'%(kind, kind.lower(), i, ', '.join(members)))
+
+            F.write('ASG(DEFAULT) {\n    RULE(1, WRITE)\n}\n')
+            for asg in self.asgs():
+                F.write('ASG(%s) {\n'%asg)
+                if self.gate is not None:
+                    F.write('    INPA("%s")\n'%self.gate)
+                F.write('    RULE(1, READ)\n')
+                for i in range(self.nrule):
+                    G = i%self.ngroup
+                    F.write('    RULE(1, WRITE) {\n        UAG(uag%d)\n        HAG(hag%d)\n'%(G, G))
+                    if self.gate is not None:
+                        F.write('        CALC("A!=0")\n')
+                    F.write('    }\n')
+                F.write('}\n')
+
+# Linux, not exported by the socket module
+SO_BUSY_POLL = getattr(socket, 'SO_BUSY_POLL', 46)
+
+class SockProfile(object):
+    '''Socket options used for all client sockets.
+
+    Selected by $SOCKPROFILE as a preset name, optionally followed by
+    overrides.  eg. "ca" or "ca,rcvbuf=262144,busy_poll=50"
+
+      nodelay    - Set TCP_NODELAY (0 or 1)
+      rcvbuf     - TCP SO_RCVBUF (bytes, 0 for OS default)
+      sndbuf     - TCP SO_SNDBUF (bytes, 0 for OS default)
+      chunk      - TCP recv() size (bytes)
+      dgram      - UDP recvfrom() size (bytes)
+      udp_rcvbuf - UDP SO_RCVBUF (bytes, 0 for OS default)
+      busy_poll  - SO_BUSY_POLL (microseconds, 0 to disable).  Linux only,
+                   and may need CAP_NET_ADMIN
+
+    Presets are "harness" (the default, as this harness has always been),
+    "ca" (as libca), and "fast".
+    '''
+    presets = {
+        'harness':{'nodelay':0, 'rcvbuf':0, 'sndbuf':0, 'chunk':1024, 'dgram':4096,
+                   'udp_rcvbuf':0, 'busy_poll':0},
+        'ca':{'nodelay':1, 'rcvbuf':0, 'sndbuf':0, 'chunk':16384, 'dgram':65536,
+              'udp_rcvbuf':0, 'busy_poll':0},
+        'fast':{'nodelay':1, 'rcvbuf':2**20, 'sndbuf':2**20, 'chunk':65536, 'dgram':65536,
+                'udp_rcvbuf':4*2**20, 'busy_poll':50},
+    }
+
+    def __init__(self, spec='harness'):
+        parts = [P.strip() for P in spec.split(',') if P.strip()]
+        self.name = parts.pop(0) if parts and '=' not in parts[0] else 'harness'
+        if self.name not in self.presets:
+            raise ValueError("Unknown socket profile '%s'"%self.name)
+        self.opts = dict(self.presets[self.name])
+        for P in parts:
+            K, _sep, V = P.partition('=')
+            if K not in self.opts:
+                raise ValueError("Unknown socket profile option '%s'"%K)
+            self.opts[K] = int(V)
+        for K, V in self.opts.items():
+            setattr(self, K, V)
+
+    @classmethod
+    def fromEnv(klass):
+        return klass(os.environ.get('SOCKPROFILE', 'harness'))
+
+    def __str__(self):
+        return '%s(%s)'%(self.name, ', '.join(['%s=%d'%E for E in sorted(self.opts.items())]))
     __repr__ = __str__
 
+    def asdict(self):
+        R = dict(self.opts)
+        R['name'] = self.name
+        return R
+
+    def _setopt(self, S, level, opt, val, name):
+        try:
+            S.setsockopt(level, opt, val)
+        except socket.error as e:
+            _log.warning("Unable to set %s=%d : %s", name, val, e)
+
+    def applyTCP(self, S):
+        'Apply to a TCP socket.  Call before connect() or listen()'
+        if self.nodelay:
+            self._setopt(S, socket.IPPROTO_TCP, socket.TCP_NODELAY, 1, 'TCP_NODELAY')
+        if self.rcvbuf:
+            self._setopt(S, socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf, 'SO_RCVBUF')
+        if self.sndbuf:
+            self._setopt(S, socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf, 'SO_SNDBUF')
+        if self.busy_poll:
+            self._setopt(S, socket.SOL_SOCKET, SO_BUSY_POLL, self.busy_poll, 'SO_BUSY_POLL')
+
+    def applyUDP(self, S):
+        if self.udp_rcvbuf:
+            self._setopt(S, socket.SOL_SOCKET, socket.SO_RCVBUF, self.udp_rcvbuf, 'SO_RCVBUF')
+        if self.busy_poll:
+            self._setopt(S, socket.SOL_SOCKET, SO_BUSY_POLL, self.busy_poll, 'SO_BUSY_POLL')
+
+    def connect(self, peer, timeout):
+        'Returns a TCP socket connected to peer'
+        S = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.applyTCP(S)
+            S.settimeout(timeout)
+            S.connect(peer)
+        except:
+            S.close()
+            raise
+        return S
+
 class TestMixinUDP(object):
     timeout = 0.5
+    lazy = False # recvTCP() returns MsgView
+    prof = None # HarnessProfile when $PROFILE is set
+    sockprof = None # SockProfile, default from $SOCKPROFILE
     def setUp(self):
+        if self.sockprof is None:
+            self.sockprof = SockProfile.fromEnv()
+
         S = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sockprof.applyUDP(S)
         S.bind(('127.0.0.1',0))
         _addr, self.uport = S.getsockname()
         S.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
@@ -152,9 +562,26 @@ class TestMixinUDP(object):
         self.usock = S
         self.addCleanup(self._sock_close)
 
+        # traffic and compatibility branches for catvs.results
+        self.counters = {'tx_msg':0, 'tx_bytes':0, 'rx_msg':0, 'rx_bytes':0}
+        self.branches = []
+
+        if os.environ.get('PROFILE'):
+            from .prof import HarnessProfile
+            self.prof = HarnessProfile()
+            self.prof.attach(self)
+            self.prof.start()
+            self.addCleanup(self.prof.finish, self)
+
     def tearDown(self):
         pass # placeholder
 
+    def compat(self, name):
+        'Note that a known server specific behaviour was seen'
+        _log.debug("compat %s", name)
+        if name not in self.branches:
+            self.branches.append(name)
+
     def _sock_close(self):
         for N in ('usock', 'sess', 'server'):
             S = getattr(self, N, None)
@@ -164,61 +591,87 @@ class TestMixinUDP(object):
 
     def recvUDP(self):
         'Receive one UDP packet and return a list of CA messages'
-        pkt, src = self.usock.recvfrom(4096)
+        pkt, src = self.usock.recvfrom(self.sockprof.dgram)
         _log.debug("udp -->")
-        msg = []
-        while len(pkt):
-            M, pkt = Msg.unpack(pkt)
-            M.body = pkt[:M.size]
-            pkt = pkt[M.size:]
-            msg.append(M)
+        P = MsgParser()
+        P.feed(pkt)
+        msg = list(P)
+        if len(P):
+            raise RuntimeError("Truncated message in UDP packet, %d bytes left"%len(P))
+        for M in msg:
             _log.debug("  %s", M)
+        self.counters['rx_msg'] += len(msg)
+        self.counters['rx_bytes'] += len(pkt)
         return msg
 
     def sendUDP(self, msg):
         _log.debug("udp <--")
         for M in msg:
             _log.debug("  %s", M)
-        pkt = ''.join([M.pack() for M in msg])
+        pkt = b''.join([M.pack() for M in msg])
+        self.counters['tx_msg'] += len(msg)
+        self.counters['tx_bytes'] += len(pkt)
         self.usock.sendto(pkt, ('127.0.0.1', self.testport))
 
-    def ensureTCP(self, N):
-        'Block until at least N bytes have been received'
-        while len(self.rxbuf)<N:
-            B = self.sess.recv(1024)
-            if len(B)==0:
-                return False
-            self.rxbuf = self.rxbuf+B
-        return True
-
     def recvTCP(self):
-        'Recieve a single CA message from the TCP client'
+        '''Recieve a single CA message from the TCP client.
+        A MsgView if 'lazy' is set, otherwise a Msg
+        '''
         assert self.sess is not None
-        if not self.ensureTCP(Msg._head.size):
-            _log.debug("tcp --> Closed")
-            return None
-        pkt, self.rxbuf = Msg.unpack(self.rxbuf)
-        if pkt.size==0xffff or pkt.dcnt==0xffff:
-            self.ensureTCP(Msg._head_ext.size)
-            pkt.size, pkt.dcnt = Msg._head_ext.unpack(self.rxbuf[:Msg._head_ext.size])
-            self.rxbuf = self.rxbuf[Msg._head_ext.size:]
-        if not self.ensureTCP(pkt.size):
-            raise RuntimeError("Truncated message %s"%pkt)
-        pkt.body, self.rxbuf = self.rxbuf[:pkt.size], self.rxbuf[pkt.size:]
-        _log.debug("tcp --> %s", pkt)
+        rx = self.rx
+        parse = rx.view if self.lazy else rx.next
+        N = len(rx)
+        pkt = parse()
+        while pkt is None:
+            B = self.sess.recv(self.sockprof.chunk)
+            if len(B)==0:
+                if len(rx):
+                    raise RuntimeError("Truncated message, %d bytes left"%len(rx))
+                _log.debug("tcp --> Closed")
+                return None
+            N += len(B)
+            rx.feed(B)
+            pkt = parse()
+        self.counters['rx_msg'] += 1
+        self.counters['rx_bytes'] += N-len(rx)
+        if not self.lazy:
+            _log.debug("tcp --> %s", pkt)
         return pkt
 
+    def countTCP(self, counts, N):
+        '''Receive at least N messages from the TCP client, only counting them
+        in 'counts', a dict of (cmd, p2) -> count.  See MsgParser.tally()
+
+        Returns the number received, less than N if the connection was closed.
+        '''
+        assert self.sess is not None
+        rx = self.rx
+        nbytes = len(rx)
+        n = rx.tally(counts)
+        while n<N:
+            B = self.sess.recv(self.sockprof.chunk)
+            if len(B)==0:
+                break
+            nbytes += len(B)
+            rx.feed(B)
+            n += rx.tally(counts)
+        self.counters['rx_msg'] += n
+        self.counters['rx_bytes'] += nbytes-len(rx)
+        return n
+
     def sendTCP(self, msg):
         assert self.sess is not None
         for pkt in msg:
             _log.debug("tcp <-- %s", pkt)
-        pkt = ''.join([M.pack() for M in msg])
+        pkt = b''.join([M.pack() for M in msg])
+        self.counters['tx_msg'] += len(msg)
+        self.counters['tx_bytes'] += len(pkt)
         self.sess.sendall(pkt)
 
     def closeTCP(self):
         _log.debug("TCP close")
         assert self.sess is not None
-        assert len(self.rxbuf)==0, repr(self.rxbuf)
+        assert len(self.rx)==0, repr(self.rx.buf[self.rx.pos:])
         self.sess.close()
         self.sess = None
 
@@ -236,14 +689,14 @@ class TestMixinServer(TestMixinUDP):
     def setUp(self):
         TestMixinUDP.setUp(self)
         S = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sockprof.applyTCP(S) # inherited by accept()ed sockets
         S.bind(('127.0.0.1',0))
         _addr, self.tport = S.getsockname()
 
         S.settimeout(self.timeout)
         self.server = S
         self.sess = None
-        self.rxbuf = ''
-        self._socks.extend(['server','sess'])
+        self.rx = MsgParser()
 
     def waitClient(self):
         'Wait for a TCP client to connect'
@@ -252,75 +705,149 @@ class TestMixinServer(TestMixinUDP):
 
         S, peer = self.server.accept()
         _log.debug("%s >>>", peer)
+        if self.sockprof.nodelay:
+            S.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.sess = S
 
 class TestMixinClient(TestMixinUDP):
+    barrier = True # see expectNoReplyUDP().  Disabled by $NOBARRIER
+    quietscale = 10.0 # see quietTime()
+    quietmin = 0.02
+    _rtt = {} # DUT command -> worst measured UDP round trip time
     def setUp(self):
         TestMixinUDP.setUp(self)
         self.sess = None
-        self.rxbuf = ''
+        self.rx = MsgParser()
+        if os.environ.get('NOBARRIER'):
+            self.barrier = False
 
     def connectTCP(self):
         peer = ('127.0.0.1', self.testport)
         _log.debug("TCP connect %s", peer)
-        S = socket.create_connection(peer, timeout=self.timeout)
-        S.settimeout(self.timeout)
+        S = self.sockprof.connect(peer, self.timeout)
         self.sess = S
 
-class TestMixinRunServer(object):
-    testport = None
-    testname = None
-    dut = None
-    def setUp(self):
-        if self.testport is None:
-            import random
-            if 'TESTPORT' in os.environ:
-                self.testport = int(os.environ['TESTPORT'])
-            else:
-                self.testport = random.randint(7890, 7899)
+    def quietTime(self):
+        '''Time to wait before concluding that no reply is coming.
 
-        # lousy hack num. 1
-        # check to see that the TCP port where we will run the server
-        # is unused.
-        for i in range(10):
+        'quietscale' times the worst of several UDP search round trips,
+        measured once per DUT command.  At least 'quietmin' and at most 'timeout'.
+        '''
+        dut = getattr(self, 'dut', None)
+        if dut not in self._rtt:
+            S = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             try:
-                ST = socket.create_connection(('127.0.0.1', self.testport), timeout=0.1)
-                ST.close()
-                if i==9:
-                    self.fail("Another server is already running on port %d"%self.testport)
-                else:
-                    time.sleep(0.2)
-            except socket.timeout:
-                break
-            except socket.error as e:
-                self.assertEqual(e.errno, errno.ECONNREFUSED)
+                S.bind(('127.0.0.1', 0))
+                S.settimeout(self.timeout)
+                worst = 0.0
+                for i in range(10):
+                    T0 = time.time()
+                    S.sendto(Msg(cmd=0, dcnt=13).pack()+Msg(cmd=6, body=b'ival', dtype=5, dcnt=13,
+                                                            p1=i, p2=i).pack(),
+                             ('127.0.0.1', self.testport))
+                    S.recvfrom(self.sockprof.dgram)
+                    worst = max(worst, time.time()-T0)
+            finally:
+                S.close()
+            _log.debug("DUT %s RTT %g", dut, worst)
+            self._rtt[dut] = worst
+        return min(self.timeout, max(self.quietmin, self.quietscale*self._rtt[dut]))
+
+    def expectNoReplyUDP(self):
+        '''Fail if the DUT sends any UDP reply to requests already sent.
+
+        Sends a search for "ival", which the DUT must answer, as a barrier.
+        The DUT handles datagrams in order, so anything received before
+        the barrier reply is a reply to an earlier request.
+        Without a barrier, wait quietTime() for a reply.
+        '''
+        if not self.barrier:
+            self.usock.settimeout(self.quietTime())
+            try:
+                self.assertRaises(socket.timeout, self.recvUDP)
+            finally:
+                self.usock.settimeout(self.timeout)
+            return
+
+        bid = 0xba771e5
+        self.sendUDP([
+            Msg(cmd=0, dcnt=13),
+            Msg(cmd=6, body=b'ival', dtype=5, dcnt=13, p1=bid, p2=bid),
+        ])
+        rep = self.recvUDP()
+        for M in rep:
+            if M.cmd==6 and M.p2==bid:
+                return
+            elif M.cmd!=0:
                 break
+        self.fail("Unexpected reply %s"%rep)
+
+    def expectNoReplyTCP(self):
+        '''Fail if the DUT sends any TCP reply to requests already sent.
+
+        Sends an ECHO as a barrier.  See expectNoReplyUDP()
+        '''
+        if not self.barrier:
+            self.sess.settimeout(self.quietTime())
+            try:
+                self.assertRaises(socket.timeout, self.recvTCP)
+            finally:
+                self.sess.settimeout(self.timeout)
+            return
+
+        self.sendTCP([Msg(cmd=23)])
+        rep = self.recvTCP()
+        self.assertCAEqual(rep, cmd=23)
+
+class DUTProcess(object):
+    '''A DUT, started in its own TempDir with the CA server on 'port'.
 
-        env = os.environ.copy()
+    Run through /bin/sh with a pty.  Output is copied to sys.stdout.
+    'env' is a dict of additional environment variables.
+
+    Started with subprocess, which is safe from any thread (unlike
+    os.forkpty(), which Python 3.12 warns about once there are threads).
+    '''
+    def __init__(self, dut, port, pvs=None, acf=None, testname=None, env=None):
+        self.dut, self.port = dut, port
+        self.onstop = None # called with self after exit
+
+        extra, env = env, os.environ.copy()
         env.update({
             'IOCSH_HISTEDIT_DISABLE':'YES',
             'EPICS_CA_ADDR_LIST':'127.0.0.1',
             'EPICS_CA_AUTO_ADDR_LIST':'NO',
-            'EPICS_CA_SERVER_PORT':str(self.testport),
+            'EPICS_CA_SERVER_PORT':str(port),
         })
+        env.update(extra or {})
 
-        if self.testname is not None:
-            _log.info("Setup for test %s", self.testname)
-            env['TEST_NAME'] = self.testname
-
-        if self.dut is None:
-            self.dut = os.environ['DUT']
+        if testname is not None:
+            _log.info("Setup for test %s", testname)
+            env['TEST_NAME'] = testname
 
         self.TDIR = TempDir()
         tdir = self.TDIR.dir
 
-        self._child, self._child_fd = os.forkpty()
-        if self._child==0:
-            os.chdir(tdir)
-            try:
-                os.execve('/bin/sh', ['/bin/sh','-c',self.dut], env)
-            finally:
-                os.abort() # never reached (we hope)
+        if pvs is not None:
+            env['TEST_PVLIST'] = os.path.join(tdir, 'pvlist.txt')
+            pvs.write(env['TEST_PVLIST'])
+
+        if acf is not None:
+            env['TEST_ACF'] = os.path.join(tdir, 'test.acf')
+            acf.write(env['TEST_ACF'])
+
+        self.T0 = time.time()
+        self.child_fd, slave = pty.openpty()
+        try:
+            self.popen = subprocess.Popen(['/bin/sh', '-c', dut], cwd=tdir, env=env,
+                                          stdin=slave, stdout=slave, stderr=slave,
+                                          start_new_session=True)
+        except:
+            os.close(self.child_fd)
+            raise
+        finally:
+            os.close(slave)
+        self.child = self.popen.pid
 
         # lousy hack num. 1.5
         # can't just dup() our stdout to child since
@@ -328,68 +855,307 @@ class TestMixinRunServer(object):
         # by replacing sys.stdout with StringIO
         # So we start a child thread to echo
         # to sys.stdout
-        self.SP = SpamThread(fd=self._child_fd)
+        self.SP = SpamThread(fd=self.child_fd)
         self.SP.start()
 
-        self.addCleanup(self._stop_dut)
+        self.started = None # seconds taken by startup
 
+    def waitReady(self, wait=2.0):
+        '''Block until the DUT accepts TCP connections, for at most 'wait' seconds
+        from when it was started.  Returns False on timeout.
+        '''
         # lousy hack num. 2
         # wait for CA server startup
-        ST = None
-        for i in range(20):
+        while self.started is None:
+            if time.time()-self.T0>wait:
+                return False
             time.sleep(0.1)
             try:
-                ST = socket.create_connection(('127.0.0.1', self.testport), timeout=0.1)
-                break
+                ST = socket.create_connection(('127.0.0.1', self.port), timeout=0.1)
             except socket.timeout:
                 continue
             except socket.error as e:
                 if e.errno!=errno.ECONNREFUSED:
                     raise
                 continue
-            except:
-                raise
-        if ST is None:
-            self.fail("timeout waiting for DUT to start TCP server")
-        ST.close()
+            ST.close()
+            self.started = time.time()-self.T0
+        return True
 
-    def tearDown(self):
-        pass # placeholder
+    def pid(self):
+        '''PID of the DUT process.
+
+        The DUT is run through /bin/sh, and possibly a wrapper script,
+        so follow the chain of only children down from the forked child.
+        '''
+        pid = self.child
+        while True:
+            C = _children(pid)
+            if len(C)!=1:
+                return pid
+            pid = C[0]
+
+    def stop(self, sig=signal.SIGKILL, wait=2.0):
+        '''Signal the DUT and wait for it to exit.  SIGKILL if it hasn't after 'wait' seconds.
+
+        Returns the time (seconds) taken to exit, or None if killed or already stopped.
+        '''
+        if self.child is None:
+            return None # already stopped
+        T0 = time.time()
+        pid = self.pid()
+        os.kill(pid, sig)
+        ret = None
+        while True:
+            if self.popen.poll() is not None:
+                ret = time.time()-T0
+                break
+            elif time.time()-T0>wait:
+                _log.warning("Killed '%s'", self.dut)
+                for P in set([pid, self.child]):
+                    try:
+                        os.kill(P, signal.SIGKILL)
+                    except OSError as e:
+                        if e.errno!=errno.ESRCH:
+                            raise
+                self.popen.wait()
+                break
+            time.sleep(0.01)
+        self.child = None
 
-    def _stop_dut(self):
-        os.kill(self._child, signal.SIGKILL)
-        os.waitpid(self._child, 0)
         self.SP.join()
         try:
-            os.close(self._child_fd)
+            os.close(self.child_fd)
         except:
             pass
-        #os.close(self._child_fd)
         self.TDIR.close()
-        return
+        if self.onstop is not None:
+            self.onstop(self)
+        return ret
 
-        os.kill(self._child, signal.SIGTERM)
-        ret = None
+class DUTPool(object):
+    '''DUTs started ahead of time.  Enabled by setting $DUTPOOL to the pool size.
+
+    DUTs are pooled by configuration (DUT command, PVSet, ACF, and test name).
+    PVSet and ACF are compared by value, so tests which build equal ones
+    share spares.  The first test of a configuration waits for a DUT to
+    start.  Then 'size' spares are started in the background, each with a
+    leased port, and given the test's 'dutwait' to start.  Each test is
+    given a fresh DUT, which is stopped (in the background) afterwards, and
+    replaced.  Spares are kept for the 'nkeys' most recently used
+    configurations, so test classes may alternate.  Spares of the least
+    recently used are stopped when another configuration is used.
+    '''
+    _inst = None
+    nkeys = 3
+
+    @classmethod
+    def get(klass):
+        'Returns the pool, or None if not enabled'
+        size = int(os.environ.get('DUTPOOL') or '0')
+        if size<=0:
+            return None
+        if klass._inst is None:
+            import atexit
+            klass._inst = klass(size)
+            atexit.register(klass._inst.close)
+        return klass._inst
+
+    def __init__(self, size, wait=2.0):
+        self.size, self.wait = size, wait
+        self.lock = threading.Lock()
+        self.spares = {} # key -> [DUTProcess]
+        self.recent = [] # keys, least recently used first
+        self.pending = {} # key -> # being started
+        self.ports = set() # leased
+        self.workers = []
+
+    def _lease(self):
+        'Find a port which is free for both TCP and UDP'
+        while True:
+            T = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            U = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                T.bind(('127.0.0.1', 0))
+                port = T.getsockname()[1]
+                U.bind(('127.0.0.1', port))
+            except socket.error:
+                continue
+            finally:
+                T.close()
+                U.close()
+            with self.lock:
+                if port not in self.ports:
+                    self.ports.add(port)
+                    return port
+
+    def _release(self, P):
+        with self.lock:
+            self.ports.discard(P.port)
+
+    @staticmethod
+    def _key(dut, pvs, acf, testname):
+        'Configuration compared by value'
+        def value(O):
+            return None if O is None else (type(O).__name__, repr(sorted(vars(O).items())))
+        return (dut, value(pvs), value(acf), testname)
+
+    def _start(self, cfg):
+        dut, pvs, acf, testname, _wait = cfg
+        P = DUTProcess(dut, self._lease(), pvs=pvs, acf=acf, testname=testname)
+        P.onstop = self._release
+        return P
+
+    def _background(self, fn, *args):
+        T = threading.Thread(target=fn, args=args)
+        T.daemon = True
+        with self.lock:
+            self.workers = [W for W in self.workers if W.is_alive()]+[T]
+        T.start()
+
+    def _spare(self, key, cfg):
+        'Start a spare DUT for key.  Run in a worker thread'
+        try:
+            P = self._start(cfg)
+        except:
+            with self.lock:
+                self.pending[key] -= 1
+            raise
+        ready = P.waitReady(cfg[4])
+        with self.lock:
+            self.pending[key] -= 1
+            keep = ready and key in self.recent
+            if keep:
+                self.spares.setdefault(key, []).append(P)
+        if not ready:
+            _log.warning("Pooled DUT '%s' did not start", key[0])
+        if not keep:
+            P.stop()
+
+    def _fill(self, key, cfg):
+        with self.lock:
+            N = self.size-len(self.spares.get(key, []))-self.pending.get(key, 0)
+            self.pending[key] = self.pending.get(key, 0)+max(0, N)
+            # retire spares of the least recently used configurations
+            if key in self.recent:
+                self.recent.remove(key)
+            self.recent.append(key)
+            old = []
+            while len(self.recent)>self.nkeys:
+                old.extend(self.spares.pop(self.recent.pop(0), []))
+        for i in range(N):
+            self._background(self._spare, key, cfg)
+        for P in old:
+            self._background(P.stop)
+
+    def acquire(self, dut, pvs=None, acf=None, testname=None, wait=None):
+        '''Returns a started DUTProcess for this configuration.
+        Spares are given 'wait' seconds to start (default self.wait).
+        The caller must call retire() when done.
+        '''
+        cfg = (dut, pvs, acf, testname, self.wait if wait is None else wait)
+        key = self._key(*cfg[:4])
+        with self.lock:
+            Q = self.spares.get(key)
+            P = Q.pop(0) if Q else None
+        if P is None:
+            P = self._start(cfg)
+        self._fill(key, cfg)
+        return P
+
+    def retire(self, P):
+        'Stop a DUT in the background'
+        self._background(P.stop)
+
+    def close(self):
+        with self.lock:
+            spares, self.spares = self.spares, {}
+        for Q in spares.values():
+            for P in Q:
+                P.stop()
+        for W in list(self.workers):
+            W.join()
+        # spares finishing startup after the first pass
+        for Q in self.spares.values():
+            for P in Q:
+                P.stop()
+
+class TestMixinRunServer(object):
+    testport = None
+    testname = None
+    dut = None
+    pvs = None # optional PVSet
+    acf = None # optional ACF
+    dutwait = 2.0 # seconds to wait for DUT startup
+    dutstart = None # seconds taken by DUT startup, or to acquire from the pool
+    proc = None # DUTProcess
+    def setUp(self):
+        if self.dut is None:
+            self.dut = os.environ['DUT']
+
+        pool = DUTPool.get() if self.testport is None and 'TESTPORT' not in os.environ else None
+        T0 = time.time()
+        if pool is not None:
+            self.proc = pool.acquire(self.dut, pvs=self.pvs, acf=self.acf, testname=self.testname,
+                                     wait=self.dutwait)
+            self.testport = self.proc.port
+            self.addCleanup(self._release_dut, pool)
+        else:
+            self._check_port()
+            self.proc = DUTProcess(self.dut, self.testport, pvs=self.pvs, acf=self.acf,
+                                   testname=self.testname)
+            self.addCleanup(self._stop_dut)
+
+        if not self.proc.waitReady(self.dutwait):
+            self.fail("timeout waiting for DUT to start TCP server")
+        self.dutstart = time.time()-T0
+
+    def _check_port(self):
+        if self.testport is None:
+            import random
+            if 'TESTPORT' in os.environ:
+                self.testport = int(os.environ['TESTPORT'])
+            else:
+                self.testport = random.randint(7890, 7899)
+
+        # lousy hack num. 1
+        # check to see that the TCP port where we will run the server
+        # is unused.
         for i in range(10):
             try:
-                pid, ret, _rusg = os.wait3(os.WNOHANG)
-                #assert self._child==pid, (self._child, pid)
+                ST = socket.create_connection(('127.0.0.1', self.testport), timeout=0.1)
+                ST.close()
+                if i==9:
+                    self.fail("Another server is already running on port %d"%self.testport)
+                else:
+                    time.sleep(0.2)
+            except socket.timeout:
                 break
-            except OSError as e:
-                if e.errno!=errno.ECHILD:
-                    raise
-            if self.SP.poll() is not None:
+            except socket.error as e:
+                self.assertEqual(e.errno, errno.ECONNREFUSED)
                 break
-            time.sleep(0.1)
-        if ret is None:
-            _log.warn("Killed '%s'", self.dut)
-            os.kill(self._child, signal.SIGKILL)
-            os.wait()
 
-        os.close(self._child_fd)
+    def tearDown(self):
+        pass # placeholder
 
-        self.TDIR.close()
-        #self.assertEqual(self.SP.returncode, 0)
+    def dutPID(self):
+        'PID of the DUT process.  See DUTProcess.pid()'
+        return self.proc.pid()
+
+    def dutStats(self):
+        'Resource usage of the DUT process.  See procStats()'
+        return procStats(self.dutPID())
+
+    def _stop_dut(self, sig=signal.SIGKILL, wait=2.0):
+        '''Signal the DUT and wait for it to exit.  See DUTProcess.stop()
+
+        Run during cleanup, but may be called earlier by a test.
+        '''
+        return self.proc.stop(sig, wait)
+
+    def _release_dut(self, pool):
+        if self.proc.child is not None:
+            pool.retire(self.proc)
 
 class TestClient(TestMixinClient, TestMixinRunServer):
     def setUp(self):
@@ -1,11 +1,18 @@
 #define NOMINMAX 1 // avoid min() and max() macros from windows.h
 
 #include <iostream>
+#include <fstream>
+#include <sstream>
 #include <vector>
+#include <map>
 #include <iterator>
 #include <memory>
 #include <limits>
 #include <string>
+#include <stdexcept>
+#include <cstdlib>
+#include <cstring>
+#include <cmath>
 
 #include "fdManager.h"
 #include "casdef.h"
@@ -16,11 +23,68 @@ namespace {
 template<typename T> struct type2ait {};
 template<> struct type2ait<epicsInt32> { enum etype {value=aitEnumInt32}; };
 template<> struct type2ait<epicsInt16> { enum etype {value=aitEnumInt16}; };
+template<> struct type2ait<epicsFloat64> { enum etype {value=aitEnumFloat64}; };
 
 volatile unsigned done;
 
+// Record like event filtering of the first element.
+// Set from the MDEL, ADEL, and HIHI fields.  See PVSet in catvs/util.py
+struct filter
+{
+    double mdel, adel; // deadbands.  <0 posts every update
+    double hihi;       // MAJOR alarm at or above
+    double mlst, alst; // last values posted
+
+    filter()
+        :mdel(-1.0)
+        ,adel(-1.0)
+        ,hihi(std::numeric_limits<double>::infinity())
+        ,mlst(0.0)
+        ,alst(0.0)
+    {}
+
+    bool setField(const std::string& name, double val)
+    {
+        if(name=="MDEL")
+            mdel = val;
+        else if(name=="ADEL")
+            adel = val;
+        else if(name=="HIHI")
+            hihi = val;
+        else
+            return false;
+        return true;
+    }
+
+    casEventMask check(const caServer& cas, double val, epicsUInt16& sevr, epicsUInt16& stat)
+    {
+        casEventMask select;
+
+        epicsUInt16 psevr = sevr;
+        if(val>=hihi) {
+            sevr = MAJOR_ALARM;
+            stat = HIHI_ALARM;
+        } else {
+            sevr = stat = NO_ALARM;
+        }
+        if(sevr!=psevr)
+            select |= cas.alarmEventMask();
+
+        // negated compare so that NaN is always posted
+        if(!(std::fabs(val-mlst)<=mdel)) {
+            select |= cas.valueEventMask();
+            mlst = val;
+        }
+        if(!(std::fabs(val-alst)<=adel)) {
+            select |= cas.logEventMask();
+            alst = val;
+        }
+        return select;
+    }
+};
+
 template<typename T>
-struct mailbox : public casPV
+struct mailbox : public casPV, public filter
 {
     const std::string name;
     std::vector<T> value; // don't resize
@@ -115,7 +179,10 @@ struct mailbox : public casPV
             return V.put(std::numeric_limits<T>::max());
 
         case gddAppType_graphicLow:
-            return V.put(std::numeric_limits<T>::min());
+            if(std::numeric_limits<T>::is_integer)
+                return V.put(std::numeric_limits<T>::min());
+            else
+                return V.put(-std::numeric_limits<T>::max());
 
         default:
             std::cout<<"read() w/ gdd nested unknown "<<V.applicationType()<<"\n";
@@ -167,13 +234,14 @@ struct mailbox : public casPV
         // refresh timestamp
         stamp = epicsTime::getCurrent();
 
-        gdd_ptr ptr(allocGDD(value.size()));
-        readValue(*ptr.G);
-
         caServer * cas = getCAS();
         if ( cas != NULL ) {
-            casEventMask select ( cas->valueEventMask() | cas->logEventMask() );
-            this->postEvent ( select, *ptr.G );
+            casEventMask select ( check(*cas, value[0], sevr, stat) );
+            if ( select.eventsSelected() ) {
+                gdd_ptr ptr(allocGDD(value.size()));
+                readValue(*ptr.G);
+                this->postEvent ( select, *ptr.G );
+            }
         }
         return 0;
     }
@@ -201,6 +269,10 @@ struct testServer : public caServer
     mailbox<epicsInt16> aval;
     imdone done;
 
+    // generated PVs.  See PVSet in catvs/util.py
+    typedef std::map<std::string, casPV*> pvs_t;
+    pvs_t pvs;
+
     testServer()
         :caServer()
         ,ival("ival", 1)
@@ -208,13 +280,77 @@ struct testServer : public caServer
         ,done("done")
     {
         ival.value[0] = 42;
+
+        const char *pvlist = getenv("TEST_PVLIST");
+        if(pvlist && pvlist[0])
+            loadPVList(pvlist);
+    }
+
+    virtual ~testServer()
+    {
+        for(pvs_t::iterator it=pvs.begin(), end=pvs.end(); it!=end; ++it)
+            delete it->second;
+    }
+
+    // one PV per line: <name> <type> <count> [<field>=<value> ...]
+    void loadPVList(const char *fname)
+    {
+        std::ifstream strm(fname);
+        if(!strm.is_open())
+            throw std::runtime_error(std::string("Can't open PV list ")+fname);
+
+        std::string line;
+        while(std::getline(strm, line)) {
+            std::istringstream lstrm(line);
+            std::string name, type;
+            size_t count = 0;
+            lstrm>>name>>type>>count;
+            if(name.empty())
+                continue;
+            else if(!lstrm || count==0)
+                throw std::runtime_error("Invalid line in PV list: "+line);
+
+            casPV *pv;
+            filter *filt;
+            if(type=="LONG") {
+                mailbox<epicsInt32> *M = new mailbox<epicsInt32>(name.c_str(), count);
+                pv = M;
+                filt = M;
+            } else if(type=="SHORT") {
+                mailbox<epicsInt16> *M = new mailbox<epicsInt16>(name.c_str(), count);
+                pv = M;
+                filt = M;
+            } else if(type=="DOUBLE") {
+                mailbox<epicsFloat64> *M = new mailbox<epicsFloat64>(name.c_str(), count);
+                pv = M;
+                filt = M;
+            } else
+                throw std::runtime_error("Unknown type in PV list: "+line);
+
+            // <field>=<value>.  Fields other than those understood by filter are ignored
+            std::string field;
+            while(lstrm>>field) {
+                size_t eq = field.find('=');
+                if(eq==std::string::npos) {
+                    delete pv;
+                    throw std::runtime_error("Invalid field in PV list: "+line);
+                }
+                filt->setField(field.substr(0, eq), atof(field.substr(eq+1).c_str()));
+            }
+
+            casPV*& slot = pvs[name];
+            delete slot;
+            slot = pv;
+        }
+        std::cout<<"Loaded "<<pvs.size()<<" PVs from "<<fname<<"\n";
     }
 
     virtual pvExistReturn pvExistTest(const casCtx &ctx, const char *name)
     {
         if(   strcmp(name, "ival")==0
            || strcmp(name, "aval")==0
-           || strcmp(name, "done")==0) {
+           || strcmp(name, "done")==0
+           || pvs.find(name)!=pvs.end()) {
             return pverExistsHere;
         }
         return pverDoesNotExistHere;
@@ -229,6 +365,9 @@ struct testServer : public caServer
         } else if(strcmp(name, "done")==0) {
             return done;
         }
+        pvs_t::iterator it = pvs.find(name);
+        if(it!=pvs.end())
+            return *it->second;
         return S_casApp_pvNotFound;
     }
 };
@@ -20,4 +20,32 @@ record(waveform, "aval") {
 }
 EOF
 
+# Additional generated PVs.  See PVSet in catvs/util.py
+if [ "$TEST_PVLIST" ]
+then
+    awk '
+NF>=3 {
+    if($3==1 && $2=="LONG")
+        rtyp="longout"
+    else if($3==1 && $2=="DOUBLE")
+        rtyp="ao"
+    else
+        rtyp="waveform"
+    printf("record(%s, \"%s\") {\n", rtyp, $1)
+    if(rtyp=="waveform")
+        printf("    field(FTVL, \"%s\")\n    field(NELM, \"%d\")\n", $2, $3)
+    for(i=4; i<=NF; i++) {
+        eq = index($i, "=")
+        printf("    field(%s, \"%s\")\n", substr($i, 1, eq-1), substr($i, eq+1))
+    }
+    printf("}\n")
+}' "$TEST_PVLIST" >> test.db
+fi
+
+# Access security configuration.  See ACF in catvs/util.py
+if [ "$TEST_ACF" ]
+then
+    exec "$SOFTIOC" -a "$TEST_ACF" -d test.db
+fi
+
 exec "$SOFTIOC" -d test.db